@@ -1,10 +1,22 @@
-from typing import final, override
+from functools import partial
+from typing import Any, final, override
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 from atom.atom.activations import ReLU2, SwiGLU
-from atom.training.config_options import FFNActivation, NormType, ValueResidualType, AttentionType, EquivariantLiftingType
+from atom.training.config_options import FFNActivation, NormType, ValueResidualType, AttentionType, AttentionBackend, EquivariantLiftingType, CheckpointPolicy
 from tensordict import TensorDict
-from atom.atom.attentions import QuadraticHeterogenousCrossAttention, QuadraticSelfAttention
+from atom.atom.attentions import (
+    FactorizedSpatioTemporalAttention,
+    LinearKernelAttention,
+    QuadraticHeterogenousCrossAttention,
+    QuadraticSelfAttention,
+    SparseNeighbourAttention,
+    SphericalHarmonicsAttentionBias,
+    is_time_invariant,
+    token_neighbour_pairs,
+)
 from atom.atom.mlps import MLP
 from e3nn import o3
 
@@ -24,11 +36,17 @@ class ATOMBlock(nn.Module):
         use_spherical_harmonics: bool,
         value_residual_type: ValueResidualType,
         learnable_attention_denom: bool,
+        attention_backend: AttentionBackend = AttentionBackend.MATH,
+        fuse_hetero_streams: bool = False,
+        query_chunk_size: int | None = None,
+        chunk_memory_budget_mb: float | None = None,
+        checkpoint_attention: bool = False,
     ) -> None:
         super().__init__()
 
         self.num_timesteps = num_timesteps
         self.attention_type = attention_type
+        self.checkpoint_attention = checkpoint_attention
 
         self.pre_norm: nn.Module
         match norm:
@@ -86,6 +104,9 @@ class ATOMBlock(nn.Module):
                     use_rope=use_rope,
                     use_spherical_harmonics=use_spherical_harmonics,
                     learnable_attention_denom=learnable_attention_denom,
+                    use_sdpa=attention_backend == AttentionBackend.SDPA,
+                    query_chunk_size=query_chunk_size,
+                    chunk_memory_budget_mb=chunk_memory_budget_mb,
                 )
             case AttentionType.GHCA:
                 self.attention = QuadraticHeterogenousCrossAttention(
@@ -97,6 +118,39 @@ class ATOMBlock(nn.Module):
                     rope_base=rope_base,
                     use_spherical_harmonics=use_spherical_harmonics,
                     learnable_attention_denom=learnable_attention_denom,
+                    use_sdpa=attention_backend == AttentionBackend.SDPA,
+                    fuse_hetero_streams=fuse_hetero_streams,
+                    query_chunk_size=query_chunk_size,
+                    chunk_memory_budget_mb=chunk_memory_budget_mb,
+                )
+            case AttentionType.FACTORIZED:
+                self.attention = FactorizedSpatioTemporalAttention(
+                    lifting_dim=lifting_dim,
+                    num_heads=num_heads,
+                    num_timesteps=self.num_timesteps,
+                    use_rope=use_rope,
+                    rope_base=rope_base,
+                    use_spherical_harmonics=use_spherical_harmonics,
+                    learnable_attention_denom=learnable_attention_denom,
+                    use_sdpa=attention_backend == AttentionBackend.SDPA,
+                )
+            case AttentionType.SPARSE:
+                self.attention = SparseNeighbourAttention(
+                    lifting_dim=lifting_dim,
+                    num_heads=num_heads,
+                    num_timesteps=self.num_timesteps,
+                    use_rope=use_rope,
+                    rope_base=rope_base,
+                    use_spherical_harmonics=use_spherical_harmonics,
+                    learnable_attention_denom=learnable_attention_denom,
+                )
+            case AttentionType.LINEAR:
+                self.attention = LinearKernelAttention(
+                    lifting_dim=lifting_dim,
+                    num_heads=num_heads,
+                    num_timesteps=self.num_timesteps,
+                    use_rope=use_rope,
+                    rope_base=rope_base,
                 )
             case _:
                 raise ValueError(f"Invalid heterogenous attention type: {attention_type}, select from one of {AttentionType.__members__.keys()}")  # type: ignore
@@ -123,6 +177,10 @@ class ATOMBlock(nn.Module):
         q_data: torch.Tensor,
         mask: torch.Tensor | None,
         initial_v: torch.Tensor | None = None,
+        segment_ids: torch.Tensor | None = None,
+        neighbour_pairs: tuple[torch.Tensor, torch.Tensor] | None = None,
+        node_bias: torch.Tensor | None = None,
+        static_kv: dict[int, tuple[torch.Tensor, torch.Tensor]] | None = None,
     ) -> tuple[torch.Tensor, torch.Tensor | None]:  # None when value residual not yet set
         """Forward pass for the ATOM block.
 
@@ -140,20 +198,30 @@ class ATOMBlock(nn.Module):
             Padding mask.
         initial_v : torch.Tensor | None, optional
             Initial value for residual connection, by default None.
+        segment_ids : torch.Tensor | None, optional
+            Sample index of every node of a packed batch, by default None.
+        neighbour_pairs : tuple[torch.Tensor, torch.Tensor] | None, optional
+            Query and key token indices, required by sparse attention, by default None.
+        node_bias : torch.Tensor | None, optional
+            Spherical harmonics bias between the nodes of shape `[B, heads, N, N]`,
+            shared by every layer, by default None.
+        static_kv : dict[int, tuple[torch.Tensor, torch.Tensor]] | None, optional
+            GHCA only: this block's key and value projections of the pre-normed
+            v_0 (1) and concatenated features (2), computed by `ATOM`, by default None.
 
         Returns
         -------
         tuple[torch.Tensor, torch.Tensor | None]
             The updated positions and the initial value for the next residual connection.
         """
-        concatenated_features = self.pre_norm(concatenated_features)
-        x_0 = self.pre_norm(x_0)
-        v_0 = self.pre_norm(v_0)
-
-        if self.attention_type == AttentionType.SELF:
-            attended_nodes: torch.Tensor = x_0 + self.attention(tensor=x_0, mask=mask)
-        else:
-            attended_nodes: torch.Tensor = x_0 + self.attention(x_0, v_0, concatenated_features, q_data=q_data, mask=mask)
+        concatenated_features = self._pre_norm(concatenated_features)
+        x_0 = self._pre_norm(x_0)
+        if static_kv is None or 1 not in static_kv:  # Otherwise only its precomputed keys and values are used
+            v_0 = self._pre_norm(v_0)
+
+        # Attention-only checkpointing: its scores are recomputed in the backward pass instead of stored
+        attend = partial(checkpoint, self._attend, use_reentrant=False) if self.checkpoint_attention and torch.is_grad_enabled() else self._attend
+        attended_nodes: torch.Tensor = x_0 + attend(x_0, v_0, concatenated_features, q_data, mask, segment_ids, neighbour_pairs, node_bias, static_kv)
         x_0 = attended_nodes + self.ffn(attended_nodes, mask)
 
         if self.value_residual_type == ValueResidualType.LEARNABLE:
@@ -166,6 +234,34 @@ class ATOMBlock(nn.Module):
 
         return x_0, initial_v
 
+    def _attend(
+        self,
+        x_0: torch.Tensor,
+        v_0: torch.Tensor,
+        concatenated_features: torch.Tensor,
+        q_data: torch.Tensor,
+        mask: torch.Tensor | None,
+        segment_ids: torch.Tensor | None,
+        neighbour_pairs: tuple[torch.Tensor, torch.Tensor] | None,
+        node_bias: torch.Tensor | None,
+        static_kv: dict[int, tuple[torch.Tensor, torch.Tensor]] | None,
+    ) -> torch.Tensor:
+        """Attention update of the pre-normed positions, with the arguments of `forward`."""
+        if self.attention_type == AttentionType.LINEAR:
+            return self.attention(tensor=x_0, mask=mask, segment_ids=segment_ids)
+        elif self.attention_type in (AttentionType.SELF, AttentionType.FACTORIZED):
+            return self.attention(tensor=x_0, mask=mask, segment_ids=segment_ids, node_bias=node_bias)
+        elif self.attention_type == AttentionType.SPARSE:
+            assert neighbour_pairs is not None, "Sparse attention needs the neighbour pairs of the batch"
+            return self.attention(tensor=x_0, neighbour_pairs=neighbour_pairs, node_bias=node_bias)
+        return self.attention(x_0, v_0, concatenated_features, q_data=q_data, mask=mask, segment_ids=segment_ids, node_bias=node_bias, static_kv=static_kv)
+
+    def _pre_norm(self, features: torch.Tensor) -> torch.Tensor:
+        """Pre-norm of `[B, T, N, d]` features, once per node if they are expanded along T."""
+        if is_time_invariant(features):
+            return self.pre_norm(features[:, :1]).expand_as(features)
+        return self.pre_norm(features)
+
 
 @final
 class ATOM(nn.Module):
@@ -187,6 +283,17 @@ class ATOM(nn.Module):
         rrwp_length: int,
         value_residual_type: ValueResidualType,
         learnable_attention_denom: bool,
+        attention_backend: AttentionBackend = AttentionBackend.MATH,
+        fuse_hetero_streams: bool = False,
+        sparse_attention_hops: int = 2,
+        sparse_attention_temporal_self: bool = True,
+        attention_query_chunk_size: int | None = None,
+        attention_chunk_memory_mb: float | None = None,
+        share_spherical_harmonics_bias: bool = False,
+        time_invariant_inputs: bool = False,
+        precompute_static_kv: bool = False,
+        checkpoint_policy: CheckpointPolicy = CheckpointPolicy.NONE,
+        checkpoint_every: int = 2,
     ) -> None:
         """
         An ATOM model that always does T>1 predictions.
@@ -221,13 +328,55 @@ class ATOM(nn.Module):
         use_spherical_harmonics : bool
             Whether to use spherical harmonics.
         use_equivariant_lifting : EquivariantLiftingType
-            Type of equivariant lifting to use.
+            Type of equivariant lifting to use. CHANNELWISE lifts the
+            concatenated features like EQUIVARIANT, with a tensor product
+            whose paths pair channels instead of connecting all of them.
         rrwp_length : int
             Length of relative random walk positional encoding.
         value_residual_type : ValueResidualType
             Type of value residual connection.
         learnable_attention_denom : bool
             Whether the attention denominator is learnable.
+        attention_backend : AttentionBackend, optional
+            Whether attention materialises its scores (math) or runs through
+            `F.scaled_dot_product_attention` (sdpa), by default math.
+        fuse_hetero_streams : bool, optional
+            Whether GHCA attends to its three heterogeneous features in one
+            batched pass instead of a loop, by default False.
+        sparse_attention_hops : int, optional
+            Sparse attention only: attend to graph neighbours of up to this
+            many hops (1 or 2), by default 2.
+        sparse_attention_temporal_self : bool, optional
+            Sparse attention only: whether every token also attends to its own
+            node at every other timestep, by default True.
+        attention_query_chunk_size : int | None, optional
+            Self and GHCA attention with the math backend only: attend blocks
+            of this many queries at a time to bound peak memory, by default None.
+        attention_chunk_memory_mb : float | None, optional
+            Self and GHCA attention with the math backend only: pick the query
+            block size so that a block's intermediates fit this many MiB, by
+            default None. Ignored if `attention_query_chunk_size` is given.
+        share_spherical_harmonics_bias : bool, optional
+            With spherical harmonics: compute a single bias between the nodes
+            from the initial coordinates, once per forward, and add it to
+            every pair of timesteps in every layer, instead of a bias per
+            layer over all T*N tokens, by default False.
+        time_invariant_inputs : bool, optional
+            Declare that x_0, v_0 and the concatenated features repeat over
+            time, so they are lifted once per node and expanded along T,
+            by default False. Inputs that are already expanded along T (lazy
+            time replication) are detected without it.
+        precompute_static_kv : bool, optional
+            GHCA only: compute the key and value projections of v_0 and the
+            concatenated features, which are the same in every layer, for all
+            layers in one matmul before the blocks, by default False.
+        checkpoint_policy : CheckpointPolicy, optional
+            Activation checkpointing of the transformer blocks during training:
+            none, every block, every `checkpoint_every`-th block, or only the
+            attention of every block, by default CheckpointPolicy.NONE.
+        checkpoint_every : int, optional
+            Checkpoint blocks 0, k, 2k, ... with CheckpointPolicy.EVERY_KTH_LAYER,
+            by default 2.
         """
         super().__init__()
 
@@ -238,6 +387,15 @@ class ATOM(nn.Module):
         self.rrwp_length = rrwp_length
         self.output_heads = output_heads
         self.delta_update = delta_update
+        self.attention_type = attention_type
+        self.sparse_attention_hops = sparse_attention_hops
+        self.sparse_attention_temporal_self = sparse_attention_temporal_self
+        self.share_spherical_harmonics_bias = use_spherical_harmonics and share_spherical_harmonics_bias
+        self.time_invariant_inputs = time_invariant_inputs
+        self.precompute_static_kv = precompute_static_kv
+        self.checkpointed_layers = checkpointed_layers(checkpoint_policy, num_layers, checkpoint_every)
+        if precompute_static_kv:
+            assert attention_type == AttentionType.GHCA and not fuse_hetero_streams, "precompute_static_kv needs unfused GHCA"
 
         concat_irreps_1, concat_irreps_2 = self._get_concat_feature_irreps()
         lifting_dim_irreps = get_lifting_dim_irreps(lifting_dim)
@@ -257,6 +415,15 @@ class ATOM(nn.Module):
                         "concatenated_features": o3.FullyConnectedTensorProduct(lifting_dim_irreps, lifting_dim_irreps, lifting_dim_irreps),
                     }
                 )
+            case EquivariantLiftingType.CHANNELWISE:
+                self.lifting_layers = nn.ModuleDict(
+                    {
+                        "x_0": o3.Linear("1x1o + 1x0e", lifting_dim_irreps),  # In: (x,y,z, ||x||)
+                        "v_0": o3.Linear("1x1o + 1x0e", lifting_dim_irreps),  # In: (vx,vy,vz, ||v||)
+                        "vz_0": o3.Linear(vz_irreps, lifting_dim_irreps),  # In: (vx, vy, vz, ||v||, Z). If rrwp_length > 0, then (vx, vy, vz, ||v||, Z, rrwp_length)
+                        "concatenated_features": channelwise_tensor_product(lifting_dim_irreps),
+                    }
+                )
             case EquivariantLiftingType.NO_TP:
                 self.lifting_layers = nn.ModuleDict(
                     {
@@ -287,14 +454,22 @@ class ATOM(nn.Module):
                     num_timesteps,
                     use_rope,
                     rope_base,
-                    use_spherical_harmonics,
+                    use_spherical_harmonics and not self.share_spherical_harmonics_bias,
                     value_residual_type,
                     learnable_attention_denom,
+                    attention_backend,
+                    fuse_hetero_streams,
+                    attention_query_chunk_size,
+                    attention_chunk_memory_mb,
+                    checkpoint_policy == CheckpointPolicy.ATTENTION_ONLY,
                 )
                 for _ in range(num_layers)
             ]
         )
 
+        if self.share_spherical_harmonics_bias:
+            self.spherical_harmonics = SphericalHarmonicsAttentionBias(num_timesteps=1, max_degree=1, num_heads=num_heads, hidden_dim=16)
+
         # Final projection to (x, y, z)
         if self.output_heads > 1:
             self.weight_pred_gate_net = nn.Sequential(
@@ -309,9 +484,8 @@ class ATOM(nn.Module):
                 nn.Softmax(dim=-1),
             )
 
-            self.projection_layers = nn.Sequential(
-                *[o3.Linear(lifting_dim_irreps, "1x1o") for _ in range(self.output_heads)],
-            )
+            # All heads in one projection: output channel i of "{output_heads}x1o" is head i
+            self.projection_heads = o3.Linear(lifting_dim_irreps, f"{self.output_heads}x1o")
         else:
             self.projection_layer = o3.Linear(lifting_dim_irreps, "1x1o")
 
@@ -326,7 +500,12 @@ class ATOM(nn.Module):
         batch : TensorDict
             A TensorDict containing the input data.
             Expected keys: "x_0", "v_0", "concatenated_features".
-            Optional key: "padded_nodes_mask".
+            Optional keys: "padded_nodes_mask", or "cu_seqlens" for packed batches.
+            Sparse attention also needs the edge list: "source_node_indices",
+            "target_node_indices" and "edge_attr" (whose third column is the hop count).
+
+            A packed batch holds the nodes of several samples concatenated along the node axis,
+            with shape [1, T, sum(N_i), d] and node offsets "cu_seqlens" of shape [1, num_samples + 1].
 
         Returns
         -------
@@ -337,40 +516,92 @@ class ATOM(nn.Module):
         # Batch: [Batch, Timesteps, Nodes, d]
         # Mask the inputs before applying the equivariant lifting layers
         mask: torch.Tensor | None = batch.get("padded_nodes_mask", None)
+        cu_seqlens: torch.Tensor | None = batch.get("cu_seqlens", None)
+        segment_ids: torch.Tensor | None = segment_ids_from_cu_seqlens(cu_seqlens) if cu_seqlens is not None else None
+
+        neighbour_pairs: tuple[torch.Tensor, torch.Tensor] | None = None
+        if self.attention_type == AttentionType.SPARSE:
+            # Shared by every layer
+            neighbour_pairs = token_neighbour_pairs(
+                batch["source_node_indices"],
+                batch["target_node_indices"],
+                batch["edge_attr"][..., 2],
+                num_timesteps=batch["x_0"].shape[1],
+                num_nodes=batch["x_0"].shape[2],
+                hops=self.sparse_attention_hops,
+                temporal_self=self.sparse_attention_temporal_self,
+            )
+
+        x_0: torch.Tensor = batch["x_0"]
+        v_0: torch.Tensor = batch["v_0"]
+        concat_features: torch.Tensor = batch["concatenated_features"]
+        num_timesteps = x_0.shape[1]
+
+        # Initial conditions that repeat over time are lifted once per node, then expanded along T.
+        # The blocks keep projecting expanded features once per node, until attention makes them time dependent.
+        time_invariant = self.time_invariant_inputs or is_time_invariant(x_0)
+        if time_invariant:
+            x_0, v_0, concat_features = x_0[:, :1], v_0[:, :1], concat_features[:, :1]
 
         if mask is not None:
-            x_0: torch.Tensor = batch["x_0"] * mask
-            v_0: torch.Tensor = batch["v_0"] * mask
-            concat_features: torch.Tensor = batch["concatenated_features"] * mask
-        else:
-            x_0: torch.Tensor = batch["x_0"]
-            v_0: torch.Tensor = batch["v_0"]
-            concat_features: torch.Tensor = batch["concatenated_features"]
+            node_mask = mask[:, :1] if time_invariant else mask
+            x_0 = x_0 * node_mask
+            v_0 = v_0 * node_mask
+            concat_features = concat_features * node_mask
 
         # Lift the inputs
         lifted_x_0: torch.Tensor = self.lifting_layers["x_0"](x_0)
         lifted_v_0: torch.Tensor = self.lifting_layers["v_0"](v_0)
-        if self.use_equivariant_lifting == EquivariantLiftingType.EQUIVARIANT:
+        if self.use_equivariant_lifting in (EquivariantLiftingType.EQUIVARIANT, EquivariantLiftingType.CHANNELWISE):
             lifted_vz_0: torch.Tensor = self.lifting_layers["vz_0"](concat_features[..., 4:])
             lifted_concat_features: torch.Tensor = self.lifting_layers["concatenated_features"](lifted_x_0, lifted_vz_0)
         else:
             lifted_concat_features: torch.Tensor = self.lifting_layers["concatenated_features"](concat_features)
 
+        if time_invariant:
+            lifted_x_0 = lifted_x_0.expand(-1, num_timesteps, -1, -1)
+            lifted_v_0 = lifted_v_0.expand(-1, num_timesteps, -1, -1)
+            lifted_concat_features = lifted_concat_features.expand(-1, num_timesteps, -1, -1)
+
+        node_bias: torch.Tensor | None = None
+        if self.share_spherical_harmonics_bias:
+            # The initial coordinates are repeated over time, so the first timestep gives the bias of every (t, t') pair
+            node_bias = self.spherical_harmonics(x_0[:, :1, :, :3])  # [B, heads, N, N]
+
+        # GHCA: the keys and values of every layer for the streams that do not change across layers
+        static_kv = self._project_static_streams({1: lifted_v_0, 2: lifted_concat_features}) if self.precompute_static_kv else [None] * len(self.transformer_blocks)
+
         initial_v: torch.Tensor | None = None  # Value residual: Starts as none, becomes x_0 the first layer
-        for layer in self.transformer_blocks:
-            lifted_x_0, initial_v = layer(lifted_x_0, lifted_v_0, lifted_concat_features, q_data=lifted_concat_features, mask=mask, initial_v=initial_v)
+        for index, (layer, layer_static_kv) in enumerate(zip(self.transformer_blocks, static_kv)):
+            # Checkpointed blocks store only their inputs and are recomputed in the backward pass
+            run_layer = partial(checkpoint, layer, use_reentrant=False) if index in self.checkpointed_layers and torch.is_grad_enabled() else layer
+            lifted_x_0, initial_v = run_layer(
+                lifted_x_0,
+                lifted_v_0,
+                lifted_concat_features,
+                q_data=lifted_concat_features,
+                mask=mask,
+                initial_v=initial_v,
+                segment_ids=segment_ids,
+                neighbour_pairs=neighbour_pairs,
+                node_bias=node_bias,
+                static_kv=layer_static_kv,
+            )
 
         # Batch (x, y, z) + projection layer
         if self.output_heads > 1:
             # Decides which output heads should be emphasised
-            head_weights: torch.Tensor = self.weight_pred_gate_net(lifted_concat_features.mean(dim=(1, 2)))  # mean pool over nodes and timesteps (molecule-level summary)
-            # Project each head's predictions to the final output space
-            pred_pos_per_head: list[torch.Tensor] = [self.projection_layers[i](lifted_x_0) for i in range(self.output_heads)]
+            if segment_ids is not None:
+                # One summary per packed sample, broadcast back to its nodes: [1, 1, sum(N_i), output_heads]
+                head_weights: torch.Tensor = self.weight_pred_gate_net(_segment_mean(lifted_concat_features.mean(dim=1)[0], segment_ids[0]))[segment_ids].unsqueeze(1)
+            else:
+                # Mean pool over the real nodes and timesteps (molecule-level summary), so the padding of the batch does not change it
+                summary = _masked_mean(lifted_concat_features, mask) if mask is not None else lifted_concat_features.mean(dim=(1, 2))
+                head_weights = self.weight_pred_gate_net(summary).view(-1, 1, 1, self.output_heads)
+            # Project every head's predictions to the final output space at once => [B, T, N, output_heads, 3]
+            pred_pos_per_head = self.projection_heads(lifted_x_0).unflatten(-1, (self.output_heads, 3))
             # Weighted sum of the heads
-            final_pred_pos = torch.zeros_like(pred_pos_per_head[0])
-
-            for i in range(self.output_heads):
-                final_pred_pos = final_pred_pos + head_weights[:, i].view(-1, 1, 1, 1) * pred_pos_per_head[i]  # Weighted sum
+            final_pred_pos = torch.einsum("...h,...hc->...c", head_weights, pred_pos_per_head)
         else:
             # Single-head prediction
             final_pred_pos: torch.Tensor = self.projection_layer(lifted_x_0)
@@ -382,6 +613,88 @@ class ATOM(nn.Module):
 
         return pred_pos  # Outputting the positions (x, y, z) for N nodes over T timesteps. Batched.
 
+    def _project_static_streams(self, streams: dict[int, torch.Tensor]) -> list[dict[int, tuple[torch.Tensor, torch.Tensor]]]:
+        """Key and value projections of the static GHCA streams for every layer, in one matmul.
+
+        Every block pre-norms these streams and projects them with its own key and value layers, but the
+        streams themselves are the same in every layer. The normalisation without its affine is therefore
+        shared, and each block's affine is folded into its projection weights:
+        `W (x_hat * g + b) + c = (W * g) x_hat + (W b + c)`.
+
+        Parameters
+        ----------
+        streams : dict[int, torch.Tensor]
+            Lifted features of shape `[B, T, N, d]` by GHCA feature index, possibly expanded along T.
+
+        Returns
+        -------
+        list[dict[int, tuple[torch.Tensor, torch.Tensor]]]
+            The keys and values of shape `[B, T, N, d]` of every stream, per layer.
+        """
+        weights: list[torch.Tensor] = []
+        biases: list[torch.Tensor] = []
+        for block in self.transformer_blocks:
+            gain: torch.Tensor = block.pre_norm.weight
+            shift: torch.Tensor | None = getattr(block.pre_norm, "bias", None)  # RMSNorm has no bias
+            for projection in (block.attention.key, block.attention.value):
+                weights.append(projection.weight * gain)
+                biases.append(projection.bias + projection.weight @ shift if shift is not None else projection.bias)
+
+        pre_norm: nn.Module = self.transformer_blocks[0].pre_norm
+        normalised: list[torch.Tensor] = []
+        for features in streams.values():
+            # Expanded features are normalised and projected once per node
+            features = features[:, :1] if is_time_invariant(features) else features
+            if isinstance(pre_norm, nn.LayerNorm):
+                normalised.append(F.layer_norm(features, pre_norm.normalized_shape, eps=pre_norm.eps))
+            else:
+                normalised.append(F.rms_norm(features, pre_norm.normalized_shape, eps=pre_norm.eps))
+
+        # One [rows of all streams, d] x [d, num_layers * 2 * d] matmul
+        rows = torch.cat([features.reshape(-1, self.lifting_dim) for features in normalised])
+        projected = F.linear(rows, torch.cat(weights), torch.cat(biases)).split([features[..., 0].numel() for features in normalised])
+
+        num_layers = len(self.transformer_blocks)
+        static_kv: list[dict[int, tuple[torch.Tensor, torch.Tensor]]] = [{} for _ in range(num_layers)]
+        for (index, features), features_normalised, stream_projected in zip(streams.items(), normalised, projected):
+            per_layer = stream_projected.view(*features_normalised.shape[:-1], num_layers, 2, self.lifting_dim).expand(*features.shape[:-1], -1, -1, -1)
+            for layer in range(num_layers):
+                static_kv[layer][index] = (per_layer[..., layer, 0, :], per_layer[..., layer, 1, :])
+        return static_kv
+
+    def freeze_for_inference(self) -> "ATOM":
+        """Replace every o3.Linear by the nn.Linear computing the same map, and switch to eval mode.
+
+        Trained o3.Linear layers are fixed block-structured matrices, so the dense weights run as one matmul
+        without e3nn's instruction machinery, and fusion or quantization passes see through them. The
+        frozen model's state dict no longer matches the checkpoint layout, so load weights before freezing.
+
+        Returns
+        -------
+        ATOM
+            The model itself, frozen in place.
+        """
+        e3nn_linears = [name for name, module in self.named_modules() if isinstance(module, o3.Linear)]
+        for name in e3nn_linears:
+            parent_name, _, child_name = name.rpartition(".")
+            parent = self.get_submodule(parent_name)
+            setattr(parent, child_name, dense_linear_from_o3(getattr(parent, child_name)))
+        return self.eval()
+
+    @override
+    def _load_from_state_dict(self, state_dict: dict[str, torch.Tensor], prefix: str, *args: Any, **kwargs: Any) -> None:
+        # Checkpoints from before the output heads were fused hold one o3.Linear(lifting_dim_irreps, "1x1o") per head.
+        # Their weights of shape [num_vectors] are the columns of the fused [num_vectors, output_heads] weight.
+        head_prefix = f"{prefix}projection_layers."
+        if self.output_heads > 1 and f"{head_prefix}0.weight" in state_dict:
+            head_weights = [state_dict.pop(f"{head_prefix}{i}.weight") for i in range(self.output_heads)]
+            state_dict[f"{prefix}projection_heads.weight"] = torch.stack(head_weights, dim=-1).flatten()
+            # Buffers over the output irreps (e.g. the empty biases) are laid out head after head
+            suffixes = {key.removeprefix(head_prefix).split(".", 1)[1] for key in state_dict if key.startswith(head_prefix)}
+            for suffix in suffixes:
+                state_dict[f"{prefix}projection_heads.{suffix}"] = torch.cat([state_dict.pop(f"{head_prefix}{i}.{suffix}") for i in range(self.output_heads)])
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     @staticmethod
     def _initialise_weights(model: nn.Module) -> None:
         """Initialise the weights of the model.
@@ -421,6 +734,21 @@ class ATOM(nn.Module):
         return concat_irreps_1, concat_irreps_2_rrwp
 
 
+def checkpointed_layers(policy: CheckpointPolicy, num_layers: int, every: int) -> set[int]:
+    """
+    Returns the indices of the layers whose activations are recomputed in the backward pass, as set by `policy`.
+
+    Attention-only checkpointing happens inside the layers, so no whole layer is checkpointed.
+    """
+    match policy:
+        case CheckpointPolicy.EVERY_LAYER:
+            return set(range(num_layers))
+        case CheckpointPolicy.EVERY_KTH_LAYER:
+            return set(range(0, num_layers, every))
+        case _:
+            return set()
+
+
 def get_lifting_dim_irreps(lifting_dim: int) -> str:
     """
     Returns the irreps for the lifting dimension.
@@ -430,3 +758,70 @@ def get_lifting_dim_irreps(lifting_dim: int) -> str:
 
     lifting_dim_irreps: str = f"{vector_lifting_dim_irreps}x1o + {scalar_lifting_dim_irreps}x0e"
     return lifting_dim_irreps
+
+
+def dense_linear_from_o3(linear: o3.Linear) -> nn.Linear:
+    """
+    Returns the nn.Linear computing the same map as `linear`, read off by applying `linear` to zero and to the basis vectors.
+    """
+    weight_like = next(linear.parameters(), torch.empty(0))
+    basis = torch.eye(linear.irreps_in.dim, dtype=weight_like.dtype, device=weight_like.device)
+    dense = nn.Linear(linear.irreps_in.dim, linear.irreps_out.dim, bias=linear.bias_numel > 0, dtype=weight_like.dtype, device=weight_like.device)
+    with torch.no_grad():
+        bias = linear(torch.zeros_like(basis[:1]))[0]
+        _ = dense.weight.copy_((linear(basis) - bias).T)
+        if dense.bias is not None:
+            _ = dense.bias.copy_(bias)
+    return dense
+
+
+def channelwise_tensor_product(irreps: str) -> o3.TensorProduct:
+    """
+    Returns a weighted tensor product from two inputs of `irreps` to `irreps`, whose paths pair channels instead of connecting all of them.
+
+    A fully connected tensor product has mul_1 * mul_2 * mul_out weights per path. Here an irrep times a scalar
+    keeps its channels, each gated by a weighted sum of the other input's scalars ("uvu" / "uvv"), and two
+    non-scalar irreps only meet channel by channel before being mixed into the outputs ("uuw"). The weights and
+    FLOPs grow linearly in the number of vector channels, and the product stays exactly E(3)-equivariant.
+    """
+    irreps_in = o3.Irreps(irreps)
+    instructions: list[tuple[int, int, int, str, bool]] = []
+    for i_1, (mul_1, ir_1) in enumerate(irreps_in):
+        for i_2, (mul_2, ir_2) in enumerate(irreps_in):
+            for i_out, (mul_out, ir_out) in enumerate(irreps_in):
+                if 0 in (mul_1, mul_2, mul_out) or ir_out not in ir_1 * ir_2:
+                    continue
+                if ir_2 == o3.Irrep("0e") and mul_out == mul_1:
+                    instructions.append((i_1, i_2, i_out, "uvu", True))
+                elif ir_1 == o3.Irrep("0e") and mul_out == mul_2:
+                    instructions.append((i_1, i_2, i_out, "uvv", True))
+                elif mul_1 == mul_2:
+                    instructions.append((i_1, i_2, i_out, "uuw", True))
+    return o3.TensorProduct(irreps_in, irreps_in, irreps_in, instructions)
+
+
+def segment_ids_from_cu_seqlens(cu_seqlens: torch.Tensor) -> torch.Tensor:
+    """
+    Returns the sample index of every node of a packed batch, of shape [B, sum(N_i)], from node offsets of shape [B, num_samples + 1].
+    """
+    lengths = cu_seqlens.diff(dim=-1)
+    segments = torch.arange(lengths.shape[-1], device=cu_seqlens.device)
+    return torch.stack([torch.repeat_interleave(segments, row_lengths) for row_lengths in lengths])
+
+
+def _segment_mean(features: torch.Tensor, segment_ids: torch.Tensor) -> torch.Tensor:
+    """
+    Mean of [L, d] node features over each segment of [L] segment ids, of shape [num_segments, d].
+    """
+    num_segments = int(segment_ids.max()) + 1
+    sums = features.new_zeros(num_segments, features.shape[-1]).index_add_(0, segment_ids, features)
+    counts = torch.bincount(segment_ids, minlength=num_segments).clamp(min=1).unsqueeze(-1)
+    return sums / counts
+
+
+def _masked_mean(features: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+    """
+    Mean of [B, T, N, d] features over the timesteps and the real nodes of a [B, T, N, 1] padding mask, of shape [B, d].
+    """
+    weights = mask.to(features.dtype)
+    return (features * weights).sum(dim=(1, 2)) / weights.sum(dim=(1, 2)).clamp(min=1)
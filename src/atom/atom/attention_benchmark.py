@@ -0,0 +1,75 @@
+import time
+
+import torch
+
+from atom.atom.attentions import LinearKernelAttention, QuadraticHeterogenousCrossAttention, QuadraticSelfAttention
+
+
+def time_layer(attention: torch.nn.Module, features: list[torch.Tensor], mask: torch.Tensor, repeats: int = 20, backward: bool = True) -> float:
+    """Median latency of one attention layer (forward, and backward if requested), in seconds."""
+    times: list[float] = []
+    for _ in range(repeats + 3):  # The first calls warm up the kernels and the allocator
+        if features[0].is_cuda:
+            torch.cuda.synchronize()
+        start_time = time.perf_counter()
+        with torch.set_grad_enabled(backward):
+            if isinstance(attention, QuadraticHeterogenousCrossAttention):
+                out = attention(features[0], features[1], features[2], q_data=features[2], mask=mask)
+            else:
+                out = attention(features[0], mask)
+            if backward:
+                out.sum().backward()
+        if features[0].is_cuda:
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start_time)
+    return sorted(times[3:])[repeats // 2]
+
+
+if __name__ == "__main__":
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    batch_size, num_timesteps, lifting_dim, num_heads = 16, 8, 128, 8
+
+    print(f"Device: {device}, B={batch_size}, T={num_timesteps}, d={lifting_dim}, heads={num_heads}")
+    print(f"{'N':>6} {'backend':>8} {'loop (ms)':>10} {'fused (ms)':>11} {'speedup':>9}")
+    for num_nodes in [9, 21, 42, 64]:
+        features = [torch.randn(batch_size, num_timesteps, num_nodes, lifting_dim, device=device) for _ in range(3)]
+        mask = torch.ones(batch_size, num_timesteps, num_nodes, 1, dtype=torch.bool, device=device)
+        mask[: batch_size // 2, :, num_nodes * 2 // 3 :] = False  # Half of the batch padded, as in multitask batches
+
+        for use_sdpa in (False, True):
+            attentions = [
+                QuadraticHeterogenousCrossAttention(
+                    num_hetero_feats=3,
+                    lifting_dim=lifting_dim,
+                    num_heads=num_heads,
+                    num_timesteps=num_timesteps,
+                    use_rope=True,
+                    rope_base=1000.0,
+                    use_spherical_harmonics=False,
+                    use_sdpa=use_sdpa,
+                    fuse_hetero_streams=fuse,
+                ).to(device)
+                for fuse in (False, True)
+            ]
+            _ = attentions[1].load_state_dict(attentions[0].state_dict())
+
+            # Same weights and inputs, so the fused layer must reproduce the loop (dropout off)
+            with torch.no_grad():
+                reference, fused = [attention.eval()(features[0], features[1], features[2], q_data=features[2], mask=mask) for attention in attentions]
+            assert torch.allclose(reference, fused, atol=1e-4), f"Fused output differs for N={num_nodes}"
+
+            loop_time, fused_time = [time_layer(attention.train(), features, mask) for attention in attentions]
+            backend = "sdpa" if use_sdpa else "math"
+            print(f"{num_nodes:>6} {backend:>8} {loop_time * 1e3:>10.3f} {fused_time * 1e3:>11.3f} {loop_time / fused_time:>8.2f}x")
+
+    # Quadratic against linear kernel self-attention over growing horizons, as at inference
+    num_nodes = 21
+    print(f"\n{'T':>6} {'S':>7} {'quadratic (ms)':>15} {'linear (ms)':>12} {'speedup':>9}")
+    for num_timesteps in [8, 16, 32, 64, 128]:
+        features = [torch.randn(4, num_timesteps, num_nodes, lifting_dim, device=device)]
+        mask = torch.ones(4, num_timesteps, num_nodes, 1, dtype=torch.bool, device=device)
+        quadratic = QuadraticSelfAttention(num_heads=num_heads, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True, use_spherical_harmonics=False)
+        linear = LinearKernelAttention(num_heads=num_heads, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True)
+
+        quadratic_time, linear_time = [time_layer(attention.to(device).eval(), features, mask, backward=False) for attention in (quadratic, linear)]
+        print(f"{num_timesteps:>6} {num_timesteps * num_nodes:>7} {quadratic_time * 1e3:>15.3f} {linear_time * 1e3:>12.3f} {quadratic_time / linear_time:>8.2f}x")
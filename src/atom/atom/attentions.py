@@ -1,11 +1,313 @@
-from typing import final, override
+from collections.abc import Callable
+from typing import Any, final, override
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 from atom.atom.mlps import MLP
 from e3nn import o3
 
 
+def block_diagonal_mask(segment_ids: torch.Tensor, num_timesteps: int) -> torch.Tensor:
+    """
+    Attention mask that keeps every token of a packed batch within its own sample.
+
+    Parameters
+    ----------
+    segment_ids : torch.Tensor
+        Sample index of every node, of shape `[B, N]`.
+    num_timesteps : int
+        Number of timesteps T.
+
+    Returns
+    -------
+    torch.Tensor
+        Boolean mask of shape `[B, 1, T*N, T*N]`, True where query and key belong to the same sample.
+    """
+    # The flattened sequence is time-major, so every timestep repeats the node segments
+    token_segments = segment_ids.repeat(1, num_timesteps)  # [B, T*N]
+    return (token_segments.unsqueeze(-1) == token_segments.unsqueeze(-2)).unsqueeze(1)
+
+
+def is_time_invariant(features: torch.Tensor) -> bool:
+    """
+    Whether `[B, T, N, d]` features are expanded along T, e.g. the lifted initial conditions, so that every
+    timestep is a view of the same values.
+    """
+    return features.shape[1] > 1 and features.stride(1) == 0
+
+
+def project_tokens(projection: nn.Module, features: torch.Tensor) -> torch.Tensor:
+    """
+    Apply a per-token projection to `[B, T, N, d]` features, flattened to `[B, T*N, d_out]`.
+
+    Time-invariant features (see `is_time_invariant`) are projected once per node and then repeated over time.
+    """
+    B, T, N, _ = features.shape
+    if is_time_invariant(features):
+        return projection(features[:, :1]).expand(B, T, N, -1).reshape(B, T * N, -1)
+    return projection(features.reshape(B, T * N, -1))
+
+
+def sdpa_attention_mask(
+    key_mask: torch.Tensor | None, segment_mask: torch.Tensor | None, bias: torch.Tensor | None, dtype: torch.dtype
+) -> torch.Tensor | None:
+    """
+    Combine the masks and bias of the math path into a single `attn_mask` for `F.scaled_dot_product_attention`.
+
+    Parameters
+    ----------
+    key_mask : torch.Tensor | None
+        Padding mask of shape `[B, 1, 1, S]`, nonzero for real keys.
+    segment_mask : torch.Tensor | None
+        Boolean block-diagonal mask of shape `[B, 1, S, S]` for packed batches.
+    bias : torch.Tensor | None
+        Additive bias of shape `[B, H, S, S]`, e.g. the spherical harmonics bias.
+    dtype : torch.dtype
+        Dtype of the queries, which an additive mask must match.
+
+    Returns
+    -------
+    torch.Tensor | None
+        A boolean mask (True = attend) without bias, an additive mask with `-inf` at masked keys otherwise,
+        or None if there is nothing to mask.
+    """
+    allowed: torch.Tensor | None = key_mask.bool() if key_mask is not None else None
+    if segment_mask is not None:
+        allowed = segment_mask if allowed is None else allowed & segment_mask
+
+    if bias is None:
+        return allowed
+    if allowed is not None:
+        bias = bias.masked_fill(~allowed, float("-inf"))
+    return bias.to(dtype)
+
+
+def token_neighbour_pairs(
+    source_node_indices: torch.Tensor,
+    target_node_indices: torch.Tensor,
+    edge_type: torch.Tensor,
+    num_timesteps: int,
+    num_nodes: int,
+    hops: int,
+    temporal_self: bool,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Query and key token indices of neighbour-restricted attention over the flattened `[B, T*N]` tokens.
+
+    Every token attends to the tokens of its graph neighbours (up to `hops` hops) at the same timestep, and to
+    its own node: at every timestep if `temporal_self`, otherwise at its own timestep only.
+
+    Parameters
+    ----------
+    source_node_indices, target_node_indices : torch.Tensor
+        Edge list of every sample, of shape `[B, E]`. The target node attends to the source node.
+    edge_type : torch.Tensor
+        Hop count of every edge (1 or 2) of shape `[B, E]`, 0 for padded edges.
+    num_timesteps : int
+        Number of timesteps T.
+    num_nodes : int
+        Number of (padded) nodes N.
+    hops : int
+        Keep the edges of at most this many hops.
+    temporal_self : bool
+        Whether tokens also attend to their own node at every other timestep.
+
+    Returns
+    -------
+    tuple[torch.Tensor, torch.Tensor]
+        Query and key indices into the `B*T*N` tokens, each of shape `[num_pairs]`.
+    """
+    B, num_edges = source_node_indices.shape
+    device = source_node_indices.device
+    seq_len = num_timesteps * num_nodes
+
+    # Token offset of every (sample, timestep): [B, T, 1]
+    offsets = (torch.arange(B, device=device) * seq_len).view(B, 1, 1) + (torch.arange(num_timesteps, device=device) * num_nodes).view(1, num_timesteps, 1)
+    valid = ((edge_type > 0) & (edge_type <= hops)).unsqueeze(1).expand(B, num_timesteps, num_edges)
+    spatial_query = (offsets + target_node_indices.unsqueeze(1))[valid]
+    spatial_key = (offsets + source_node_indices.unsqueeze(1))[valid]
+
+    tokens = torch.arange(B * seq_len, device=device).view(B, num_timesteps, 1, num_nodes)
+    if temporal_self:
+        # (b, t, n) attends to (b, t', n) for every t', itself included
+        self_query = tokens.expand(B, num_timesteps, num_timesteps, num_nodes).flatten()
+        self_key = tokens.transpose(1, 2).expand(B, num_timesteps, num_timesteps, num_nodes).flatten()
+    else:
+        self_query = self_key = tokens.flatten()
+
+    return torch.cat([spatial_query, self_query]), torch.cat([spatial_key, self_key])
+
+
+def segment_softmax(scores: torch.Tensor, index: torch.Tensor, num_segments: int) -> torch.Tensor:
+    """
+    Softmax of `[num_pairs, H]` scores over the pairs that share a segment (query) index of shape `[num_pairs]`.
+    """
+    expanded_index = index.unsqueeze(-1).expand_as(scores)
+    # Softmax is shift invariant, so the per-segment max only stabilises the exponent and needs no gradient
+    segment_max = scores.new_full((num_segments, scores.shape[-1]), float("-inf")).scatter_reduce(0, expanded_index, scores.detach(), reduce="amax")
+    exp_scores = (scores - segment_max[index]).exp()
+    segment_sum = torch.zeros_like(segment_max).index_add(0, index, exp_scores)
+    return exp_scores / segment_sum[index]
+
+
+def add_node_bias(scores: torch.Tensor, node_bias: torch.Tensor, num_timesteps: int) -> torch.Tensor:
+    """
+    Add a bias between nodes of shape `[B, H, N, N]` to time-major scores of shape `[B, H, T*N, T*N]`.
+
+    Every (t, t') block of the scores gets the same bias, which is broadcast rather than tiled to `[T*N, T*N]`.
+    """
+    B, H, S, _ = scores.shape
+    N = S // num_timesteps
+    return (scores.view(B, H, num_timesteps, N, num_timesteps, N) + node_bias.view(B, H, 1, N, 1, N)).view(B, H, S, S)
+
+
+def select_query_chunk_size(seq_len: int, bytes_per_query: int, chunk_size: int | None, memory_budget_mb: float | None) -> int:
+    """
+    Number of queries attended at once by the chunked math path.
+
+    Parameters
+    ----------
+    seq_len : int
+        Number of queries S.
+    bytes_per_query : int
+        Estimated memory of the score-sized intermediates of a single query row.
+    chunk_size : int | None
+        Fixed block size, which takes precedence over the budget.
+    memory_budget_mb : float | None
+        Memory budget of a block's intermediates, in MiB.
+
+    Returns
+    -------
+    int
+        The block size, or `seq_len` (no chunking) if neither a block size nor a budget is given.
+    """
+    if chunk_size is not None:
+        return min(chunk_size, seq_len)
+    if memory_budget_mb is not None:
+        return max(1, min(seq_len, int(memory_budget_mb * 1024**2) // bytes_per_query))
+    return seq_len
+
+
+def attention_bytes_per_query(
+    batch_size: int, seq_len: int, num_heads: int, element_size: int, spherical_harmonics: "SphericalHarmonicsAttentionBias | None"
+) -> int:
+    """
+    Estimated memory of the score-sized intermediates of one query row: scores, weights and dropped-out weights
+    per head, plus the relative coordinates, harmonics and MLP activations of the spherical harmonics bias.
+    """
+    floats_per_key = 3 * num_heads
+    if spherical_harmonics is not None:
+        floats_per_key += 4 + spherical_harmonics.num_coeff + 2 * spherical_harmonics.hidden_dim + num_heads
+    return batch_size * seq_len * element_size * floats_per_key
+
+
+def _attend_query_block(
+    q_block: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    attention_denom: torch.Tensor,
+    key_mask: torch.Tensor | None,
+    query_segments: torch.Tensor | None,
+    key_segments: torch.Tensor | None,
+    query_coords: torch.Tensor | None,
+    key_coords: torch.Tensor | None,
+    spherical_harmonics: "SphericalHarmonicsAttentionBias | None",
+    node_bias_rows: torch.Tensor | None,
+    dropout: nn.Module,
+) -> torch.Tensor:
+    scores = q_block @ k.transpose(-2, -1) / attention_denom.view(1, -1, 1, 1)
+    if key_mask is not None:
+        scores = scores.masked_fill(key_mask == 0, float("-inf"))
+    if query_segments is not None and key_segments is not None:
+        scores = scores.masked_fill((query_segments.unsqueeze(-1) != key_segments.unsqueeze(-2)).unsqueeze(1), float("-inf"))
+    if spherical_harmonics is not None and query_coords is not None and key_coords is not None:
+        relative_distance = query_coords.unsqueeze(2) - key_coords.unsqueeze(1)  # [B, blk, S, 3]
+        scores = scores + spherical_harmonics.bias_from_relative(relative_distance).permute(0, 3, 1, 2)
+    if node_bias_rows is not None:
+        # [B, H, blk, N] => [B, H, blk, T*N], as the keys are time-major
+        scores = scores + node_bias_rows.repeat(1, 1, 1, k.shape[2] // node_bias_rows.shape[-1])
+
+    attn_weights: torch.Tensor = dropout(F.softmax(scores, dim=-1))
+    return attn_weights @ v
+
+
+def chunked_attention(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    attention_denom: torch.Tensor,
+    key_mask: torch.Tensor | None,
+    token_segments: torch.Tensor | None,
+    coords: torch.Tensor | None,
+    spherical_harmonics: "SphericalHarmonicsAttentionBias | None",
+    dropout: nn.Module,
+    chunk_size: int,
+    node_bias: torch.Tensor | None = None,
+) -> torch.Tensor:
+    """
+    Math-path attention over blocks of `chunk_size` queries, so that only `[B, H, chunk_size, S]` scores exist at once.
+
+    The segment mask and the spherical harmonics bias are built per block from the token segments and coordinates
+    instead of being sliced from `[S, S]` tensors. With gradients enabled, every block is checkpointed and
+    recomputed in the backward pass, which bounds the memory of training as well.
+
+    Parameters
+    ----------
+    q, k, v : torch.Tensor
+        Queries, keys and values of shape `[B, H, S, d_head]`, after RoPE.
+    attention_denom : torch.Tensor
+        Per-head attention denominator of shape `[H]`.
+    key_mask : torch.Tensor | None
+        Padding mask of shape `[B, 1, 1, S]`, nonzero for real keys.
+    token_segments : torch.Tensor | None
+        Sample index of every token of shape `[B, S]` for packed batches.
+    coords : torch.Tensor | None
+        Coordinates of every token of shape `[B, S, 3]` for the spherical harmonics bias.
+    spherical_harmonics : SphericalHarmonicsAttentionBias | None
+        Bias module, or None for no bias.
+    dropout : nn.Module
+        Dropout applied to the attention weights.
+    chunk_size : int
+        Number of queries per block.
+    node_bias : torch.Tensor | None, optional
+        Bias between nodes of shape `[B, H, N, N]`, shared by every pair of timesteps (see `add_node_bias`).
+
+    Returns
+    -------
+    torch.Tensor
+        Attention output of shape `[B, H, S, d_head]`, equal to the unchunked math path.
+    """
+    S = q.shape[2]
+    outputs = []
+    for start in range(0, S, chunk_size):
+        end = min(start + chunk_size, S)
+        node_bias_rows: torch.Tensor | None = None
+        if node_bias is not None:
+            query_nodes = torch.arange(start, end, device=node_bias.device) % node_bias.shape[-1]
+            node_bias_rows = node_bias[:, :, query_nodes]
+        block_args = (
+            q[:, :, start:end],
+            k,
+            v,
+            attention_denom,
+            key_mask,
+            token_segments[:, start:end] if token_segments is not None else None,
+            token_segments,
+            coords[:, start:end] if coords is not None else None,
+            coords,
+            spherical_harmonics,
+            node_bias_rows,
+            dropout,
+        )
+        if torch.is_grad_enabled():
+            # Checkpointing restores the RNG state, so the recomputed dropout mask matches the forward one
+            outputs.append(checkpoint(_attend_query_block, *block_args, use_reentrant=False))
+        else:
+            outputs.append(_attend_query_block(*block_args))
+    return torch.cat(outputs, dim=2)
+
+
 @final
 class TemporalRoPEWithOffset(nn.Module):
     """
@@ -29,7 +331,7 @@ class TemporalRoPEWithOffset(nn.Module):
     offset : nn.Parameter or torch.Tensor
         Learnable or fixed per-head offsets.
     freqs : torch.Tensor
-        Precomputed RoPE frequencies.
+        Precomputed RoPE frequencies of shape `[half_dim]`.
 
     Raises
     ------
@@ -46,9 +348,14 @@ class TemporalRoPEWithOffset(nn.Module):
 
     Process:
         1. Generate time indices such that groups of `num_nodes` share the same timestep.
-        2. Compute cos/sin embeddings for `num_timesteps`, adjusted by per-head offsets.
-        3. Apply RoPE by rotating even/odd tensor components using the cos/sin values.
-        4. Handle masking for padded nodes if a mask is provided.
+        2. Compute cos/sin embeddings for `num_timesteps`, adjusted by per-head offsets. These tables are
+           kept in float32 (float64 for float64 inputs), cached per (num_nodes, dtype, device) and dropped
+           when the module is moved or cast.
+        3. Apply RoPE by rotating even/odd tensor components using the cos/sin values, broadcast over the batch.
+           Reduced-precision inputs, e.g. bfloat16 under autocast, are rotated in float32 and cast back.
+
+    Packed batches concatenate the nodes of several samples into one sequence of shape `[T, sum(N_i)]`.
+    Every sample spans all T timesteps, so the time index of a token is already its time within its own sample.
 
     Output tensor shape: `[B, n_heads, seq_len, d_head]`
     """
@@ -66,15 +373,46 @@ class TemporalRoPEWithOffset(nn.Module):
 
         if learnable_offset:
             # Each of n_heads gets its own offset, initialised to 0
-            self.offset = nn.Parameter(torch.zeros(n_heads, device="cuda"))
+            self.offset = nn.Parameter(torch.zeros(n_heads))
         else:
             # A fixed buffer, all zeros by default
-            self.register_buffer("offset", torch.zeros(n_heads, device="cuda"), persistent=False)
+            self.register_buffer("offset", torch.zeros(n_heads), persistent=False)
+
+        self.register_buffer("freqs", 1.0 / (self.base ** (2 * torch.arange(0, self.half_dim).float() / d_head)), persistent=False)  # [half_dim]
+
+        # cos/sin tables per (num_nodes, dtype, device), only filled for fixed offsets
+        self._tables: dict[tuple[int, torch.dtype, torch.device], tuple[torch.Tensor, torch.Tensor]] = {}
+
+    @override
+    def _apply(self, fn: Callable[[torch.Tensor], torch.Tensor], *args: Any, **kwargs: Any) -> "TemporalRoPEWithOffset":
+        # .to(), .cuda(), .half() etc. move the offsets and frequencies, so the tables are rebuilt from them
+        self._tables.clear()
+        return super()._apply(fn, *args, **kwargs)
+
+    def cos_sin(self, num_nodes: int, dtype: torch.dtype, device: torch.device) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        cos and sin of the rotation angles, each of shape `[n_heads, T*N, half_dim]`.
+
+        For each head h and time-major token t*N + n, the angle is `(t + offset[h]) * freqs`. The tables are
+        cached unless the offsets are learnable, as those need a fresh autograd graph on every call.
+        """
+        key = (num_nodes, dtype, device)
+        if key in self._tables:
+            return self._tables[key]
+
+        # Time index of every token: [0,0,...,0,1,1,...,1,..., T-1,...,T-1], each repeated num_nodes times
+        positions = torch.arange(self.num_timesteps, device=device).repeat_interleave(num_nodes)  # [T*N]
+        # The module may live on another device than its input when it is used on its own, outside a model
+        offset, freqs = self.offset.to(device), self.freqs.to(device)
+        angle = (positions.unsqueeze(0) + offset.unsqueeze(-1)).unsqueeze(-1) * freqs  # [H, T*N, half_dim]
+        tables = (angle.cos().to(dtype), angle.sin().to(dtype))
 
-        self.freqs = (1.0 / (self.base ** (2 * torch.arange(0, self.half_dim, device=self.offset.device).float() / d_head))).unsqueeze(0).unsqueeze(0)  # [1, 1, half_dim]
+        if not isinstance(self.offset, nn.Parameter):
+            self._tables[key] = tables
+        return tables
 
     @override
-    def forward(self, tensor: torch.Tensor, mask: torch.Tensor | None) -> torch.Tensor:
+    def forward(self, tensor: torch.Tensor) -> torch.Tensor:
         """
         Apply RoPE to the input tensor.
 
@@ -83,9 +421,6 @@ class TemporalRoPEWithOffset(nn.Module):
         tensor : torch.Tensor
             Input tensor of shape `[B, n_heads, seq_len, d_head]`.
             `seq_len = num_nodes * num_timesteps`.
-        mask : torch.Tensor | None
-            Optional mask of shape `[B, T*N, 1]` or `[B, seq_len, 1]` for padded nodes.
-            If provided, padded nodes will not be rotated.
 
         Returns
         -------
@@ -96,6 +431,11 @@ class TemporalRoPEWithOffset(nn.Module):
         ------
         AssertionError
             If input tensor dimensions or `num_heads` do not match initialization.
+
+        Notes
+        -----
+        Padded nodes are rotated like real ones. They are masked out as keys, so their rotation never
+        reaches a real token.
         """
         B, H, seq_len, d_head = tensor.shape
         num_nodes = seq_len // self.num_timesteps
@@ -103,49 +443,21 @@ class TemporalRoPEWithOffset(nn.Module):
         assert d_head == self.d_head, f"Expected d_head={self.d_head}, got {d_head}"
         assert seq_len % self.num_timesteps == 0, f"seq_len={seq_len} must be divisible by num_timesteps={self.num_timesteps}."
 
-        # 1) Create integer time indices for each chunk of num_nodes => shape [seq_len]
-        #    e.g., times = [0,0,...,0,1,1,...,1,..., T-1, T-1,..., T-1], each repeated num_nodes times.
-        times = torch.arange(self.num_timesteps, device=tensor.device).unsqueeze(1)  # [T,1]
-        positions = torch.repeat_interleave(times, num_nodes, dim=1).flatten(0, 1)  # [N*T=seq_len]
-
-        # 3) Construct angles per head: shape => [H, seq_len, half_dim].
-        #    For each head i, angle_i = (positions + offset[i]) * freqs
-        #    Broadcast offset[i] across all positions.
-        #    offset: [H], positions: [seq_len]
-        #    => positions + offset[i] => shape [H, seq_len], then multiply by freqs => shape [H, seq_len, half_dim].
-        offset_broadcast = self.offset.unsqueeze(-1)  # [H, 1], this adds the head dim
-        positions_broadcast = positions.unsqueeze(0)  # [1, seq_len]
-        # shape => [H, seq_len]
-        shifted_positions = positions_broadcast + offset_broadcast
-        # shape => [H, seq_len, half_dim]
-        angle = shifted_positions.unsqueeze(-1) * self.freqs
-
-        # 4) cos, sin => each [1, H, seq_len, half_dim]
-        cos_t = angle.cos().unsqueeze(0)
-        sin_t = angle.sin().unsqueeze(0)
-
-        # 5) Expand cos_t/sin_t to [B, H, seq_len, half_dim]
-        cos_t = cos_t.expand(B, -1, seq_len, self.half_dim)
-        sin_t = sin_t.expand(B, -1, seq_len, self.half_dim)
-
-        # Avoid rotating padded nodes. Mask.shape = [B, T*N, 1]
-        if mask is not None:
-            cos_t = torch.where(mask, cos_t, torch.ones_like(cos_t))
-            sin_t = torch.where(mask, sin_t, torch.zeros_like(sin_t))
+        dtype = torch.float64 if tensor.dtype == torch.float64 else torch.float32
+        cos_t, sin_t = self.cos_sin(num_nodes, dtype, tensor.device)  # [H, seq_len, half_dim], broadcast over B
 
-        # 6) Apply the rotation to the last dimension of 'tensor'
-        #    Even indices => [0::2], odd => [1::2]
-        t1 = tensor[..., 0::2]  # [B, H, seq_len, half_dim]
-        t2 = tensor[..., 1::2]  # [B, H, seq_len, half_dim]
+        # Rotate the (even, odd) pairs of the last dimension, in the precision of the tables
+        t1 = tensor[..., 0::2].to(dtype)  # [B, H, seq_len, half_dim]
+        t2 = tensor[..., 1::2].to(dtype)  # [B, H, seq_len, half_dim]
 
         rotated_0 = t1 * cos_t - t2 * sin_t
         rotated_1 = t1 * sin_t + t2 * cos_t
 
         # Re-interleave - view_as does the interleaving
         # [B, H, seq_len, d_head]
-        rotated = torch.stack([rotated_0, rotated_1], dim=-1).view_as(tensor)
+        rotated = torch.stack([rotated_0, rotated_1], dim=-1).view(tensor.shape)
 
-        return rotated
+        return rotated.to(tensor.dtype) if tensor.is_floating_point() else rotated
 
 
 @final
@@ -184,6 +496,7 @@ class SphericalHarmonicsAttentionBias(nn.Module):
         # Total number of coefficients from l=0 to max_degree.
         self.num_coeff = sum(2 * l + 1 for l in range(max_degree + 1))
         self.num_timesteps = num_timesteps
+        self.hidden_dim = hidden_dim
         self.mlp = MLP(
             in_dim=self.num_coeff,
             hidden_dim=hidden_dim,
@@ -231,25 +544,44 @@ class SphericalHarmonicsAttentionBias(nn.Module):
         # Compute pairwise relative differences: r_ij = coords_i - coords_j.
         relative_distance: torch.Tensor = coords.unsqueeze(2) - coords.unsqueeze(1)  # [B, S, S, 3]
 
+        bias = self.bias_from_relative(relative_distance)  # [B, S, S, num_heads]
+
+        # Rearrange to [B, num_heads, S, S].
+        bias = bias.permute(0, 3, 1, 2)
+
+        return bias
+
+    def bias_from_relative(self, relative_distance: torch.Tensor) -> torch.Tensor:
+        """
+        Compute the bias per head for any set of relative differences.
+
+        Parameters
+        ----------
+        relative_distance : torch.Tensor
+            Relative differences `coords_i - coords_j` of shape `[..., 3]`, e.g. `[B, S, S, 3]` for all pairs
+            or `[num_pairs, 3]` for selected pairs.
+
+        Returns
+        -------
+        torch.Tensor
+            Bias tensor of shape `[..., num_heads]`.
+        """
         # Compute the norm (magnitude) and normalized direction.
-        norm: torch.Tensor = relative_distance.norm(dim=-1, keepdim=True)  # [B, S, S, 1]
-        unit_rel = relative_distance / (norm + self.eps)  # [B, S, S, 3]
+        norm: torch.Tensor = relative_distance.norm(dim=-1, keepdim=True)  # [..., 1]
+        unit_rel = relative_distance / (norm + self.eps)  # [..., 3]
 
         sh_features = []
         # For each degree l = 0, 1, ..., max_degree, compute spherical harmonics.
         for l in range(self.max_degree + 1):
-            # o3.spherical_harmonics returns shape [B, S, S, 2l+1].
+            # o3.spherical_harmonics returns shape [..., 2l+1].
             Y_l = o3.spherical_harmonics(l, unit_rel, normalize=True)
             sh_features.append(Y_l)
 
-        # Concatenate coefficients over l to form shape [B, S, S, num_coeff].
+        # Concatenate coefficients over l to form shape [..., num_coeff].
         sh_cat = torch.cat(sh_features, dim=-1)
 
         # Map the concatenated coefficients to a bias per head.
-        bias: torch.Tensor = self.mlp(sh_cat)  # [B, S, S, num_heads]
-
-        # Rearrange to [B, num_heads, S, S].
-        bias = bias.permute(0, 3, 1, 2)
+        bias: torch.Tensor = self.mlp(sh_cat)  # [..., num_heads]
 
         return bias
 
@@ -267,6 +599,10 @@ class QuadraticHeterogenousCrossAttention(nn.Module):
         use_spherical_harmonics: bool,
         learnable_attention_denom: bool = False,
         attention_dropout: float = 0.2,
+        use_sdpa: bool = False,
+        fuse_hetero_streams: bool = False,
+        query_chunk_size: int | None = None,
+        chunk_memory_budget_mb: float | None = None,
     ) -> None:
         """
         Heterogenous graph cross attention.
@@ -297,6 +633,20 @@ class QuadraticHeterogenousCrossAttention(nn.Module):
             by default False.
         attention_dropout : float, optional
             Dropout rate for attention weights, by default 0.2.
+        use_sdpa : bool, optional
+            If True, compute attention with `F.scaled_dot_product_attention` instead of materialising
+            the scores, by default False. The per-head attention denominator is folded into Q, and the masks
+            and spherical harmonics bias are passed as `attn_mask`.
+        fuse_hetero_streams : bool, optional
+            If True, stack the heterogeneous features and attend to all of them in one pass (one K/V
+            projection, one RoPE call and one batched attention) instead of looping over them,
+            by default False. Uses one score tensor per feature at the same time.
+        query_chunk_size : int | None, optional
+            If given, the math path attends blocks of this many queries at a time (see `chunked_attention`),
+            by default None.
+        chunk_memory_budget_mb : float | None, optional
+            If given and `query_chunk_size` is None, the block size is picked so that a block's intermediates
+            fit this many MiB, by default None.
 
         Attributes
         ----------
@@ -331,9 +681,15 @@ class QuadraticHeterogenousCrossAttention(nn.Module):
         self.use_rope = use_rope
         self.rope_base = rope_base
         self.use_spherical_harmonics = use_spherical_harmonics
+        self.use_sdpa = use_sdpa
+        self.fuse_hetero_streams = fuse_hetero_streams
+        self.query_chunk_size = query_chunk_size
+        self.chunk_memory_budget_mb = chunk_memory_budget_mb
         self.d_head = self.lifting_dim // self.num_heads
 
         assert self.d_head % 2 == 0, "d_head must be even"
+        chunking = query_chunk_size is not None or chunk_memory_budget_mb is not None
+        assert not (chunking and (use_sdpa or fuse_hetero_streams)), "Query chunking only applies to the unfused math path"
 
         from e3nn import o3
         from atom.atom.atom_model import get_lifting_dim_irreps
@@ -365,7 +721,17 @@ class QuadraticHeterogenousCrossAttention(nn.Module):
             self.spherical_harmonics = SphericalHarmonicsAttentionBias(num_timesteps=self.num_timesteps, max_degree=1, num_heads=self.num_heads, hidden_dim=16)
 
     @override
-    def forward(self, x_0: torch.Tensor, v_0: torch.Tensor | None, concatenated_features: torch.Tensor | None, q_data: torch.Tensor, mask: torch.Tensor | None) -> torch.Tensor:
+    def forward(
+        self,
+        x_0: torch.Tensor,
+        v_0: torch.Tensor | None,
+        concatenated_features: torch.Tensor | None,
+        q_data: torch.Tensor,
+        mask: torch.Tensor | None,
+        segment_ids: torch.Tensor | None = None,
+        node_bias: torch.Tensor | None = None,
+        static_kv: dict[int, tuple[torch.Tensor, torch.Tensor]] | None = None,
+    ) -> torch.Tensor:
         """Performs heterogeneous cross-attention with multiple feature types.
 
         Parameters
@@ -380,6 +746,16 @@ class QuadraticHeterogenousCrossAttention(nn.Module):
             Query data of shape `[B, T, N, d]`.
         mask : torch.Tensor | None, optional
             Mask of shape `[B, T, N, 1]` for padding, by default None.
+        segment_ids : torch.Tensor | None, optional
+            Sample index of every node of shape `[B, N]` for packed batches, by default None.
+            Attention is then restricted to tokens of the same sample.
+        node_bias : torch.Tensor | None, optional
+            Spherical harmonics bias between the nodes of shape `[B, heads, N, N]`, computed once by the caller
+            and shared by every pair of timesteps, by default None. Replaces the module's own bias.
+        static_kv : dict[int, tuple[torch.Tensor, torch.Tensor]] | None, optional
+            Precomputed key and value projections of shape `[B, T, N, d]` by feature index (1 for v_0, 2 for
+            concatenated_features), used instead of projecting those features, by default None. Not supported
+            with `fuse_hetero_streams`.
 
         Returns
         -------
@@ -392,7 +768,8 @@ class QuadraticHeterogenousCrossAttention(nn.Module):
             1. Flatten query data from `[B, T, N, d]` to `[B, T*N, d]`.
             2. Project query to `[B, heads, T*N, d_head]`.
             3. For each heterogeneous feature (x_0, v_0, concatenated_features):
-               - Project to K/V of shape `[B, heads, T*N, d_head]`.
+               - Project to K/V of shape `[B, heads, T*N, d_head]`, once per node for features that are
+                 expanded along T (see `project_tokens`).
                - Apply RoPE if enabled.
                - Compute attention scores `Q·K^T / attention_denom`.
                - Apply mask and spherical harmonics bias if enabled.
@@ -400,78 +777,194 @@ class QuadraticHeterogenousCrossAttention(nn.Module):
                - Gate and accumulate to output.
             4. Reshape output to `[B, T, N, d]`.
         """
-        # Flatten Q data: [B, T, N, d] -> [B, N * T (seq_q), d]
         B, T, N, d = q_data.shape
-        q_data_flat = q_data.view(B, T * N, d)
 
         key_mask_for_scores: torch.Tensor | None = None
-        rope_mask_for_rope: torch.Tensor | None = None
         if mask is not None:
             # Mask in shape: [B, T, N, 1]; need to mask attention of shape [B, heads, T*N, T*N]
             assert mask.shape == (B, T, N, 1), f"Expected mask shape (B,T,N,1) but got {mask.shape}"
-            reshaped_mask = mask.reshape(B, T * N)
-            key_mask_for_scores = reshaped_mask.unsqueeze(1).unsqueeze(1)  # [B, 1, 1, T*N] for attention scores
-            rope_mask_for_rope = reshaped_mask.unsqueeze(1).unsqueeze(-1)  # [B, 1, T*N, 1] for RoPE
+            key_mask_for_scores = mask.reshape(B, T * N).unsqueeze(1).unsqueeze(1)  # [B, 1, 1, T*N] for attention scores
+
+        if segment_ids is not None:
+            assert segment_ids.shape == (B, N), f"Expected segment_ids shape (B,N) but got {segment_ids.shape}"
 
         # Project Q => [B, heads, seq_q, d_head]
-        q_proj: torch.Tensor = self.query(q_data_flat).view(B, T * N, self.num_heads, self.d_head).permute(0, 2, 1, 3)  # [B, heads, seq_q, d_head]
+        q_proj: torch.Tensor = project_tokens(self.query, q_data).view(B, T * N, self.num_heads, self.d_head).permute(0, 2, 1, 3)  # [B, heads, seq_q, d_head]
 
         if self.use_rope:
-            q_proj = self.rope(q_proj, rope_mask_for_rope)
+            q_proj = self.rope(q_proj)
+
+        spherical_harmonics = self.spherical_harmonics if self.use_spherical_harmonics and node_bias is None else None
+        bytes_per_query = attention_bytes_per_query(B, T * N, self.num_heads, q_proj.element_size(), spherical_harmonics)
+        chunk_size = select_query_chunk_size(T * N, bytes_per_query, self.query_chunk_size, self.chunk_memory_budget_mb)
+
+        # The chunked path builds the segment mask and bias per block, so the [S, S] versions are not needed
+        segment_mask_for_scores: torch.Tensor | None = None
+        if segment_ids is not None and chunk_size == T * N:
+            segment_mask_for_scores = block_diagonal_mask(segment_ids, T)  # [B, 1, T*N, T*N]
 
         spherical_harmonics_bias: torch.Tensor | None = None
-        if self.use_spherical_harmonics:
+        if node_bias is not None:
+            assert node_bias.shape == (B, self.num_heads, N, N), f"Expected node_bias shape (B,heads,N,N) but got {node_bias.shape}"
+            if self.use_sdpa or self.fuse_hetero_streams:
+                spherical_harmonics_bias = node_bias.repeat(1, 1, T, T)  # These paths take a [B, heads, T*N, T*N] bias
+        elif spherical_harmonics is not None and chunk_size == T * N:
             # Assuming x_0 is always available when spherical harmonics are used.
             spherical_harmonics_bias = self.spherical_harmonics(x_0[..., :3])
 
+        sdpa_mask: torch.Tensor | None = None
+        q_scaled = q_proj
+        if self.use_sdpa:
+            # Shared by every feature: SDPA scales by a scalar, so the per-head denominator is folded into Q
+            sdpa_mask = sdpa_attention_mask(key_mask_for_scores, segment_mask_for_scores, spherical_harmonics_bias, q_proj.dtype)
+            q_scaled = q_proj / self.attention_denom.view(1, -1, 1, 1)
+
         # We'll accumulate over multiple heterogeneous features
         accumulated_out = torch.zeros_like(q_proj)
 
-        # Collect the features of shape [B, N*T, d]
-        hetero_features: list[torch.Tensor | None] = [
-            x_0.view(B, T * N, d) if x_0 is not None else None,  # Flatten features if they exist
-            v_0.view(B, T * N, d) if v_0 is not None else None,
-            concatenated_features.view(B, T * N, d) if concatenated_features is not None else None,
-        ]
+        # Collect the features of shape [B, T, N, d]; time-invariant ones are projected once per node
+        hetero_features: list[torch.Tensor | None] = [x_0, v_0, concatenated_features]
         assert len(hetero_features) == self.num_hetero_feats
 
         gates = F.softmax(self.feature_weights, dim=0)  # Precompute gates; ∑ gates = 1
-        for i, h_feat_flat in enumerate(hetero_features):
-            if h_feat_flat is None:  # Skip if feature is None
-                continue
+        if self.fuse_hetero_streams:
+            assert static_kv is None, "Precomputed keys and values are not supported with fuse_hetero_streams"
+            present = [i for i, h_feat in enumerate(hetero_features) if h_feat is not None]
+            streams = torch.stack([hetero_features[i] for i in present], dim=1).view(B, len(present), T * N, d)  # [B, F, T*N, d]
+            assert streams.shape[-1] == self.lifting_dim, f"Expected {self.lifting_dim}, got {streams.shape[-1]}"
+            accumulated_out = self._attend_stacked_streams(
+                q_proj, q_scaled, streams, gates[present], key_mask_for_scores, segment_mask_for_scores, spherical_harmonics_bias, sdpa_mask
+            )
+        else:
+            for i, h_feat in enumerate(hetero_features):
+                if h_feat is None:  # Skip if feature is None
+                    continue
+
+                assert h_feat.shape[-1] == self.lifting_dim, f"Expected {self.lifting_dim}, got {h_feat.shape[-1]}"
+
+                # Project K and V => [B, heads, seq_k, d_head]
+                if static_kv is not None and i in static_kv:
+                    k_flat, v_flat = (projected.reshape(B, T * N, d) for projected in static_kv[i])
+                else:
+                    k_flat, v_flat = project_tokens(self.key, h_feat), project_tokens(self.value, h_feat)
+                k_proj_i: torch.Tensor = k_flat.view(B, N * T, self.num_heads, self.d_head).permute(0, 2, 1, 3)
+                v_proj_i: torch.Tensor = v_flat.view(B, N * T, self.num_heads, self.d_head).permute(0, 2, 1, 3)
+
+                if self.use_rope:
+                    k_proj_i = self.rope(k_proj_i)
+
+                if self.use_sdpa:
+                    dropout_p = self.attention_dropout.p if self.training else 0.0
+                    feat_i_out = F.scaled_dot_product_attention(q_scaled, k_proj_i, v_proj_i, attn_mask=sdpa_mask, dropout_p=dropout_p, scale=1.0)
+                elif chunk_size < T * N:
+                    feat_i_out = chunked_attention(
+                        q_proj,
+                        k_proj_i,
+                        v_proj_i,
+                        self.attention_denom,
+                        key_mask_for_scores,
+                        segment_ids.repeat(1, T) if segment_ids is not None else None,  # Time-major, as in block_diagonal_mask
+                        x_0[..., :3].reshape(B, T * N, 3) if spherical_harmonics is not None else None,
+                        spherical_harmonics,
+                        self.attention_dropout,
+                        chunk_size,
+                        node_bias,
+                    )
+                else:
+                    # 1) scores = Q·K^T / sqrt(d_head)
+                    scores = q_proj @ k_proj_i.transpose(-2, -1) / self.attention_denom.view(1, -1, 1, 1)  # Broadcasts over heads
+                    if key_mask_for_scores is not None:
+                        # scores shape is [B, heads, seq_q, seq_k] = [B, heads, T*N, T*N]
+                        scores = scores.masked_fill(key_mask_for_scores == 0, float("-inf"))
+                    if segment_mask_for_scores is not None:
+                        scores = scores.masked_fill(~segment_mask_for_scores, float("-inf"))
+
+                    if spherical_harmonics_bias is not None:
+                        scores = scores + spherical_harmonics_bias
+                    elif node_bias is not None:
+                        scores = add_node_bias(scores, node_bias, T)
+
+                    # 2) softmax over seq_k dimension (dim=-1)
+                    attn_weights: torch.Tensor = self.attention_dropout(F.softmax(scores, dim=-1))
+                    # 3) multiply by V
+                    feat_i_out = attn_weights @ v_proj_i
+
+                # Gate
+                accumulated_out = accumulated_out + gates[i] * feat_i_out
 
-            assert h_feat_flat.shape[-1] == self.lifting_dim, f"Expected {self.lifting_dim}, got {h_feat_flat.shape[-1]}"
+        permuted_accumulated_out = accumulated_out.permute(0, 2, 1, 3).reshape(B, T * N, self.lifting_dim)
+        final_out_projection: torch.Tensor = self.out_proj(permuted_accumulated_out)
+        # Unflatten => [B, T, N, d]
+        final_out_reshaped = final_out_projection.view(B, T, N, self.lifting_dim)
 
-            # Project K and V => [B, heads, seq_k, d_head]
-            k_proj_i: torch.Tensor = self.key(h_feat_flat).view(B, N * T, self.num_heads, self.d_head).permute(0, 2, 1, 3)
-            v_proj_i: torch.Tensor = self.value(h_feat_flat).view(B, N * T, self.num_heads, self.d_head).permute(0, 2, 1, 3)
+        return final_out_reshaped
 
-            if self.use_rope:
-                k_proj_i = self.rope(k_proj_i, rope_mask_for_rope)
+    def _attend_stacked_streams(
+        self,
+        q_proj: torch.Tensor,
+        q_scaled: torch.Tensor,
+        streams: torch.Tensor,
+        gates: torch.Tensor,
+        key_mask: torch.Tensor | None,
+        segment_mask: torch.Tensor | None,
+        bias: torch.Tensor | None,
+        sdpa_mask: torch.Tensor | None,
+    ) -> torch.Tensor:
+        """Attend to every heterogeneous feature in one pass and return the gated sum.
 
-            # 1) scores = Q·K^T / sqrt(d_head)
-            scores = q_proj @ k_proj_i.transpose(-2, -1) / self.attention_denom.view(1, -1, 1, 1)  # Broadcasts over heads
-            if key_mask_for_scores is not None:
-                # scores shape is [B, heads, seq_q, seq_k] = [B, heads, T*N, T*N]
-                scores = scores.masked_fill(key_mask_for_scores == 0, float("-inf"))
+        Parameters
+        ----------
+        q_proj : torch.Tensor
+            Queries of shape `[B, heads, S, d_head]`, after RoPE.
+        q_scaled : torch.Tensor
+            Queries divided by the attention denominator, used by the SDPA backend.
+        streams : torch.Tensor
+            Stacked features of shape `[B, F, S, d]`.
+        gates : torch.Tensor
+            Gate of every stacked feature, of shape `[F]`.
+        key_mask, segment_mask, bias, sdpa_mask : torch.Tensor | None
+            The masks and bias of `forward`, which are shared by every feature.
 
-            if self.use_spherical_harmonics and spherical_harmonics_bias is not None:
-                scores = scores + spherical_harmonics_bias
+        Returns
+        -------
+        torch.Tensor
+            Gated sum of the attention outputs, of shape `[B, heads, S, d_head]`.
+        """
+        B, num_streams, S, _ = streams.shape
 
-            # 2) softmax over seq_k dimension (dim=-1)
-            attn_weights: torch.Tensor = self.attention_dropout(F.softmax(scores, dim=-1))
-            # 3) multiply by V
-            feat_i_out = attn_weights @ v_proj_i
+        # One projection for all streams => [B, F, heads, S, d_head]
+        k_proj: torch.Tensor = self.key(streams).view(B, num_streams, S, self.num_heads, self.d_head).permute(0, 1, 3, 2, 4)
+        v_proj: torch.Tensor = self.value(streams).view(B, num_streams, S, self.num_heads, self.d_head).permute(0, 1, 3, 2, 4)
 
-            # Gate
-            accumulated_out = accumulated_out + gates[i] * feat_i_out
+        if self.use_rope:
+            # RoPE works on [B', heads, S, d_head], so the streams are folded into the batch
+            k_proj = self.rope(k_proj.reshape(B * num_streams, self.num_heads, S, self.d_head)).view_as(k_proj)
+
+        if self.use_sdpa:
+            dropout_p = self.attention_dropout.p if self.training else 0.0
+            stream_sdpa_mask = sdpa_mask.repeat_interleave(num_streams, dim=0) if sdpa_mask is not None else None
+            out = F.scaled_dot_product_attention(
+                q_scaled.unsqueeze(1).expand_as(k_proj).reshape(B * num_streams, self.num_heads, S, self.d_head),
+                k_proj.reshape(B * num_streams, self.num_heads, S, self.d_head),
+                v_proj.reshape(B * num_streams, self.num_heads, S, self.d_head),
+                attn_mask=stream_sdpa_mask,
+                dropout_p=dropout_p,
+                scale=1.0,
+            ).view(B, num_streams, self.num_heads, S, self.d_head)
+        else:
+            # Queries broadcast over the streams: [B, 1, heads, S, d_head] @ [B, F, heads, d_head, S] => [B, F, heads, S, S]
+            scores = q_proj.unsqueeze(1) @ k_proj.transpose(-2, -1) / self.attention_denom.view(1, 1, -1, 1, 1)
+            if key_mask is not None:
+                scores = scores.masked_fill(key_mask.unsqueeze(1) == 0, float("-inf"))
+            if segment_mask is not None:
+                scores = scores.masked_fill(~segment_mask.unsqueeze(1), float("-inf"))
+            if bias is not None:
+                scores = scores + bias.unsqueeze(1)
 
-        permuted_accumulated_out = accumulated_out.permute(0, 2, 1, 3).reshape(B, T * N, self.lifting_dim)
-        final_out_projection: torch.Tensor = self.out_proj(permuted_accumulated_out)
-        # Unflatten => [B, T, N, d]
-        final_out_reshaped = final_out_projection.view(B, T, N, self.lifting_dim)
+            attn_weights: torch.Tensor = self.attention_dropout(F.softmax(scores, dim=-1))
+            out = attn_weights @ v_proj
 
-        return final_out_reshaped
+        return (gates.view(1, -1, 1, 1, 1) * out).sum(dim=1)
 
 
 @final
@@ -485,6 +978,9 @@ class QuadraticSelfAttention(nn.Module):
         use_spherical_harmonics: bool,
         learnable_attention_denom: bool = False,
         attention_dropout: float = 0.2,
+        use_sdpa: bool = False,
+        query_chunk_size: int | None = None,
+        chunk_memory_budget_mb: float | None = None,
     ) -> None:
         """
         Quadratic self-attention mechanism.
@@ -506,6 +1002,16 @@ class QuadraticSelfAttention(nn.Module):
             by default False.
         attention_dropout : float, optional
             Dropout rate for attention weights, by default 0.2.
+        use_sdpa : bool, optional
+            If True, compute attention with `F.scaled_dot_product_attention` instead of materialising
+            the scores, by default False. The per-head attention denominator is folded into Q, and the masks
+            and spherical harmonics bias are passed as `attn_mask`.
+        query_chunk_size : int | None, optional
+            If given, the math path attends blocks of this many queries at a time (see `chunked_attention`),
+            by default None.
+        chunk_memory_budget_mb : float | None, optional
+            If given and `query_chunk_size` is None, the block size is picked so that a block's intermediates
+            fit this many MiB, by default None.
 
         Attributes
         ----------
@@ -533,9 +1039,13 @@ class QuadraticSelfAttention(nn.Module):
         self.num_timesteps = num_timesteps
         self.use_rope = use_rope
         self.use_spherical_harmonics = use_spherical_harmonics
+        self.use_sdpa = use_sdpa
+        self.query_chunk_size = query_chunk_size
+        self.chunk_memory_budget_mb = chunk_memory_budget_mb
         self.d_head = self.lifting_dim // self.num_heads
 
         assert self.d_head % 2 == 0, "d_head must be even"
+        assert not (use_sdpa and (query_chunk_size is not None or chunk_memory_budget_mb is not None)), "Query chunking only applies to the math path"
 
         self.kv_projs = nn.Linear(lifting_dim, 2 * lifting_dim)
         self.query = nn.Linear(lifting_dim, lifting_dim)
@@ -555,7 +1065,7 @@ class QuadraticSelfAttention(nn.Module):
             self.spherical_harmonics = SphericalHarmonicsAttentionBias(num_timesteps=self.num_timesteps, max_degree=1, num_heads=self.num_heads, hidden_dim=16)
 
     @override
-    def forward(self, tensor: torch.Tensor, mask: torch.Tensor | None) -> torch.Tensor:
+    def forward(self, tensor: torch.Tensor, mask: torch.Tensor | None, segment_ids: torch.Tensor | None = None, node_bias: torch.Tensor | None = None) -> torch.Tensor:
         """Performs self-attention on an input tensor.
 
         Parameters
@@ -568,6 +1078,12 @@ class QuadraticSelfAttention(nn.Module):
             - `d` = feature dimension
         mask : torch.Tensor | None, optional
             Mask of shape `[B, T, N, 1]` to mask attention scores, by default None.
+        segment_ids : torch.Tensor | None, optional
+            Sample index of every node of shape `[B, N]` for packed batches, by default None.
+            Attention is then restricted to tokens of the same sample.
+        node_bias : torch.Tensor | None, optional
+            Spherical harmonics bias between the nodes of shape `[B, heads, N, N]`, computed once by the caller
+            and shared by every pair of timesteps, by default None. Replaces the module's own bias.
 
         Returns
         -------
@@ -586,42 +1102,533 @@ class QuadraticSelfAttention(nn.Module):
             7. Reshape output to `[B, T, N, d]`.
         """
         B, T, N, d = tensor.shape
-        tensor_flat = tensor.view(B, T * N, d)
 
         key_mask_for_scores: torch.Tensor | None = None
-        rope_mask_for_rope: torch.Tensor | None = None
         if mask is not None:
             assert mask.shape == (B, T, N, 1), f"Expected mask shape (B,T,N,1) but got {mask.shape}"
-            reshaped_mask = mask.reshape(B, T * N)
-            key_mask_for_scores = reshaped_mask.unsqueeze(1).unsqueeze(1)  # [B, 1, 1, T*N] for attention scores
-            rope_mask_for_rope = reshaped_mask.unsqueeze(1).unsqueeze(-1)  # [B, 1, T*N, 1] for RoPE
+            key_mask_for_scores = mask.reshape(B, T * N).unsqueeze(1).unsqueeze(1)  # [B, 1, 1, T*N] for attention scores
 
-        q_proj: torch.Tensor = self.query(tensor_flat).view(B, T * N, self.num_heads, self.d_head).permute(0, 2, 1, 3)
+        if segment_ids is not None:
+            assert segment_ids.shape == (B, N), f"Expected segment_ids shape (B,N) but got {segment_ids.shape}"
+
+        q_proj: torch.Tensor = project_tokens(self.query, tensor).view(B, T * N, self.num_heads, self.d_head).permute(0, 2, 1, 3)
 
         if self.use_rope:
-            q_proj = self.rope(q_proj, rope_mask_for_rope)
+            q_proj = self.rope(q_proj)
+
+        spherical_harmonics = self.spherical_harmonics if self.use_spherical_harmonics and node_bias is None else None
+        bytes_per_query = attention_bytes_per_query(B, T * N, self.num_heads, q_proj.element_size(), spherical_harmonics)
+        chunk_size = select_query_chunk_size(T * N, bytes_per_query, self.query_chunk_size, self.chunk_memory_budget_mb)
+
+        # The chunked path builds the segment mask and bias per block, so the [S, S] versions are not needed
+        segment_mask_for_scores: torch.Tensor | None = None
+        if segment_ids is not None and chunk_size == T * N:
+            segment_mask_for_scores = block_diagonal_mask(segment_ids, T)  # [B, 1, T*N, T*N]
 
         spherical_harmonics_bias: torch.Tensor | None = None
-        if self.use_spherical_harmonics:
+        if node_bias is not None:
+            assert node_bias.shape == (B, self.num_heads, N, N), f"Expected node_bias shape (B,heads,N,N) but got {node_bias.shape}"
+            if self.use_sdpa:
+                spherical_harmonics_bias = node_bias.repeat(1, 1, T, T)  # SDPA takes a [B, heads, T*N, T*N] bias
+        elif spherical_harmonics is not None and chunk_size == T * N:
             spherical_harmonics_bias = self.spherical_harmonics(tensor[..., :3])  # Use original tensor for coords
 
-        kv: torch.Tensor = self.kv_projs(tensor_flat)
+        kv: torch.Tensor = project_tokens(self.kv_projs, tensor)
         k_proj, v_proj = torch.chunk(kv, 2, dim=-1)
         k_proj = k_proj.view(B, N * T, self.num_heads, self.d_head).permute(0, 2, 1, 3)
         v_proj = v_proj.view(B, N * T, self.num_heads, self.d_head).permute(0, 2, 1, 3)
 
         if self.use_rope:
-            k_proj = self.rope(k_proj, rope_mask_for_rope)
+            k_proj = self.rope(k_proj)
+
+        if self.use_sdpa:
+            sdpa_mask = sdpa_attention_mask(key_mask_for_scores, segment_mask_for_scores, spherical_harmonics_bias, q_proj.dtype)
+            dropout_p = self.attention_dropout.p if self.training else 0.0
+            # SDPA scales by a scalar, so the per-head denominator is folded into Q
+            q_scaled = q_proj / self.attention_denom.view(1, -1, 1, 1)
+            processed_out = F.scaled_dot_product_attention(q_scaled, k_proj, v_proj, attn_mask=sdpa_mask, dropout_p=dropout_p, scale=1.0)
+        elif chunk_size < T * N:
+            processed_out = chunked_attention(
+                q_proj,
+                k_proj,
+                v_proj,
+                self.attention_denom,
+                key_mask_for_scores,
+                segment_ids.repeat(1, T) if segment_ids is not None else None,  # Time-major, as in block_diagonal_mask
+                tensor[..., :3].reshape(B, T * N, 3) if spherical_harmonics is not None else None,
+                spherical_harmonics,
+                self.attention_dropout,
+                chunk_size,
+                node_bias,
+            )
+        else:
+            scores: torch.Tensor = q_proj @ k_proj.transpose(-2, -1) / self.attention_denom.view(1, -1, 1, 1)
+            if key_mask_for_scores is not None:
+                scores = scores.masked_fill(key_mask_for_scores == 0, float("-inf"))
+            if segment_mask_for_scores is not None:
+                scores = scores.masked_fill(~segment_mask_for_scores, float("-inf"))
+
+            if spherical_harmonics_bias is not None:
+                scores = scores + spherical_harmonics_bias
+            elif node_bias is not None:
+                scores = add_node_bias(scores, node_bias, T)
+
+            attn_weights: torch.Tensor = self.attention_dropout(F.softmax(scores, dim=-1))
+            processed_out = attn_weights @ v_proj
+
+        permuted_processed_out = processed_out.permute(0, 2, 1, 3).reshape(B, T * N, self.lifting_dim)
+        final_out_projection: torch.Tensor = self.out_proj(permuted_processed_out).view(B, T, N, self.lifting_dim)
+        return final_out_projection
+
+
+@final
+class FactorizedSpatioTemporalAttention(nn.Module):
+    def __init__(
+        self,
+        num_heads: int,
+        num_timesteps: int,
+        lifting_dim: int,
+        use_rope: bool,
+        use_spherical_harmonics: bool,
+        learnable_attention_denom: bool = False,
+        attention_dropout: float = 0.2,
+        use_sdpa: bool = False,
+        rope_base: float = 1000.0,
+    ) -> None:
+        """
+        Factorized spatio-temporal self-attention.
+
+        Instead of attending over the flattened `T*N` sequence, spatial attention over the N nodes of
+        each timestep is followed by temporal attention over the T timesteps of each node, with a residual
+        connection in between. This costs `O(T*N^2 + N*T^2)` instead of `O(T^2*N^2)`.
+
+        Parameters
+        ----------
+        num_heads : int
+            Number of attention heads.
+        num_timesteps : int
+            Number of timesteps, used for RoPE.
+        lifting_dim : int
+            Dimension for Q, K, V.
+        use_rope : bool
+            If True, apply RoPE to Q and K of the temporal attention. Every token of a spatial attention
+            shares its timestep, so RoPE would cancel out there and is not applied.
+        use_spherical_harmonics : bool
+            If True, add spherical harmonics bias to the spatial attention scores.
+        learnable_attention_denom : bool, optional
+            If True, the attention denominators are learnable, by default False.
+        attention_dropout : float, optional
+            Dropout rate for attention weights, by default 0.2.
+        use_sdpa : bool, optional
+            If True, compute attention with `F.scaled_dot_product_attention`, by default False.
+        rope_base : float, optional
+            Base of the RoPE frequencies, by default 1000.0.
+
+        Attributes
+        ----------
+        spatial_qkv, temporal_qkv : nn.Linear
+            Linear layers for the combined query, key and value projections.
+        spatial_out_proj, temporal_out_proj : nn.Linear
+            Linear layers for the output projections.
+        spatial_attention_denom, temporal_attention_denom : nn.Parameter or torch.Tensor
+            Attention denominators.
+        rope : TemporalRoPEWithOffset, optional
+            RoPE module.
+        spherical_harmonics : SphericalHarmonicsAttentionBias, optional
+            Spherical harmonics bias module.
 
-        scores: torch.Tensor = q_proj @ k_proj.transpose(-2, -1) / self.attention_denom.view(1, -1, 1, 1)
-        if key_mask_for_scores is not None:
-            scores = scores.masked_fill(key_mask_for_scores == 0, float("-inf"))
+        Raises
+        ------
+        AssertionError
+            If `d_head` (lifting_dim / num_heads) is not even.
+        """
+        super().__init__()
+        self.num_heads = num_heads
+        self.lifting_dim = lifting_dim
+        self.num_timesteps = num_timesteps
+        self.use_rope = use_rope
+        self.rope_base = rope_base
+        self.use_spherical_harmonics = use_spherical_harmonics
+        self.use_sdpa = use_sdpa
+        self.d_head = self.lifting_dim // self.num_heads
+
+        assert self.d_head % 2 == 0, "d_head must be even"
+
+        self.spatial_qkv = nn.Linear(lifting_dim, 3 * lifting_dim)
+        self.temporal_qkv = nn.Linear(lifting_dim, 3 * lifting_dim)
+        self.spatial_out_proj = nn.Linear(lifting_dim, lifting_dim)
+        self.temporal_out_proj = nn.Linear(lifting_dim, lifting_dim)
+        self.attention_dropout = nn.Dropout(attention_dropout)
 
-        if self.use_spherical_harmonics and spherical_harmonics_bias is not None:
-            scores = scores + spherical_harmonics_bias
+        denom_init = torch.full((num_heads,), float(self.d_head))
+        if learnable_attention_denom:
+            self.spatial_attention_denom = nn.Parameter(denom_init.clone())
+            self.temporal_attention_denom = nn.Parameter(denom_init.clone())
+        else:
+            self.register_buffer("spatial_attention_denom", denom_init.clone(), persistent=False)
+            self.register_buffer("temporal_attention_denom", denom_init.clone(), persistent=False)
+
+        if use_rope:
+            self.rope = TemporalRoPEWithOffset(num_timesteps=self.num_timesteps, d_head=self.d_head, n_heads=self.num_heads, base=self.rope_base, learnable_offset=False)
+
+        if use_spherical_harmonics:
+            self.spherical_harmonics = SphericalHarmonicsAttentionBias(num_timesteps=1, max_degree=1, num_heads=self.num_heads, hidden_dim=16)
+
+    @override
+    def forward(self, tensor: torch.Tensor, mask: torch.Tensor | None, segment_ids: torch.Tensor | None = None, node_bias: torch.Tensor | None = None) -> torch.Tensor:
+        """Performs spatial attention per timestep, then temporal attention per node.
+
+        Parameters
+        ----------
+        tensor : torch.Tensor
+            Input tensor of shape `[B, T, N, d]`.
+        mask : torch.Tensor | None, optional
+            Mask of shape `[B, T, N, 1]` to mask the keys of the spatial attention, by default None.
+        segment_ids : torch.Tensor | None, optional
+            Sample index of every node of shape `[B, N]` for packed batches, by default None.
+        node_bias : torch.Tensor | None, optional
+            Spherical harmonics bias between the nodes of shape `[B, heads, N, N]`, computed once by the caller
+            and shared by every timestep, by default None. Replaces the module's own bias.
+
+        Returns
+        -------
+        torch.Tensor
+            Output tensor of shape `[B, T, N, d]`, the sum of both attention updates, so that adding it
+            to the input gives `y = x + spatial(x)` followed by `y + temporal(y)`.
+
+        Notes
+        -----
+        The temporal attention of a node only sees that node, so it needs neither the padding mask
+        (a padded node attends to its own, finite, features) nor the packed segments.
+        """
+        B, T, N, d = tensor.shape
+
+        # 1) Spatial: every timestep is a sequence of N nodes => [B*T, heads, N, d_head]
+        key_mask: torch.Tensor | None = None
+        if mask is not None:
+            assert mask.shape == (B, T, N, 1), f"Expected mask shape (B,T,N,1) but got {mask.shape}"
+            key_mask = mask.reshape(B * T, 1, 1, N)
+        segment_mask: torch.Tensor | None = None
+        if segment_ids is not None:
+            assert segment_ids.shape == (B, N), f"Expected segment_ids shape (B,N) but got {segment_ids.shape}"
+            segment_mask = block_diagonal_mask(segment_ids, 1).repeat_interleave(T, dim=0)  # [B*T, 1, N, N]
+        spherical_harmonics_bias: torch.Tensor | None = None
+        if node_bias is not None:
+            assert node_bias.shape == (B, self.num_heads, N, N), f"Expected node_bias shape (B,heads,N,N) but got {node_bias.shape}"
+            spherical_harmonics_bias = node_bias.repeat_interleave(T, dim=0)  # [B*T, heads, N, N]
+        elif self.use_spherical_harmonics:
+            spherical_harmonics_bias = self.spherical_harmonics(tensor[..., :3].reshape(B * T, 1, N, 3))  # [B*T, heads, N, N]
+
+        q, k, v = self._split_heads(self.spatial_qkv(tensor.reshape(B * T, N, d)))
+        spatial_out = self._attend(q, k, v, self.spatial_attention_denom, key_mask, segment_mask, spherical_harmonics_bias)
+        spatial_out = self.spatial_out_proj(spatial_out.permute(0, 2, 1, 3).reshape(B, T, N, self.lifting_dim))
+
+        # 2) Temporal: every node is a sequence of T timesteps => [B*N, heads, T, d_head]
+        mixed = (tensor + spatial_out).permute(0, 2, 1, 3).reshape(B * N, T, d)
+        q, k, v = self._split_heads(self.temporal_qkv(mixed))
+        if self.use_rope:
+            # A sequence of one node per timestep, so the RoPE positions are the timesteps
+            q = self.rope(q)
+            k = self.rope(k)
+        temporal_out = self._attend(q, k, v, self.temporal_attention_denom, None, None, None)
+        temporal_out = self.temporal_out_proj(temporal_out.permute(0, 2, 1, 3).reshape(B, N, T, self.lifting_dim)).permute(0, 2, 1, 3)
+
+        return spatial_out + temporal_out
+
+    def _split_heads(self, qkv: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Split a `[B', L, 3*d]` projection into Q, K and V of shape `[B', heads, L, d_head]`."""
+        B, L, _ = qkv.shape
+        q, k, v = qkv.view(B, L, 3, self.num_heads, self.d_head).permute(2, 0, 3, 1, 4).unbind(0)
+        return q, k, v
+
+    def _attend(
+        self,
+        q: torch.Tensor,
+        k: torch.Tensor,
+        v: torch.Tensor,
+        attention_denom: torch.Tensor,
+        key_mask: torch.Tensor | None,
+        segment_mask: torch.Tensor | None,
+        bias: torch.Tensor | None,
+    ) -> torch.Tensor:
+        """Masked multi-head attention of `[B', heads, L, d_head]` tensors, with either backend."""
+        if self.use_sdpa:
+            sdpa_mask = sdpa_attention_mask(key_mask, segment_mask, bias, q.dtype)
+            dropout_p = self.attention_dropout.p if self.training else 0.0
+            return F.scaled_dot_product_attention(q / attention_denom.view(1, -1, 1, 1), k, v, attn_mask=sdpa_mask, dropout_p=dropout_p, scale=1.0)
+
+        scores = q @ k.transpose(-2, -1) / attention_denom.view(1, -1, 1, 1)
+        if key_mask is not None:
+            scores = scores.masked_fill(key_mask == 0, float("-inf"))
+        if segment_mask is not None:
+            scores = scores.masked_fill(~segment_mask, float("-inf"))
+        if bias is not None:
+            scores = scores + bias
 
         attn_weights: torch.Tensor = self.attention_dropout(F.softmax(scores, dim=-1))
-        processed_out = attn_weights @ v_proj
+        return attn_weights @ v
+
+
+@final
+class SparseNeighbourAttention(nn.Module):
+    def __init__(
+        self,
+        num_heads: int,
+        num_timesteps: int,
+        lifting_dim: int,
+        use_rope: bool,
+        use_spherical_harmonics: bool,
+        learnable_attention_denom: bool = False,
+        attention_dropout: float = 0.2,
+        rope_base: float = 1000.0,
+    ) -> None:
+        """
+        Neighbour-restricted self-attention over an explicit list of (query, key) token pairs.
+
+        Scores are only computed for the pairs of `token_neighbour_pairs`, then normalised with a segment
+        softmax over the keys of every query, so time and memory are linear in the number of pairs instead of
+        quadratic in `T*N`.
+
+        Parameters
+        ----------
+        num_heads : int
+            Number of attention heads.
+        num_timesteps : int
+            Number of timesteps, used for RoPE.
+        lifting_dim : int
+            Dimension for Q, K, V.
+        use_rope : bool
+            If True, apply RoPE to Q and K.
+        use_spherical_harmonics : bool
+            If True, add spherical harmonics bias to the score of every pair.
+        learnable_attention_denom : bool, optional
+            If True, the attention denominator (sqrt(d_head)) is learnable,
+            by default False.
+        attention_dropout : float, optional
+            Dropout rate for attention weights, by default 0.2.
+        rope_base : float, optional
+            Base of the RoPE frequencies, by default 1000.0.
+
+        Attributes
+        ----------
+        kv_projs : nn.Linear
+            Linear layer for combined key and value projections.
+        query : nn.Linear
+            Linear layer for query projection.
+        out_proj : nn.Linear
+            Linear layer for output projection.
+        attention_denom : nn.Parameter or torch.Tensor
+            Attention denominator.
+        rope : TemporalRoPEWithOffset, optional
+            RoPE module.
+        spherical_harmonics : SphericalHarmonicsAttentionBias, optional
+            Spherical harmonics bias module.
+
+        Raises
+        ------
+        AssertionError
+            If `d_head` (lifting_dim / num_heads) is not even.
+        """
+        super().__init__()
+        self.num_heads = num_heads
+        self.lifting_dim = lifting_dim
+        self.num_timesteps = num_timesteps
+        self.use_rope = use_rope
+        self.rope_base = rope_base
+        self.use_spherical_harmonics = use_spherical_harmonics
+        self.d_head = self.lifting_dim // self.num_heads
+
+        assert self.d_head % 2 == 0, "d_head must be even"
+
+        self.kv_projs = nn.Linear(lifting_dim, 2 * lifting_dim)
+        self.query = nn.Linear(lifting_dim, lifting_dim)
+        self.out_proj = nn.Linear(lifting_dim, lifting_dim)
+        self.attention_dropout = nn.Dropout(attention_dropout)
+
+        denom_init = torch.full((num_heads,), float(self.d_head))
+        if learnable_attention_denom:
+            self.attention_denom = nn.Parameter(denom_init)
+        else:
+            self.register_buffer("attention_denom", denom_init, persistent=False)
+
+        if use_rope:
+            self.rope = TemporalRoPEWithOffset(num_timesteps=self.num_timesteps, d_head=self.d_head, n_heads=self.num_heads, base=self.rope_base, learnable_offset=False)
+
+        if use_spherical_harmonics:
+            self.spherical_harmonics = SphericalHarmonicsAttentionBias(num_timesteps=self.num_timesteps, max_degree=1, num_heads=self.num_heads, hidden_dim=16)
+
+    @override
+    def forward(self, tensor: torch.Tensor, neighbour_pairs: tuple[torch.Tensor, torch.Tensor], node_bias: torch.Tensor | None = None) -> torch.Tensor:
+        """Performs self-attention restricted to the given token pairs.
+
+        Parameters
+        ----------
+        tensor : torch.Tensor
+            Input tensor of shape `[B, T, N, d]`.
+        neighbour_pairs : tuple[torch.Tensor, torch.Tensor]
+            Query and key indices into the `B*T*N` flattened tokens, from `token_neighbour_pairs`.
+            Padded nodes have no edges, so real tokens never attend to them and no padding mask is needed.
+        node_bias : torch.Tensor | None, optional
+            Spherical harmonics bias between the nodes of shape `[B, heads, N, N]`, computed once by the caller
+            and shared by every pair of timesteps, by default None. Replaces the module's own bias.
+
+        Returns
+        -------
+        torch.Tensor
+            Output tensor of shape `[B, T, N, d]`.
+        """
+        B, T, N, d = tensor.shape
+        num_tokens = B * T * N
+        query_index, key_index = neighbour_pairs
+        tensor_flat = tensor.reshape(B, T * N, d)
+
+        q_proj: torch.Tensor = self.query(tensor_flat).view(B, T * N, self.num_heads, self.d_head).permute(0, 2, 1, 3)
+        k_proj, v_proj = torch.chunk(self.kv_projs(tensor_flat), 2, dim=-1)
+        k_proj = k_proj.reshape(B, T * N, self.num_heads, self.d_head).permute(0, 2, 1, 3)
+        if self.use_rope:
+            q_proj = self.rope(q_proj)
+            k_proj = self.rope(k_proj)
+
+        # One row per token => [B*T*N, heads, d_head]
+        q_tokens = q_proj.permute(0, 2, 1, 3).reshape(num_tokens, self.num_heads, self.d_head)
+        k_tokens = k_proj.permute(0, 2, 1, 3).reshape(num_tokens, self.num_heads, self.d_head)
+        v_tokens = v_proj.reshape(num_tokens, self.num_heads, self.d_head)
+
+        scores = (q_tokens[query_index] * k_tokens[key_index]).sum(dim=-1) / self.attention_denom  # [num_pairs, heads]
+        if node_bias is not None:
+            assert node_bias.shape == (B, self.num_heads, N, N), f"Expected node_bias shape (B,heads,N,N) but got {node_bias.shape}"
+            # Flat token b*T*N + t*N + n => (b, n)
+            scores = scores + node_bias.permute(0, 2, 3, 1)[query_index // (T * N), query_index % N, key_index % N]
+        elif self.use_spherical_harmonics:
+            coords = tensor[..., :3].reshape(num_tokens, 3)  # Use original tensor for coords, as the dense attention does
+            scores = scores + self.spherical_harmonics.bias_from_relative(coords[query_index] - coords[key_index])
+
+        attn_weights = self.attention_dropout(segment_softmax(scores, query_index, num_tokens))
+        weighted_values = attn_weights.unsqueeze(-1) * v_tokens[key_index]  # [num_pairs, heads, d_head]
+        processed_out = weighted_values.new_zeros(num_tokens, self.num_heads, self.d_head).index_add(0, query_index, weighted_values)
+
+        final_out_projection: torch.Tensor = self.out_proj(processed_out.view(B, T * N, self.lifting_dim)).view(B, T, N, self.lifting_dim)
+        return final_out_projection
+
+
+@final
+class LinearKernelAttention(nn.Module):
+    def __init__(self, num_heads: int, num_timesteps: int, lifting_dim: int, use_rope: bool, rope_base: float = 1000.0, eps: float = 1e-6) -> None:
+        """
+        Linear-complexity self-attention with the ELU + 1 kernel.
+
+        Replaces `softmax(Q·K^T)` with `phi(Q)·phi(K)^T`, normalised per query, where `phi(x) = elu(x) + 1` is positive.
+        Summing `phi(K)^T·V` over the keys first costs `O(S * d_head^2)` per head instead of `O(S^2 * d_head)`.
+
+        Parameters
+        ----------
+        num_heads : int
+            Number of attention heads.
+        num_timesteps : int
+            Number of timesteps, used for RoPE.
+        lifting_dim : int
+            Dimension for Q, K, V.
+        use_rope : bool
+            If True, rotate `phi(Q)` and `phi(K)` in the numerator only. The rotations then only enter through
+            the relative time between query and key, while the denominator keeps the unrotated, positive kernel.
+        rope_base : float, optional
+            Base of the RoPE frequencies, by default 1000.0.
+        eps : float, optional
+            Added to the normaliser for numerical stability, by default 1e-6.
+
+        Attributes
+        ----------
+        kv_projs : nn.Linear
+            Linear layer for combined key and value projections.
+        query : nn.Linear
+            Linear layer for query projection.
+        out_proj : nn.Linear
+            Linear layer for output projection.
+        rope : TemporalRoPEWithOffset, optional
+            RoPE module.
+
+        Raises
+        ------
+        AssertionError
+            If `d_head` (lifting_dim / num_heads) is not even.
+
+        Notes
+        -----
+        The attention weights are never materialised, so there is no attention dropout and no additive
+        bias such as the spherical harmonics bias.
+        """
+        super().__init__()
+        self.num_heads = num_heads
+        self.lifting_dim = lifting_dim
+        self.num_timesteps = num_timesteps
+        self.use_rope = use_rope
+        self.rope_base = rope_base
+        self.eps = eps
+        self.d_head = self.lifting_dim // self.num_heads
+
+        assert self.d_head % 2 == 0, "d_head must be even"
+
+        self.kv_projs = nn.Linear(lifting_dim, 2 * lifting_dim)
+        self.query = nn.Linear(lifting_dim, lifting_dim)
+        self.out_proj = nn.Linear(lifting_dim, lifting_dim)
+
+        if use_rope:
+            self.rope = TemporalRoPEWithOffset(num_timesteps=self.num_timesteps, d_head=self.d_head, n_heads=self.num_heads, base=self.rope_base, learnable_offset=False)
+
+    @override
+    def forward(self, tensor: torch.Tensor, mask: torch.Tensor | None, segment_ids: torch.Tensor | None = None) -> torch.Tensor:
+        """Performs linear kernel self-attention on an input tensor.
+
+        Parameters
+        ----------
+        tensor : torch.Tensor
+            Input tensor of shape `[B, T, N, d]`.
+        mask : torch.Tensor | None, optional
+            Mask of shape `[B, T, N, 1]`. The feature maps of padded keys are zeroed, so they add nothing to either
+            the numerator or the normaliser.
+        segment_ids : torch.Tensor | None, optional
+            Sample index of every node of shape `[B, N]` for packed batches, by default None.
+            The key sums are then taken per sample.
+
+        Returns
+        -------
+        torch.Tensor
+            Output tensor of shape `[B, T, N, d]`.
+        """
+        B, T, N, d = tensor.shape
+        tensor_flat = tensor.reshape(B, T * N, d)
+
+        q_proj: torch.Tensor = self.query(tensor_flat).view(B, T * N, self.num_heads, self.d_head).permute(0, 2, 1, 3)
+        k_proj, v_proj = torch.chunk(self.kv_projs(tensor_flat), 2, dim=-1)
+        k_proj = k_proj.reshape(B, T * N, self.num_heads, self.d_head).permute(0, 2, 1, 3)
+        v_proj = v_proj.reshape(B, T * N, self.num_heads, self.d_head).permute(0, 2, 1, 3)
+
+        # Positive feature maps => [B, heads, S, d_head]
+        q_features = F.elu(q_proj) + 1
+        k_features = F.elu(k_proj) + 1
+        if mask is not None:
+            assert mask.shape == (B, T, N, 1), f"Expected mask shape (B,T,N,1) but got {mask.shape}"
+            k_features = k_features * mask.reshape(B, 1, T * N, 1)
+
+        q_rotated, k_rotated = q_features, k_features
+        if self.use_rope:
+            q_rotated = self.rope(q_features)
+            k_rotated = self.rope(k_features)
+
+        if segment_ids is None:
+            kv = k_rotated.transpose(-2, -1) @ v_proj  # [B, heads, d_head, d_head]
+            numerator = q_rotated @ kv  # [B, heads, S, d_head]
+            normaliser = q_features @ k_features.sum(dim=2).unsqueeze(-1)  # [B, heads, S, 1]
+        else:
+            assert segment_ids.shape == (B, N), f"Expected segment_ids shape (B,N) but got {segment_ids.shape}"
+            # One-hot sample membership of every token => [B, S, G]
+            membership = F.one_hot(segment_ids.repeat(1, T), num_classes=int(segment_ids.max()) + 1).to(q_features.dtype)
+            kv = torch.einsum("bsg,bhsd,bhse->bhgde", membership, k_rotated, v_proj)  # [B, heads, G, d_head, d_head]
+            numerator = torch.einsum("bhsd,bsg,bhgde->bhse", q_rotated, membership, kv)
+            k_sums = torch.einsum("bsg,bhsd->bhgd", membership, k_features)  # [B, heads, G, d_head]
+            normaliser = torch.einsum("bhsd,bsg,bhgd->bhs", q_features, membership, k_sums).unsqueeze(-1)
+
+        processed_out = numerator / (normaliser + self.eps)
 
         permuted_processed_out = processed_out.permute(0, 2, 1, 3).reshape(B, T * N, self.lifting_dim)
         final_out_projection: torch.Tensor = self.out_proj(permuted_processed_out).view(B, T, N, self.lifting_dim)
@@ -0,0 +1,53 @@
+import time
+
+import torch
+from e3nn import o3
+from torch.utils.flop_counter import FlopCounterMode
+
+from atom.atom.atom_model import channelwise_tensor_product, get_lifting_dim_irreps
+
+
+def time_product(product: torch.nn.Module, inputs: list[torch.Tensor], repeats: int = 20, backward: bool = True) -> float:
+    """Median latency of one tensor product (forward, and backward if requested), in seconds."""
+    times: list[float] = []
+    for _ in range(repeats + 3):  # The first calls warm up the kernels and the allocator
+        if inputs[0].is_cuda:
+            torch.cuda.synchronize()
+        start_time = time.perf_counter()
+        with torch.set_grad_enabled(backward):
+            out = product(*inputs)
+            if backward:
+                out.sum().backward()
+        if inputs[0].is_cuda:
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start_time)
+    return sorted(times[3:])[repeats // 2]
+
+
+def count_flops(product: torch.nn.Module, inputs: list[torch.Tensor]) -> int:
+    """FLOPs of one forward pass, as counted by torch's flop counter."""
+    with torch.no_grad(), FlopCounterMode(display=False) as counter:
+        _ = product(*inputs)
+    return counter.get_total_flops()
+
+
+if __name__ == "__main__":
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    batch_size, num_timesteps, num_nodes = 16, 8, 21
+
+    # Lifting of the concatenated features: EQUIVARIANT against CHANNELWISE, on lifted x_0 and vz_0
+    print(f"Device: {device}, B={batch_size}, T={num_timesteps}, N={num_nodes}")
+    print(f"{'d':>5} {'product':>12} {'weights':>8} {'GFLOPs':>8} {'fwd+bwd (ms)':>13} {'speedup':>9}")
+    for lifting_dim in [64, 128, 256]:
+        irreps = get_lifting_dim_irreps(lifting_dim)
+        inputs = [torch.randn(batch_size, num_timesteps, num_nodes, o3.Irreps(irreps).dim, device=device, requires_grad=True) for _ in range(2)]
+        products = {
+            "full": o3.FullyConnectedTensorProduct(irreps, irreps, irreps).to(device),
+            "channelwise": channelwise_tensor_product(irreps).to(device),
+        }
+
+        reference_time: float | None = None
+        for name, product in products.items():
+            latency = time_product(product, inputs)
+            reference_time = reference_time or latency
+            print(f"{lifting_dim:>5} {name:>12} {product.weight_numel:>8} {count_flops(product, inputs) / 1e9:>8.3f} {latency * 1e3:>13.3f} {reference_time / latency:>8.2f}x")
@@ -2,11 +2,13 @@ import numpy as np
 import numpy.typing as npt
 import torch
 import pickle as pkl
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import ConcatDataset, Dataset, DataLoader
 import os
 from typing import final, override
 from pathlib import Path
 import torch.nn.functional as F
+from atom.dataloaders.dataset_cache import DatasetCache
+from atom.dataloaders.trajectory_store import SampledTrajectory, TrajectoryStore
 from atom.training.config_options import DataPartition, Datasets, MD17MoleculeType, RMD17MoleculeType, TG80MoleculeType
 
 
@@ -15,6 +17,9 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
     MD17 Dataset
     """
 
+    # Above this many atoms, radius graphs are built with a cell list as sparse COO adjacency instead of dense N x N matrices
+    DENSE_ADJACENCY_MAX_ATOMS: int = 512
+
     def __init__(
         self,
         partition: DataPartition,
@@ -39,6 +44,10 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         force_regenerate: bool = False,
         verbose: bool = False,
         max_edges: int | None = None,  # Maximum number of edges to pad to
+        cache_dir: str | None = None,
+        cache_max_gb: float = 20.0,
+        replicate_timesteps: bool = True,
+        resample_windows: bool = False,
     ):
         """
         Args:
@@ -52,7 +61,16 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
             val_par (float): The percentage of the data to use for validation.
             test_par (float): The percentage of the data to use for testing.
             num_timesteps (int): Number of timesteps for replication.
+            cache_dir (str | None): Directory of the processed dataset cache. If None, the dataset is always processed from the raw data.
+            cache_max_gb (float): Size budget of the processed dataset cache, beyond which least recently used entries are evicted.
+            replicate_timesteps (bool): If True, initial conditions are stored and returned as [num_timesteps, N, d] copies.
+                If False, only the [N, d] initial state is stored and returned, and the consumer broadcasts it over time on device.
+            resample_windows (bool): If True, every fetched sample starts at a fresh frame drawn from the whole train split,
+                and its targets are read from a float32 copy of the trajectory segment covering that split. The dataset
+                length stays max_samples, so an epoch costs the same but never replays the same windows. Train partition only.
         """
+        if resample_windows and partition != DataPartition.train:
+            raise ValueError(f"resample_windows is only supported for the train partition, got {partition}")
         self.partition: DataPartition = partition
         self.md17_version: Datasets = md17_version
         self.molecule_type: MD17MoleculeType | RMD17MoleculeType | TG80MoleculeType = molecule_type
@@ -67,6 +85,8 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         self.normalize_z: bool = normalize_z
         self.egno_mode: bool = egno_mode
         self.max_edges: int | None = max_edges
+        self.replicate_timesteps: bool = replicate_timesteps
+        self.resample_windows: bool = resample_windows
         match md17_version:
             case Datasets.md17:
                 full_dir = os.path.join(data_dir + "md17_npz/" + "md17_" + molecule_type + ".npz")
@@ -95,16 +115,93 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
             case _:
                 raise ValueError(f"Invalid MD17 version: {md17_version}")
 
-        data_file: np.lib.npyio.NpzFile = np.load(full_dir)
-        self.x: npt.NDArray[np.float64] = data_file[positions_col]
-        self.z: npt.NDArray[np.uint8] = data_file[charges_col]
-        self.v: npt.NDArray[np.float64] = self.x[1:] - self.x[:-1]  # Construct velocities from successive coords
-        self.x = self.x[:-1]  # Remove last coord to ensure len(x) == len(v)
-        assert self.x.shape == self.v.shape
+        self.dataset_cache: DatasetCache | None = DatasetCache(Path(cache_dir), cache_max_gb) if cache_dir is not None else None
+        cache_key = ""
+        if self.dataset_cache is not None:
+            cache_key = DatasetCache.make_key(
+                dataset_class=type(self).__name__,
+                dataset=md17_version,
+                molecule=molecule_type,
+                partition=partition,
+                max_samples=max_samples,
+                delta_frame=delta_frame,
+                num_timesteps=num_timesteps,
+                explicit_hydrogen=explicit_hydrogen,
+                radius_graph_threshold=radius_graph_threshold,
+                rrwp_length=rrwp_length,
+                normalize_z=normalize_z,
+                egno_mode=egno_mode,
+                return_edge_data=return_edge_data,
+                max_nodes=max_nodes,
+                max_edges=max_edges,
+                train_par=train_par,
+                val_par=val_par,
+                test_par=test_par,
+                seed=seed,
+                resample_windows=resample_windows,
+                source_file=DatasetCache.file_fingerprint(Path(full_dir)),
+                # A regenerated split is fully determined by the seed; a split loaded from disk is determined by the file
+                split_file=None if force_regenerate else DatasetCache.file_fingerprint(Path(split_dir)),
+            )
+
+        cached_tensors = self.dataset_cache.load(cache_key) if self.dataset_cache is not None else None
+        if cached_tensors is not None:
+            print(f"Loaded processed {md17_version} {molecule_type} {partition} dataset from cache") if self.verbose else None
+            self._restore_processed_tensors(cached_tensors)
+        else:
+            self._load_and_process(
+                full_dir=full_dir,
+                split_dir=split_dir,
+                positions_col=positions_col,
+                charges_col=charges_col,
+                explicit_hydrogen=explicit_hydrogen,
+                train_par=train_par,
+                val_par=val_par,
+                test_par=test_par,
+                seed=seed,
+                force_regenerate=force_regenerate,
+            )
+            if self.dataset_cache is not None:
+                self.dataset_cache.save(cache_key, self._processed_tensors())
+
+        # --- Precompute Replication ---
+        # Shape: [max_samples, num_timesteps, nodes, d]
+        self.replicated_x_0: torch.Tensor = self._replicate_tensor(self.x_0)
+        self.replicated_v_0: torch.Tensor = self._replicate_tensor(self.v_0)
+        self.replicated_concatenated_features: torch.Tensor = self._replicate_tensor(self.concatenated_features)
+        self.replicated_z_0: torch.Tensor = self._replicate_tensor(self.z_0)
+
+        # Assert that self.replicated_x_0 contains identical data across all timesteps
+        # This means for each sample, all timesteps should have the same initial positions
+        if self.num_timesteps > 1 and self.replicate_timesteps:
+            # Get the first timestep data
+            first_timestep_data = self.replicated_x_0[0]
+
+            # Check that all other timesteps have identical data
+            for t in range(1, self.num_timesteps):
+                assert torch.allclose(self.replicated_x_0[0][t], first_timestep_data), f"Initial positions (x_0) at timestep {t} differ from timestep 0. " f"Shape: {self.replicated_x_0.shape}"
+
+    def _load_and_process(
+        self,
+        full_dir: str,
+        split_dir: str,
+        positions_col: str,
+        charges_col: str,
+        explicit_hydrogen: bool,
+        train_par: float,
+        val_par: float,
+        test_par: float,
+        seed: int,
+        force_regenerate: bool,
+    ) -> None:
+        """Load the raw trajectory, select the split and compute every processed tensor."""
+        positions, z = TrajectoryStore.load(full_dir, positions_col, charges_col)
+        # The last frame has no successor to construct a velocity from, so it cannot be sampled
+        num_frames = positions.shape[0] - 1
 
         split = self._get_or_generate_split(
             split_dir=Path(split_dir),
-            x=self.x,
+            num_frames=num_frames,
             train_par=train_par,
             val_par=val_par,
             test_par=test_par,
@@ -112,7 +209,7 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
             seed=seed,
         )
 
-        match partition:
+        match self.partition:
             case DataPartition.train:
                 split_times = split[0]
             case DataPartition.val:
@@ -120,47 +217,120 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
             case DataPartition.test:
                 split_times = split[2]
             case _:
-                raise ValueError(f"Invalid partition: {partition}")
+                raise ValueError(f"Invalid partition: {self.partition}")
 
-        self.split_times = split_times[:max_samples]
+        self.split_times = split_times[: self.max_samples]
 
         # Remove hydrogens if specified
+        self.z: npt.NDArray[np.uint8] = z
+        heavy_atom_mask = None
         if not explicit_hydrogen:
             heavy_atom_mask = self.z > 1
-            self.x = self.x[:, heavy_atom_mask, ...]
-            self.v = self.v[:, heavy_atom_mask, ...]
             self.z = self.z[heavy_atom_mask]
 
-        if egno_mode is True:
-            self.cfg = self._sample_cfg()
+        # Gather only the frames that the radius graph (frame 0), initial conditions and targets reference
+        offsets = self.target_frame_offsets()
+        frames = np.concatenate([[0], (self.split_times[:, np.newaxis] + offsets[np.newaxis, :]).ravel()])
+        self.trajectory: SampledTrajectory = SampledTrajectory(positions, frames, heavy_atom_mask)
 
-        self.process_data(self.split_times, self.x, self.v, self.z)
+        if self.egno_mode is True:
+            self.cfg = self._sample_cfg()
 
-        # --- Precompute Replication ---
-        # Shape: [max_samples, num_timesteps, nodes, d]
-        self.replicated_x_0: torch.Tensor = self._replicate_tensor(self.x_0)
-        self.replicated_v_0: torch.Tensor = self._replicate_tensor(self.v_0)
-        self.replicated_concatenated_features: torch.Tensor = self._replicate_tensor(self.concatenated_features)
-        self.replicated_z_0: torch.Tensor = self._replicate_tensor(self.z_0)
+        self.process_data(self.split_times, self.trajectory, self.z)
+        self.process_targets()
+        del self.trajectory
 
-        # Assert that self.replicated_x_0 contains identical data across all timesteps
-        # This means for each sample, all timesteps should have the same initial positions
-        if self.num_timesteps > 1:
-            # Get the first timestep data
-            first_timestep_data = self.replicated_x_0[0]
+        if self.resample_windows:
+            # Windows may start at any frame of the split, not only the first max_samples
+            self._gather_window_segment(positions, split_times, heavy_atom_mask)
 
-            # Check that all other timesteps have identical data
-            for t in range(1, self.num_timesteps):
-                assert torch.allclose(self.replicated_x_0[0][t], first_timestep_data), f"Initial positions (x_0) at timestep {t} differ from timestep 0. " f"Shape: {self.replicated_x_0.shape}"
+    def _gather_window_segment(self, positions: npt.NDArray[np.float64], start_frames: npt.NDArray[np.int_], atom_mask: npt.NDArray[np.bool_] | None) -> None:
+        """Keep the contiguous float32 trajectory segment read by windows starting at any of start_frames.
 
-    def process_data(self, split_times: npt.NDArray[np.int_], x: npt.NDArray[np.float64], v: npt.NDArray[np.float64], z: npt.NDArray[np.uint8]):
+        Args:
+            positions: Full trajectory of shape (frames, atoms, 3)
+            start_frames: Every start frame of the partition's split
+            atom_mask: Atoms to keep, or None to keep all atoms
+        """
+        first_frame = int(start_frames.min())
+        last_frame = int(start_frames.max() + self.target_frame_offsets().max())
+        segment = positions[first_frame : last_frame + 2]  # One extra frame for the velocity of the last frame
+        if atom_mask is not None:
+            segment = segment[:, atom_mask, ...]
+
+        self.window_start_frames: torch.Tensor = torch.as_tensor(start_frames, dtype=torch.long)
+        self.segment_first_frame: int = first_frame
+        # Velocities are differenced in float64 before the cast, as in the fixed-window path
+        self.segment_x: torch.Tensor = torch.Tensor(segment[:-1])
+        self.segment_v: torch.Tensor = torch.Tensor(segment[1:] - segment[:-1])
+
+    def target_frame_offsets(self) -> npt.NDArray[np.int_]:
+        """Offsets from each split time of every frame the initial conditions and targets are read from."""
+        return np.array([0, self.delta_frame])
+
+    def process_targets(self) -> None:
+        """Hook for subclasses that predict targets other than the single frame computed in process_data."""
+        pass
+
+    def _processed_tensors(self) -> dict[str, object]:
+        """Collect the processed tensors that fully describe this dataset, for the dataset cache."""
+        processed: dict[str, object] = {
+            "x_0": self.x_0,
+            "v_0": self.v_0,
+            "x_t": self.x_t,
+            "v_t": self.v_t,
+            "z_0": self.z_0,
+            "concatenated_features": self.concatenated_features,
+            "mole_idx": self.mole_idx,
+            "split_times": torch.from_numpy(np.asarray(self.split_times)),
+            "num_nodes": self.num_nodes,
+            "num_one_hop_edges": self.num_one_hop_edges,
+        }
+        if hasattr(self, "edge_attr"):
+            processed["edge_attr"] = self.edge_attr
+            processed["source_node_indices"] = self.edge_index[0]
+            processed["target_node_indices"] = self.edge_index[1]
+        if self.rrwp_length > 0:
+            processed["rrwp"] = self.rrwp
+        if self.resample_windows:
+            processed["window_start_frames"] = self.window_start_frames
+            processed["segment_first_frame"] = self.segment_first_frame
+            processed["segment_x"] = self.segment_x
+            processed["segment_v"] = self.segment_v
+        return processed
+
+    def _restore_processed_tensors(self, processed: dict[str, object]) -> None:
+        """Inverse of _processed_tensors."""
+        self.x_0 = processed["x_0"]
+        self.v_0 = processed["v_0"]
+        self.x_t = processed["x_t"]
+        self.v_t = processed["v_t"]
+        self.z_0 = processed["z_0"]
+        self.concatenated_features = processed["concatenated_features"]
+        self.mole_idx = processed["mole_idx"]
+        self.split_times = processed["split_times"].numpy()
+        self.num_nodes = processed["num_nodes"]
+        self.num_one_hop_edges = processed["num_one_hop_edges"]
+        if "edge_attr" in processed:
+            self.edge_attr = processed["edge_attr"]
+            self.edge_index = (processed["source_node_indices"], processed["target_node_indices"])
+        if "rrwp" in processed:
+            self.rrwp = processed["rrwp"]
+        if "segment_x" in processed:
+            self.window_start_frames = processed["window_start_frames"]
+            self.segment_first_frame = processed["segment_first_frame"]
+            self.segment_x = processed["segment_x"]
+            self.segment_v = processed["segment_v"]
+
+    def process_data(self, split_times: npt.NDArray[np.int_], trajectory: SampledTrajectory, z: npt.NDArray[np.uint8]):
         """Processes loaded data, common to both MD17Dataset and MD17DynamicsDataset"""
-        x_0, v_0 = self.get_initial_frames(split_times, x, v)
-        x_t, v_t = self.get_target_frames(split_times, x, v)
+        x_0, v_0 = self.get_initial_frames(split_times, trajectory)
+        x_t, v_t = self.get_target_frames(split_times, trajectory)
 
         self.num_nodes: int = z.shape[0]
 
-        one_hop_adjacency, two_hop_adjacency = self._compute_adjacency_matrix(x, self.num_nodes, self.radius_graph_threshold)
+        one_hop_adjacency, two_hop_adjacency = self._compute_adjacency_matrix(trajectory.positions(np.array([0])), self.num_nodes, self.radius_graph_threshold)
+        self.num_one_hop_edges: int = int(one_hop_adjacency.sum().item())
         if self.return_edge_data and not self.egno_mode:
             self.edge_attr, self.edge_index = self._build_edge_attributes(one_hop_adjacency, two_hop_adjacency, z, x_0)
         elif self.egno_mode:
@@ -239,18 +409,26 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         concatenated_features = torch.cat(features_to_concat, dim=-1)
         return concatenated_features
 
-    def _replicate_tensor(self, tensor: torch.Tensor) -> torch.Tensor:
+    def _replicate_tensor(self, tensor: torch.Tensor, num_samples: int | None = None) -> torch.Tensor:
         """
         Replicates a single tensor along the batch dimension.
 
         Input tensor shape: [max_samples, d]
         Output tensor shape: [max_samples, num_timesteps, nodes, d]
+            or the input tensor itself if replicate_timesteps is False.
+
+        Args:
+            tensor (torch.Tensor): The tensor to replicate.
+            num_samples (int | None): Expected leading dimension, if not max_samples (e.g. a batch of resampled windows).
 
         Returns:
             torch.Tensor: The replicated tensor.
         """
         # Add new time dimension
-        assert tensor.shape[0] == self.max_samples, f"Tensor shape: {tensor.shape}, max_samples: {self.max_samples}. Molecule type: {self.molecule_type} for split: {self.partition}"
+        num_samples = self.max_samples if num_samples is None else num_samples
+        assert tensor.shape[0] == num_samples, f"Tensor shape: {tensor.shape}, num_samples: {num_samples}. Molecule type: {self.molecule_type} for split: {self.partition}"
+        if not self.replicate_timesteps:
+            return tensor
         tensor_with_time = tensor.unsqueeze(1)
 
         # Expand along time dimension to num_timesteps
@@ -258,20 +436,20 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
 
         return tensor_expanded
 
-    def get_initial_frames(self, split_times: npt.NDArray[np.int_], x: npt.NDArray[np.float64], v: npt.NDArray[np.float64]) -> tuple[torch.Tensor, torch.Tensor]:
-        x_0 = torch.Tensor(x[split_times])
-        v_0 = torch.Tensor(v[split_times])
+    def get_initial_frames(self, split_times: npt.NDArray[np.int_], trajectory: SampledTrajectory) -> tuple[torch.Tensor, torch.Tensor]:
+        x_0 = torch.Tensor(trajectory.positions(split_times))
+        v_0 = torch.Tensor(trajectory.velocities(split_times))
         return x_0, v_0
 
-    def get_target_frames(self, split_times: npt.NDArray[np.int_], x: npt.NDArray[np.float64], v: npt.NDArray[np.float64]) -> tuple[torch.Tensor, torch.Tensor]:
-        x_t = torch.Tensor(x[split_times + self.delta_frame])
-        v_t = torch.Tensor(v[split_times + self.delta_frame])
+    def get_target_frames(self, split_times: npt.NDArray[np.int_], trajectory: SampledTrajectory) -> tuple[torch.Tensor, torch.Tensor]:
+        x_t = torch.Tensor(trajectory.positions(split_times + self.delta_frame))
+        v_t = torch.Tensor(trajectory.velocities(split_times + self.delta_frame))
         return x_t, v_t
 
     def _get_or_generate_split(
         self,
         split_dir: Path,
-        x: npt.NDArray[np.float64],
+        num_frames: int,
         train_par: float,
         val_par: float,
         test_par: float,
@@ -283,7 +461,7 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
 
         Args:
             split_dir: Path to save/load the split file
-            x: Input data array
+            num_frames: Number of frames in the trajectory
             train_par: Proportion of data for training
             val_par: Proportion of data for validation
             test_par: Proportion of data for testing
@@ -295,7 +473,7 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         """
         # Calculate valid frame range considering margins
         start = self.dft_imprecision_margin
-        end = x.shape[0] - self.dft_imprecision_margin - self.delta_frame + 1
+        end = num_frames - self.dft_imprecision_margin - self.delta_frame + 1
 
         # Try to load existing split file
         if not force_regenerate:
@@ -308,13 +486,12 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
             print("Forcing regeneration of dataset split") if self.verbose else None
 
         # Generate new split
-        return self._generate_new_split(start=start, end=end, x=x, train_par=train_par, val_par=val_par, test_par=test_par, seed=seed, split_dir=split_dir)
+        return self._generate_new_split(start=start, end=end, train_par=train_par, val_par=val_par, test_par=test_par, seed=seed, split_dir=split_dir)
 
     def _generate_new_split(
         self,
         start: int,
         end: int,
-        x: npt.NDArray[np.float64],
         train_par: float,
         val_par: float,
         test_par: float,
@@ -327,7 +504,6 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         Args:
             start: Start index for valid frames
             end: End index for valid frames
-            x: Input data array
             train_par: Proportion of data for training
             val_par: Proportion of data for validation
             test_par: Proportion of data for testing
@@ -340,8 +516,7 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         np.random.seed(seed)
 
         # Extract valid frame range
-        x_middle = x[start:end]
-        num_timesteps = x_middle.shape[0]
+        num_timesteps = max(end - start, 0)
 
         # Create mask to track assigned indices
         assigned_mask = np.zeros(num_timesteps, dtype=bool)
@@ -391,11 +566,15 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
                 Recommended 1.6 due to atomic distances
 
         Returns:
-            tuple[torch.Tensor, torch.Tensor]: (one_hop_adjacency_matrix, two_hop_adjacency_matrix)
+            tuple[torch.Tensor, torch.Tensor]: (one_hop_adjacency_matrix, two_hop_adjacency_matrix). Dense for up to
+                DENSE_ADJACENCY_MAX_ATOMS atoms, sparse COO (coalesced) for larger molecules.
         """
         # Extract positions at time 0
         positions: torch.Tensor = torch.tensor(x[0], dtype=torch.float32)  # Shape: (num_atoms, 3)
 
+        if num_atoms > self.DENSE_ADJACENCY_MAX_ATOMS:
+            return self._compute_sparse_adjacency_matrix(positions, num_atoms, threshold)
+
         # Compute pairwise distances using vectorized operations
         # Expand dimensions for broadcasting
         pos_i: torch.Tensor = positions.unsqueeze(1)  # Shape: (num_atoms, 1, 3)
@@ -426,6 +605,132 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         assert one_hop_edges.shape == two_hop_edges.shape == (num_atoms, num_atoms)
         return one_hop_edges, two_hop_edges
 
+    def _compute_sparse_adjacency_matrix(self, positions: torch.Tensor, num_atoms: int, threshold: float) -> tuple[torch.Tensor, torch.Tensor]:
+        """Sparse counterpart of _compute_adjacency_matrix, in O(N) memory for molecules of roughly uniform density.
+
+        Args:
+            positions: Atom positions at time 0 of shape (num_atoms, 3)
+            num_atoms: Number of atoms
+            threshold: Initial distance threshold for considering atoms as connected
+
+        Returns:
+            tuple[torch.Tensor, torch.Tensor]: (one_hop_adjacency_matrix, two_hop_adjacency_matrix) as coalesced sparse COO
+                integer tensors of shape (num_atoms, num_atoms), with the same entries as the dense matrices.
+        """
+        # If no edges are found, gradually increase threshold until we get edges
+        current_threshold = threshold
+        source_indices, target_indices = self._radius_graph_cell_list(positions, current_threshold)
+        while source_indices.numel() == 0 and current_threshold < 10.0:  # Cap at 10.0 to prevent infinite loop
+            current_threshold *= 1.5
+            source_indices, target_indices = self._radius_graph_cell_list(positions, current_threshold)
+
+        if source_indices.numel() == 0:
+            raise ValueError(f"Could not find any edges even with threshold {current_threshold}. This suggests the molecule data may be corrupted.  Molecule type: {self.molecule_type}")
+
+        one_hop_edges = torch.sparse_coo_tensor(
+            torch.stack([source_indices, target_indices]), torch.ones_like(source_indices, dtype=torch.float32), (num_atoms, num_atoms)
+        ).coalesce()
+
+        # Two-hop connections: the sparsity pattern of A @ A, clamped to 1 like the dense path
+        two_hop_edges = torch.sparse.mm(one_hop_edges, one_hop_edges).coalesce()
+        two_hop_indices = two_hop_edges.indices()[:, two_hop_edges.values() > 0]
+        two_hop_edges = torch.sparse_coo_tensor(two_hop_indices, torch.ones(two_hop_indices.shape[1], dtype=torch.int), (num_atoms, num_atoms)).coalesce()
+
+        return one_hop_edges.int().coalesce(), two_hop_edges
+
+    def _radius_graph_cell_list(self, positions: torch.Tensor, threshold: float) -> tuple[torch.Tensor, torch.Tensor]:
+        """Find all ordered pairs (i, j), i != j, closer than threshold, using a cell list.
+
+        Atoms are hashed into cubic cells of side threshold, so every neighbour of an atom lies in its own
+        cell or one of the 26 adjacent cells. Only those candidate pairs are compared.
+
+        Args:
+            positions: Atom positions of shape (num_atoms, 3)
+            threshold: Distance threshold
+
+        Returns:
+            tuple[torch.Tensor, torch.Tensor]: (source_indices, target_indices), each of shape (E,), in row-major order.
+        """
+        cells = torch.floor((positions - positions.min(dim=0).values) / threshold).long()  # Shape: (num_atoms, 3)
+        grid = cells.max(dim=0).values + 1
+
+        def cell_id(cell: torch.Tensor) -> torch.Tensor:
+            return (cell[:, 0] * grid[1] + cell[:, 1]) * grid[2] + cell[:, 2]
+
+        # Sort atoms by cell, so the atoms of each occupied cell are a contiguous range of atom_order
+        atom_order = torch.argsort(cell_id(cells))
+        occupied_cells, cell_counts = torch.unique_consecutive(cell_id(cells)[atom_order], return_counts=True)
+        cell_starts = torch.cumsum(cell_counts, dim=0) - cell_counts
+
+        source_list: list[torch.Tensor] = []
+        target_list: list[torch.Tensor] = []
+        for offset in torch.cartesian_prod(*[torch.tensor([-1, 0, 1])] * 3):
+            neighbour_cells = cells + offset
+            in_grid = ((neighbour_cells >= 0) & (neighbour_cells < grid)).all(dim=1)
+            neighbour_ids = cell_id(neighbour_cells)
+            slot = torch.searchsorted(occupied_cells, neighbour_ids).clamp(max=occupied_cells.shape[0] - 1)
+            (atoms,) = torch.nonzero(in_grid & (occupied_cells[slot] == neighbour_ids), as_tuple=True)
+
+            # Pair every such atom with each atom of its neighbouring cell
+            counts = cell_counts[slot[atoms]]
+            first_pair = torch.cumsum(counts, dim=0) - counts
+            within_cell = torch.arange(int(counts.sum())) - first_pair.repeat_interleave(counts)
+            source_list.append(atoms.repeat_interleave(counts))
+            target_list.append(atom_order[cell_starts[slot[atoms]].repeat_interleave(counts) + within_cell])
+
+        source_indices = torch.cat(source_list)
+        target_indices = torch.cat(target_list)
+        distances = torch.norm(positions[source_indices] - positions[target_indices], dim=-1)
+        keep = (distances < threshold) & (source_indices != target_indices)
+        source_indices, target_indices = source_indices[keep], target_indices[keep]
+
+        # Each pair is found exactly once (from the cell of its source), sort it into row-major order
+        order = torch.argsort(source_indices * positions.shape[0] + target_indices)
+        return source_indices[order], target_indices[order]
+
+    def _edge_pairs_from_adjacency(self, one_hop_adjacency: torch.Tensor, two_hop_adjacency: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Extract the (source, target) pairs of the one-hop and two-hop graphs in row-major order.
+
+        Args:
+            one_hop_adjacency: One-hop adjacency matrix of shape (N, N), dense or sparse COO
+            two_hop_adjacency: Two-hop adjacency matrix of shape (N, N), dense or sparse COO
+
+        Returns:
+            tuple[torch.Tensor, torch.Tensor, torch.Tensor]: (source_indices, target_indices, is_one_hop), each of shape (E,).
+                An edge that is both one-hop and two-hop is reported once, as a one-hop edge.
+        """
+        n_node = one_hop_adjacency.shape[0]
+        if one_hop_adjacency.is_sparse:
+            # Row-major order is the order of the flat keys i * N + j, which torch.unique sorts
+            one_hop_keys = self._sparse_edge_keys(one_hop_adjacency)
+            edge_keys = torch.unique(torch.cat([one_hop_keys, self._sparse_edge_keys(two_hop_adjacency)]))
+            return edge_keys // n_node, edge_keys % n_node, torch.isin(edge_keys, one_hop_keys)
+
+        off_diagonal = ~torch.eye(n_node, dtype=torch.bool, device=one_hop_adjacency.device)
+        one_hop = one_hop_adjacency.bool() & off_diagonal
+        two_hop = two_hop_adjacency.bool() & off_diagonal
+
+        # nonzero walks the matrix row-major, matching the (i, j) order of a nested loop over atoms
+        source_indices, target_indices = torch.nonzero(one_hop | two_hop, as_tuple=True)
+        is_one_hop = one_hop[source_indices, target_indices]
+        return source_indices, target_indices, is_one_hop
+
+    def _sparse_edge_keys(self, adjacency: torch.Tensor) -> torch.Tensor:
+        """Flat keys i * N + j of the off-diagonal nonzero entries of a sparse COO adjacency matrix, in row-major order."""
+        adjacency = adjacency.coalesce()
+        source_indices, target_indices = adjacency.indices()[:, (adjacency.values() != 0)]
+        off_diagonal = source_indices != target_indices
+        return source_indices[off_diagonal] * adjacency.shape[0] + target_indices[off_diagonal]
+
+    def _hop_conflicts(self, one_hop_adjacency: torch.Tensor, two_hop_adjacency: torch.Tensor) -> torch.Tensor:
+        """Off-diagonal (i, j) pairs that are both one-hop and two-hop neighbours, of shape (K, 2) in row-major order."""
+        n_node = one_hop_adjacency.shape[0]
+        if one_hop_adjacency.is_sparse:
+            one_hop_keys = self._sparse_edge_keys(one_hop_adjacency)
+            conflict_keys = one_hop_keys[torch.isin(one_hop_keys, self._sparse_edge_keys(two_hop_adjacency))]
+            return torch.stack([conflict_keys // n_node, conflict_keys % n_node], dim=1)
+        return torch.nonzero(one_hop_adjacency.bool() & two_hop_adjacency.bool() & ~torch.eye(n_node, dtype=torch.bool))
+
     def _build_edge_attributes(
         self,
         one_hop_adjacency: torch.Tensor,
@@ -450,35 +755,28 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
             Target_indices: cols
             Edge_index: edges
         """
-
-        n_node = z.shape[0]
-        edge_attr: list[list[float]] = []
-        source_indices: list[int] = []
-        target_indices: list[int] = []
-
-        x_0_frame_one = x_0[0]  # use frame 0 to compute edges
-        for i in range(n_node):
-            for j in range(n_node):
-                if i == j:
-                    continue
-                else:
-                    first_frame_distance = np.linalg.norm(x_0_frame_one[i] - x_0_frame_one[j]).item()
-                    if one_hop_adjacency[i][j]:
-                        source_indices.append(i)
-                        target_indices.append(j)
-                        edge_attr.append([z[i].item(), z[j].item(), 1.0, first_frame_distance])
-                        assert not two_hop_adjacency[i, j], f"Conflict at ({i}, {j})"
-                    if two_hop_adjacency[i][j]:
-                        source_indices.append(i)
-                        target_indices.append(j)
-                        edge_attr.append([z[i].item(), z[j].item(), 2.0, first_frame_distance])
-                        assert not one_hop_adjacency[i, j], f"Conflict at ({i}, {j})"
-
+        conflicts = self._hop_conflicts(one_hop_adjacency, two_hop_adjacency)
+        assert conflicts.shape[0] == 0, f"Conflict at ({conflicts[0, 0].item()}, {conflicts[0, 1].item()})"
+
+        source_indices, target_indices, is_one_hop = self._edge_pairs_from_adjacency(one_hop_adjacency, two_hop_adjacency)
+
+        x_0_frame_one = torch.as_tensor(x_0[0], dtype=torch.float32)  # use frame 0 to compute edges
+        first_frame_distance = torch.linalg.vector_norm(x_0_frame_one[source_indices] - x_0_frame_one[target_indices], dim=-1)
+        z_float = torch.as_tensor(z).to(torch.float32)
+
+        edge_attr_tensor = torch.stack(
+            [
+                z_float[source_indices],
+                z_float[target_indices],
+                torch.where(is_one_hop, 1.0, 2.0),
+                first_frame_distance,
+            ],
+            dim=-1,
+        )
         edge_index = (
-            torch.Tensor(source_indices),
-            torch.Tensor(target_indices),
+            source_indices.to(torch.float32),
+            target_indices.to(torch.float32),
         )
-        edge_attr_tensor = torch.Tensor(np.array(edge_attr))
         return edge_attr_tensor, edge_index
 
     def _build_edge_attributes_with_cfg(
@@ -502,57 +800,32 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         """
 
         n_node = z.shape[0]  # Use the potentially filtered number of nodes
-        edge_attr_list: list[list[float]] = []
-        source_indices: list[int] = []
-        target_indices: list[int] = []
-
-        # Convert sticks to a set of tuples for faster lookup
-        stick_set = set()
-        if "Stick" in self.cfg:
-            for stick in self.cfg["Stick"]:
-                # Add both orders to the set for easy checking
-                stick_set.add(tuple(sorted(stick)))
-
-        x_0_frame_one = x_0[0]  # use frame 0 for initial structure info
-        for i in range(n_node):
-            for j in range(n_node):
-                if i == j:
-                    continue
-
-                current_stick_ind = 0.0
-                # Check if this edge (i, j) is defined as a stick
-                if tuple(sorted((i, j))) in stick_set:
-                    current_stick_ind = 1.0
-
-                # Check one-hop connections
-                if one_hop_adjacency[i][j]:
-                    source_indices.append(i)
-                    target_indices.append(j)
-                    # edge_attr: [z_i, z_j, type=1.0, stick_ind]
-                    edge_attr_list.append([z[i].item(), z[j].item(), 1.0, current_stick_ind])
-                    if tuple(sorted((i, j))) in stick_set and not two_hop_adjacency[i, j]:
-                        # If it's a stick, it should *only* be one-hop according to original logic
-                        pass
-                    elif not tuple(sorted((i, j))) in stick_set and two_hop_adjacency[i, j]:
-                        # Should not be both 1-hop and 2-hop
-                        print(f"Warning: Edge ({i},{j}) is 1-hop but also 2-hop in adjacency matrix.")
-                    # Original code had asserts here checking mutual exclusivity, which might be too strict
-                    # depending on the graph definition. We'll omit them for now.
-
-                # Check two-hop connections (only add if not already added as one-hop)
-                elif two_hop_adjacency[i][j]:  # Use elif to ensure mutual exclusivity
-                    source_indices.append(i)
-                    target_indices.append(j)
-                    # edge_attr: [z_i, z_j, type=2.0, stick_ind=0.0] (sticks are usually 1-hop)
-                    # Assuming sticks won't be two-hop neighbours only.
-                    edge_attr_list.append([z[i].item(), z[j].item(), 2.0, 0.0])  # Stick ind is 0 for 2-hop
 
-        edge_index = (
-            torch.tensor(source_indices, dtype=torch.long),  # Use long for indices
-            torch.tensor(target_indices, dtype=torch.long),
+        # Flat keys i * n_node + j of the sticks in both directions; indices beyond n_node can never form an edge
+        sticks = torch.tensor([stick for stick in self.cfg.get("Stick", []) if max(stick) < n_node], dtype=torch.long).view(-1, 2)
+        stick_keys = torch.cat([sticks[:, 0] * n_node + sticks[:, 1], sticks[:, 1] * n_node + sticks[:, 0]])
+
+        # Should not be both 1-hop and 2-hop, unless the edge is a stick
+        conflicts = self._hop_conflicts(one_hop_adjacency, two_hop_adjacency)
+        conflicts = conflicts[~torch.isin(conflicts[:, 0] * n_node + conflicts[:, 1], stick_keys)]
+        for i, j in conflicts.tolist():
+            print(f"Warning: Edge ({i},{j}) is 1-hop but also 2-hop in adjacency matrix.")
+
+        # Two-hop connections are only added if not already added as one-hop
+        source_indices, target_indices, is_one_hop = self._edge_pairs_from_adjacency(one_hop_adjacency, two_hop_adjacency)
+
+        # edge_attr: [z_i, z_j, type (1.0 or 2.0), stick_ind]. Sticks are 1-hop, so stick_ind is 0 for 2-hop edges
+        z_float = torch.as_tensor(z).to(torch.float)
+        edge_attr_tensor = torch.stack(
+            [
+                z_float[source_indices],
+                z_float[target_indices],
+                torch.where(is_one_hop, 1.0, 2.0),
+                (is_one_hop & torch.isin(source_indices * n_node + target_indices, stick_keys)).to(torch.float),
+            ],
+            dim=-1,
         )
-        # Ensure the final edge_attr has 4 features per edge
-        edge_attr_tensor = torch.tensor(np.array(edge_attr_list), dtype=torch.float)
+        edge_index = (source_indices, target_indices)  # nonzero already returns long indices
         assert edge_attr_tensor.shape[1] == 4, f"Edge attributes should have 4 features, but got shape {edge_attr_tensor.shape}"
         return edge_attr_tensor, edge_index
 
@@ -610,12 +883,15 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         Calculate random walk return probabilities (RRWP) for each node given an adjacency matrix.
 
         Parameters:
-            adj (torch.Tensor): An (n x n) adjacency matrix.
+            adj (torch.Tensor): An (n x n) adjacency matrix, dense or sparse COO.
             walk_length (int): K, the total number of walk steps.
 
         Returns:
             torch.Tensor: A tensor of shape (n, k) where each row holds the self-return probability at each walk length.
         """
+        if adj.is_sparse:
+            return self._calculate_sparse_rrwp(adj, walk_length)
+
         # Ensure adjacency matrix is in float format
         adj = adj.float()
 
@@ -639,6 +915,31 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
         assert rrwp.shape == (self.num_nodes, walk_length), f"RRWP shape: {rrwp.shape}, num_nodes: {self.num_nodes}, walk_length: {walk_length}"
         return rrwp
 
+    def _calculate_sparse_rrwp(self, adj: torch.Tensor, walk_length: int) -> torch.Tensor:
+        """calculate_rrwp for a sparse COO adjacency matrix. The k-step transition matrices only fill in k-hop neighbourhoods, so they stay sparse."""
+        adj = adj.coalesce().float()
+        n_node = adj.shape[0]
+        source_indices = adj.indices()[0]
+
+        # Row-normalise the adjacency matrix: D^{-1}A
+        deg = torch.zeros(n_node).index_add_(0, source_indices, adj.values())
+        deg_inv = torch.where(deg > 0, 1.0 / deg, torch.zeros_like(deg))
+        A_norm = torch.sparse_coo_tensor(adj.indices(), adj.values() * deg_inv[source_indices], adj.shape).coalesce()
+
+        rrwp_list = []
+        current = A_norm
+        for step in range(walk_length):
+            if step > 0:
+                current = torch.sparse.mm(current, A_norm).coalesce()
+            # Diagonal of the current transition matrix: the self-return probability
+            indices = current.indices()
+            on_diagonal = indices[0] == indices[1]
+            rrwp_list.append(torch.zeros(n_node).index_add_(0, indices[0, on_diagonal], current.values()[on_diagonal]))
+
+        rrwp = torch.stack(rrwp_list, dim=1)  # Shape: (n, k)
+        assert rrwp.shape == (self.num_nodes, walk_length), f"RRWP shape: {rrwp.shape}, num_nodes: {self.num_nodes}, walk_length: {walk_length}"
+        return rrwp
+
     def _pad_tensor(self, tensor: torch.Tensor) -> torch.Tensor:
         # tensor shape assumed to be (num_samples, N, d)
         if self.max_nodes is not None:
@@ -671,6 +972,10 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
                 - "v_t": Tensor of target velocities with shape (num_timesteps, N, d)
                 - "concatenated_features": Tensor of concatenated features with shape (num_timesteps, N, d)
         """
+        if self.resample_windows:
+            # The index only counts samples; the window itself is drawn at random
+            return {key: value[0] for key, value in self.__getitems__([i]).items()}
+
         # For sample index i, slice out the contiguous block of timesteps (of size num_timesteps)
         # from the pre-replicated tensors. This recovers the T timesteps associated with the i-th sample.
         # i * self.num_timesteps : (i + 1) * self.num_timesteps - We want to be this many i * timesteps *frames* from the start, and capture the whole frame
@@ -691,8 +996,9 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
                 ]
             )
 
-            mask = mask.unsqueeze(0).expand(self.num_timesteps, -1).unsqueeze(-1).bool()
-            sample["padded_nodes_mask"] = mask.contiguous()
+            if self.replicate_timesteps:
+                mask = mask.unsqueeze(0).expand(self.num_timesteps, -1)
+            sample["padded_nodes_mask"] = mask.unsqueeze(-1).bool().contiguous()
 
         if self.return_edge_data:
             sample["edge_attr"] = self.edge_attr.contiguous()
@@ -701,9 +1007,94 @@ class MD17Dataset(Dataset[dict[str, torch.Tensor]]):
 
         return sample
 
+    def __getitems__(self, indices: list[int]) -> dict[str, torch.Tensor]:
+        """
+        Batched counterpart of __getitem__, used by the DataLoader instead of one call per sample.
+
+        Every field is gathered with a single index_select over the preallocated tensors, and the padding mask and
+        edge data, which are identical for every sample of a molecule, are built once and broadcast over the batch.
+        The result is already a batch, so the DataLoader must be given a pass-through collate_fn.
+
+        Args:
+            indices (list[int]): Indices of the samples in the batch.
+
+        Returns:
+            dict[str, torch.Tensor]: The same keys as __getitem__, each with a leading batch dimension of len(indices).
+        """
+        index = torch.as_tensor(indices, dtype=torch.long)
+        batch_size = index.shape[0]
+        if self.resample_windows:
+            batch = self._sample_windows(batch_size)
+        else:
+            batch = {
+                "x_0": self.replicated_x_0.index_select(0, index),
+                "v_0": self.replicated_v_0.index_select(0, index),
+                "concatenated_features": self.replicated_concatenated_features.index_select(0, index),
+                "Z": self.replicated_z_0.index_select(0, index),
+                "x_t": self.x_t.index_select(0, index),
+                "v_t": self.v_t.index_select(0, index),
+            }
+
+        if self.max_nodes is not None:
+            mask = torch.cat(
+                [
+                    torch.ones(self.num_nodes, dtype=torch.bool),
+                    torch.zeros(self.max_nodes - self.num_nodes, dtype=torch.bool),
+                ]
+            )
+
+            if self.replicate_timesteps:
+                mask = mask.unsqueeze(0).expand(self.num_timesteps, -1)
+            batch["padded_nodes_mask"] = mask.unsqueeze(-1).expand(batch_size, *mask.shape, 1).contiguous()
+
+        if self.return_edge_data:
+            batch["edge_attr"] = self.edge_attr.expand(batch_size, *self.edge_attr.shape).contiguous()
+            batch["source_node_indices"] = self.edge_index[0].expand(batch_size, -1).contiguous()
+            batch["target_node_indices"] = self.edge_index[1].expand(batch_size, -1).contiguous()
+
+        return batch
+
+    def _sample_windows(self, batch_size: int) -> dict[str, torch.Tensor]:
+        """Draw batch_size start frames from the split and build their samples from the trajectory segment.
+
+        Mirrors process_data for the drawn frames: the same features, padding and replication as the fixed windows.
+        """
+        start_frames = self.window_start_frames[torch.randint(self.window_start_frames.shape[0], (batch_size,))]
+        rows = start_frames - self.segment_first_frame
+
+        x_0 = self.segment_x[rows]
+        v_0 = self.segment_v[rows]
+        x_0 = torch.cat([x_0, torch.norm(x_0, dim=-1, keepdim=True)], dim=-1)
+        v_0 = torch.cat([v_0, torch.norm(v_0, dim=-1, keepdim=True)], dim=-1)
+        z_0 = self.z_0[:1, : self.num_nodes].expand(batch_size, -1, -1)
+        features_to_concat = [x_0, v_0, z_0]
+        if self.rrwp_length > 0:
+            features_to_concat.append(self.rrwp.unsqueeze(0).expand(batch_size, -1, -1))
+        concatenated_features = torch.cat(features_to_concat, dim=-1)
+        x_t, v_t = self._window_target_frames(rows)
+
+        return {
+            "x_0": self._replicate_tensor(self._pad_tensor(x_0), num_samples=batch_size),
+            "v_0": self._replicate_tensor(self._pad_tensor(v_0), num_samples=batch_size),
+            "concatenated_features": self._replicate_tensor(self._pad_tensor(concatenated_features), num_samples=batch_size),
+            "Z": self._replicate_tensor(self._pad_tensor(z_0), num_samples=batch_size),
+            "x_t": self._pad_tensor(x_t),
+            "v_t": self._pad_tensor(v_t),
+        }
+
+    def _window_target_frames(self, rows: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """Target positions and velocities of windows starting at the given rows of the trajectory segment."""
+        return self.segment_x[rows + self.delta_frame], self.segment_v[rows + self.delta_frame]
+
     def __len__(self):
         return len(self.split_times)
 
+    def time_invariant_bytes_per_sample(self) -> int:
+        """Bytes of a single sample's initial conditions without the time axis ([N, d] per field)."""
+        fields = [self.replicated_x_0, self.replicated_v_0, self.replicated_concatenated_features, self.replicated_z_0]
+        copies = self.num_timesteps if self.replicate_timesteps else 1
+        return sum(field[0].numel() // copies * field.element_size() for field in fields)
+
 
 @final
 class MD17DynamicsDataset(MD17Dataset):
@@ -734,6 +1125,10 @@ class MD17DynamicsDataset(MD17Dataset):
         force_regenerate: bool = False,
         egno_mode: bool = False,
         max_edges: int | None = None,
+        cache_dir: str | None = None,
+        cache_max_gb: float = 20.0,
+        replicate_timesteps: bool = True,
+        resample_windows: bool = False,
     ):
         super().__init__(
             partition=partition,
@@ -757,31 +1152,24 @@ class MD17DynamicsDataset(MD17Dataset):
             normalize_z=normalize_z,
             egno_mode=egno_mode,
             max_edges=max_edges,
+            cache_dir=cache_dir,
+            cache_max_gb=cache_max_gb,
+            replicate_timesteps=replicate_timesteps,
+            resample_windows=resample_windows,
         )
-        self.x_t, self.v_t = self.get_dynamic_target_frames()
-
-        # Re-replicate dataset after defining x_t, v_t for dynamics dataset
-        self.replicated_x_0: torch.Tensor = self._replicate_tensor(self.x_0)
-        self.replicated_v_0: torch.Tensor = self._replicate_tensor(self.v_0)
-        self.replicated_concatenated_features: torch.Tensor = self._replicate_tensor(self.concatenated_features)
-        self.replicated_z_0: torch.Tensor = self._replicate_tensor(self.z_0)
         self.replicated_mole_idx: torch.Tensor = self._replicate_tensor(self.mole_idx)
 
-        if self.x_t is not None:
-            self.x_t = torch.Tensor(self.x_t)
-            self.x_t = self._pad_tensor(self.x_t)
-        if self.v_t is not None:
-            self.v_t = torch.Tensor(self.v_t)
-            self.v_t = self._pad_tensor(self.v_t)
-
+        # Without replication the initial conditions have no time axis, so they are compared to the targets' [S, N]
+        initial_dims = 3 if self.replicate_timesteps else 2
+        target_dims = tuple(self.x_t.shape[:3]) if self.replicate_timesteps else (self.x_t.shape[0], self.x_t.shape[2])
         assert (
-            self.x_t.shape[:3]
-            == self.v_t.shape[:3]
-            == self.replicated_x_0.shape[:3]
-            == self.replicated_v_0.shape[:3]
-            == self.replicated_z_0.shape[:3]
-            == self.replicated_concatenated_features.shape[:3]
-            == self.replicated_mole_idx.shape[:3]
+            target_dims
+            == tuple(self.v_t.shape[:3] if self.replicate_timesteps else (self.v_t.shape[0], self.v_t.shape[2]))
+            == tuple(self.replicated_x_0.shape[:initial_dims])
+            == tuple(self.replicated_v_0.shape[:initial_dims])
+            == tuple(self.replicated_z_0.shape[:initial_dims])
+            == tuple(self.replicated_concatenated_features.shape[:initial_dims])
+            == tuple(self.replicated_mole_idx.shape[:initial_dims])
         ), (
             f"Shape mismatch in first 3 dims:\n"
             f"x_t.shape: {self.x_t.shape}\n"
@@ -793,18 +1181,117 @@ class MD17DynamicsDataset(MD17Dataset):
             f"replicated_mole_idx.shape: {self.replicated_mole_idx.shape}"
         )
 
+    @override
+    def target_frame_offsets(self) -> npt.NDArray[np.int_]:
+        return np.array([0] + [self.delta_frame * i // self.num_timesteps for i in range(1, self.num_timesteps + 1)])
+
+    @override
+    def process_targets(self) -> None:
+        """Replace the single target frame with num_timesteps target frames evenly spaced over delta_frame."""
+        x_t, v_t = self.get_dynamic_target_frames()
+        self.x_t = self._pad_tensor(torch.Tensor(x_t))
+        self.v_t = self._pad_tensor(torch.Tensor(v_t))
+
+    @override
+    def _window_target_frames(self, rows: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """num_timesteps target frames evenly spaced over delta_frame, as in get_dynamic_target_frames."""
+        target_rows = rows.unsqueeze(1) + torch.as_tensor(self.target_frame_offsets()[1:])  # Shape: (batch, num_timesteps)
+        return self.segment_x[target_rows], self.segment_v[target_rows]
+
     def get_dynamic_target_frames(self) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
         split_times = self.split_times
         delta_frame = self.delta_frame
         num_timesteps = self.num_timesteps
 
-        x_t_list = [self.x[split_times + delta_frame * i // num_timesteps] for i in range(1, num_timesteps + 1)]
+        x_t_list = [self.trajectory.positions(split_times + delta_frame * i // num_timesteps) for i in range(1, num_timesteps + 1)]
         x_t = np.stack(x_t_list, axis=1)
-        v_t_list = [self.v[split_times + delta_frame * i // num_timesteps] for i in range(1, num_timesteps + 1)]
+        v_t_list = [self.trajectory.velocities(split_times + delta_frame * i // num_timesteps) for i in range(1, num_timesteps + 1)]
         v_t = np.stack(v_t_list, axis=1)
         return x_t, v_t
 
 
+@final
+class MD17ConcatDataset(ConcatDataset[dict[str, torch.Tensor]]):
+    """
+    Concatenation of per-molecule datasets that keeps the batched __getitems__ fetch path.
+
+    The indices of a batch are grouped by molecule, each group is fetched with a single __getitems__ call, and the
+    results are concatenated back in sampler order. Molecules share max_nodes, but can have different edge counts,
+    so edge tensors are zero-padded to the largest count in the batch (index 0 is a valid node, like a self-loop).
+
+    With dynamic_padding, node tensors are also trimmed from the shared max_nodes to the largest molecule in the
+    batch, so padded_nodes_mask and the attention sequence length follow the real sizes of the batch.
+
+    With packed, no padding is left at all: the real nodes of every sample are concatenated along the node axis into
+    a single sequence of shape [1, (T,) sum(N_i), d], and "cu_seqlens" of shape [1, len(indices) + 1] holds the node
+    offset of every sample, in sampler order. padded_nodes_mask is dropped. Packing is for ATOM only, which confines
+    attention to each sample, so the datasets must not return edge data.
+    """
+
+    EDGE_KEYS: tuple[str, ...] = ("edge_attr", "source_node_indices", "target_node_indices")
+
+    def __init__(self, datasets: list[MD17DynamicsDataset], dynamic_padding: bool = False, packed: bool = False) -> None:
+        super().__init__(datasets)
+        if packed and any(dataset.return_edge_data for dataset in datasets):
+            raise ValueError("Packed batches have no per-sample edge layout: build the datasets with return_edge_data=False.")
+        self.molecule_datasets: list[MD17DynamicsDataset] = datasets
+        self.dynamic_padding: bool = dynamic_padding
+        self.packed: bool = packed
+        self.dataset_offsets: torch.Tensor = torch.tensor([0, *self.cumulative_sizes[:-1]], dtype=torch.long)
+
+    def sample_num_nodes(self) -> torch.Tensor:
+        """Number of real (unpadded) nodes of every sample, of shape (len(self),)."""
+        return torch.cat([torch.full((len(dataset),), dataset.num_nodes) for dataset in self.molecule_datasets])
+
+    def __getitems__(self, indices: list[int]) -> dict[str, torch.Tensor]:
+        index = torch.as_tensor(indices, dtype=torch.long)
+        dataset_idx = torch.bucketize(index, torch.tensor(self.cumulative_sizes), right=True)
+
+        parts: list[dict[str, torch.Tensor]] = []
+        positions: list[torch.Tensor] = []
+        batch_dataset_ids: list[int] = dataset_idx.unique().tolist()
+        for d in batch_dataset_ids:
+            (selected,) = torch.nonzero(dataset_idx == d, as_tuple=True)
+            local_indices = index[selected] - self.dataset_offsets[d]
+            parts.append(self.molecule_datasets[d].__getitems__(local_indices.tolist()))
+            positions.append(selected)
+
+        if self.dynamic_padding:
+            # Node tensors all have the node axis second to last: [B, (T,) N, d]
+            batch_nodes = max(self.molecule_datasets[d].num_nodes for d in batch_dataset_ids)
+            parts = [{key: value if key in self.EDGE_KEYS else value[..., :batch_nodes, :].contiguous() for key, value in part.items()} for part in parts]
+
+        if len(parts) == 1:
+            return self._pack(parts[0], dataset_idx) if self.packed else parts[0]
+
+        if "edge_attr" in parts[0]:
+            max_edges = max(part["edge_attr"].shape[1] for part in parts)
+            for part in parts:
+                pad_len = max_edges - part["edge_attr"].shape[1]
+                for key in self.EDGE_KEYS:
+                    # Pad dim 1 (edges); F.pad takes (left, right) pairs starting from the last dim
+                    part[key] = F.pad(part[key], (0, 0) * (part[key].ndim - 2) + (0, pad_len))
+
+        # Restore the order the sampler asked for
+        order = torch.argsort(torch.cat(positions))
+        batch = {key: torch.cat([part[key] for part in parts], dim=0)[order] for key in parts[0]}
+        return self._pack(batch, dataset_idx) if self.packed else batch
+
+    def _pack(self, batch: dict[str, torch.Tensor], dataset_idx: torch.Tensor) -> dict[str, torch.Tensor]:
+        """Concatenate the real nodes of every sample of a padded batch into one sequence with a batch dimension of 1."""
+        num_nodes = torch.tensor([dataset.num_nodes for dataset in self.molecule_datasets])[dataset_idx]
+        _ = batch.pop("padded_nodes_mask", None)
+        max_nodes = batch["x_0"].shape[-2]
+        node_mask = torch.arange(max_nodes) < num_nodes.unsqueeze(-1)  # [B, max_nodes]
+
+        packed: dict[str, torch.Tensor] = {}
+        for key, value in batch.items():
+            # [B, (T,) N, d] -> [(T,) B, N, d], then keep the real nodes of every sample in order -> [1, (T,) sum(N_i), d]
+            packed[key] = value.movedim(0, -3)[..., node_mask, :].unsqueeze(0).contiguous()
+        packed["cu_seqlens"] = F.pad(num_nodes.cumsum(0), (1, 0)).unsqueeze(0)
+        return packed
+
+
 if __name__ == "__main__":
     # Test MD17Dataset
     dataset_static = MD17Dataset(
@@ -0,0 +1,47 @@
+import math
+from collections.abc import Iterator
+from typing import final
+
+import torch
+from torch.utils.data import Sampler
+
+
+@final
+class SizeBucketBatchSampler(Sampler[list[int]]):
+    """
+    Batch sampler that groups samples of similar size, so that padding each batch to its largest sample wastes little.
+
+    Every epoch the samples are shuffled, stably sorted by size (so samples of equal size stay in random order),
+    cut into batches, and the batches are shuffled. The padding efficiency of the epoch, real tokens over padded
+    tokens when every batch is padded to its largest sample, is recorded in ``padding_efficiency``.
+    """
+
+    def __init__(self, sizes: torch.Tensor, batch_size: int, shuffle: bool = True) -> None:
+        """
+        Args:
+            sizes (torch.Tensor): Size (e.g. number of nodes) of every sample, of shape (num_samples,).
+            batch_size (int): Number of samples per batch.
+            shuffle (bool): Whether to shuffle within sizes and across batches every epoch.
+        """
+        super().__init__()
+        self.sizes: torch.Tensor = sizes
+        self.batch_size: int = batch_size
+        self.shuffle: bool = shuffle
+        self.padding_efficiency: float = 1.0
+
+    def __len__(self) -> int:
+        return math.ceil(self.sizes.shape[0] / self.batch_size)
+
+    def __iter__(self) -> Iterator[list[int]]:
+        num_samples = self.sizes.shape[0]
+        order = torch.randperm(num_samples) if self.shuffle else torch.arange(num_samples)
+        order = order[torch.argsort(self.sizes[order], stable=True)]
+        batches = list(order.split(self.batch_size))
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches)).tolist()]
+
+        padded_tokens = sum(batch.shape[0] * int(self.sizes[batch].max()) for batch in batches)
+        self.padding_efficiency = int(self.sizes.sum()) / padded_tokens
+
+        for batch in batches:
+            yield batch.tolist()
@@ -1,7 +1,21 @@
-from torch.utils.data import DataLoader
+import torch
+from torch.utils.data import DataLoader, Dataset
 import numpy as np
 from atom.dataloaders.atom_dataloader import MD17Dataset, MD17DynamicsDataset, MD17MoleculeType, Datasets, DataPartition
 
+
+class PerSampleView(Dataset[dict[str, torch.Tensor]]):
+    """Hides __getitems__, so the DataLoader falls back to one __getitem__ call per sample plus default_collate."""
+
+    def __init__(self, dataset: MD17Dataset) -> None:
+        self.dataset: MD17Dataset = dataset
+
+    def __getitem__(self, i: int) -> dict[str, torch.Tensor]:
+        return self.dataset[i]
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
 if __name__ == "__main__":
     import time
     from tqdm import tqdm
@@ -20,7 +34,7 @@ if __name__ == "__main__":
         max_nodes=6,
         return_edge_data=False,
     )
-    dataloader_static = DataLoader(dataset_static, batch_size=100, shuffle=True)
+    dataloader_static = DataLoader(dataset_static, batch_size=100, shuffle=True, collate_fn=lambda batch: batch)
     # print("MD17Dataset Output Shapes:")
     # for data in dataloader_static:
     #     for key in data:
@@ -47,25 +61,36 @@ if __name__ == "__main__":
         return_edge_data=False,
     )
 
-    dataloader_dynamic = DataLoader(dataset_dynamic, batch_size=100, shuffle=True)
+    loaders = {
+        "per-sample": DataLoader(PerSampleView(dataset_dynamic), batch_size=100, shuffle=True),
+        "batched": DataLoader(dataset_dynamic, batch_size=100, shuffle=True, collate_fn=lambda batch: batch),
+    }
+
+    # Both paths must produce identical batches
+    per_sample_batch = next(iter(DataLoader(PerSampleView(dataset_dynamic), batch_size=100)))
+    batched_batch = next(iter(DataLoader(dataset_dynamic, batch_size=100, collate_fn=lambda batch: batch)))
+    assert per_sample_batch.keys() == batched_batch.keys()
+    for key in per_sample_batch:
+        assert torch.equal(per_sample_batch[key], batched_batch[key]), f"Batched fetch differs for key '{key}'"
 
-    # Warm-up iterations
-    for _ in range(500):
-        next(iter(dataloader_dynamic))
+    for name, dataloader_dynamic in loaders.items():
+        # Warm-up iterations
+        for _ in range(500):
+            next(iter(dataloader_dynamic))
 
-    # Benchmarking with statistics
-    times: list[float] = []
-    num_batches: int = 10_000
+        # Benchmarking with statistics
+        times: list[float] = []
+        num_batches: int = 10_000
 
-    for rep in tqdm(range(100)):
-        start_time = time.time()
-        for i, batch in enumerate(dataloader_dynamic):
-            if i == num_batches:
-                break
-        elapsed = time.time() - start_time
-        times.append(elapsed)
+        for rep in tqdm(range(100)):
+            start_time = time.time()
+            for i, batch in enumerate(dataloader_dynamic):
+                if i == num_batches:
+                    break
+            elapsed = time.time() - start_time
+            times.append(elapsed)
 
-    mean_time = np.mean(times)
-    std_time = np.std(times)
-    print(f"Batch overhead - Mean: {mean_time:.4f} s, Std: {std_time:.4f} s")
-    print(f"Latex: \\({mean_time:.3f}{{\\scriptstyle \\pm{std_time:.3f}}}\\)")
+        mean_time = np.mean(times)
+        std_time = np.std(times)
+        print(f"[{name}] Batch overhead - Mean: {mean_time:.4f} s, Std: {std_time:.4f} s")
+        print(f"[{name}] Latex: \\({mean_time:.3f}{{\\scriptstyle \\pm{std_time:.3f}}}\\)")
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import final
+
+import torch
+
+# Bump whenever the layout or meaning of the cached tensors changes, so stale entries are never reused
+CACHE_FORMAT_VERSION = 1
+
+
+@final
+class DatasetCache:
+    """
+    Persistent on-disk cache of fully processed datasets.
+
+    Each entry is a single ``.pt`` file holding the processed tensors of one dataset partition
+    (initial conditions, targets, atomic numbers, concatenated features, edge data, RRWP and
+    split indices). Entries are keyed by a hash of every parameter that affects their contents,
+    so a change to any of them simply misses the cache rather than returning stale data.
+
+    The cache is bounded in size: after every write, the least recently used entries are
+    evicted until the total size is below ``max_size_gb``. Reading an entry marks it as used.
+    """
+
+    def __init__(self, cache_dir: Path, max_size_gb: float = 20.0) -> None:
+        """
+        Args:
+            cache_dir (Path): Directory in which cache entries are stored.
+            max_size_gb (float): Maximum total size of the cache in gigabytes.
+        """
+        self.cache_dir: Path = cache_dir
+        self.max_size_bytes: int = int(max_size_gb * 1024**3)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(**params: object) -> str:
+        """Hash the parameters that determine a processed dataset into a cache key.
+
+        Args:
+            **params: JSON-serialisable parameters. Enums and paths are stringified.
+
+        Returns:
+            str: Hex digest identifying the processed dataset.
+        """
+        canonical = json.dumps({"cache_format_version": CACHE_FORMAT_VERSION, **params}, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+    @staticmethod
+    def file_fingerprint(path: Path) -> tuple[int, int] | None:
+        """(size, mtime) of a source file, so edits to the raw data invalidate dependent entries."""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pt"
+
+    def load(self, key: str) -> dict[str, object] | None:
+        """Load a cache entry.
+
+        Args:
+            key (str): Cache key from ``make_key``.
+
+        Returns:
+            dict[str, object] | None: The cached payload, or None on a miss or an unreadable entry.
+        """
+        path = self._entry_path(key)
+        if not path.exists():
+            return None
+        try:
+            payload: dict[str, object] = torch.load(path, weights_only=True, mmap=True)
+        except Exception:
+            # A partially written or corrupted entry is treated as a miss
+            self.invalidate(key)
+            return None
+        os.utime(path)  # Mark as recently used for LRU eviction
+        return payload
+
+    def save(self, key: str, payload: dict[str, object]) -> None:
+        """Atomically write a cache entry, then evict old entries if the cache is over budget.
+
+        Args:
+            key (str): Cache key from ``make_key``.
+            payload (dict[str, object]): Tensors and plain Python values to store.
+        """
+        path = self._entry_path(key)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+        torch.save(payload, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict(keep=key)
+
+    def invalidate(self, key: str | None = None) -> None:
+        """Remove a single entry, or every entry when ``key`` is None.
+
+        Args:
+            key (str | None): Cache key to remove. Removes the whole cache if None.
+        """
+        paths = [self._entry_path(key)] if key is not None else list(self.cache_dir.glob("*.pt"))
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    def size_bytes(self) -> int:
+        return sum(path.stat().st_size for path in self.cache_dir.glob("*.pt"))
+
+    def evict(self, keep: str | None = None) -> None:
+        """Delete least recently used entries until the cache fits within its size budget.
+
+        Args:
+            keep (str | None): Entry that must not be evicted, e.g. the one just written.
+        """
+        entries = sorted(self.cache_dir.glob("*.pt"), key=lambda path: path.stat().st_mtime)
+        total_size = sum(path.stat().st_size for path in entries)
+        for path in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            if path.stem == keep:
+                continue
+            total_size -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or clear the processed dataset cache")
+    _ = parser.add_argument("--cache_dir", type=str, default="data/processed_cache/", help="Path to the dataset cache directory")
+    _ = parser.add_argument("--clear", action="store_true", help="Remove every cache entry")
+    args = parser.parse_args()
+
+    cache = DatasetCache(Path(args.cache_dir))
+    if args.clear:
+        cache.invalidate()
+    print(f"Dataset cache at {args.cache_dir}: {len(list(cache.cache_dir.glob('*.pt')))} entries, {cache.size_bytes() / 1024**2:.1f} MB")
@@ -0,0 +1,91 @@
+import time
+
+import numpy as np
+import numpy.typing as npt
+import torch
+
+from atom.dataloaders.atom_dataloader import MD17Dataset
+
+
+def loop_edge_attributes_with_cfg(
+    one_hop_adjacency: torch.Tensor, two_hop_adjacency: torch.Tensor, z: torch.Tensor, sticks: list[tuple[int, int]]
+) -> tuple[torch.Tensor, tuple[torch.Tensor, torch.Tensor]]:
+    """Reference nested-loop edge construction, kept to check the vectorised builder against."""
+    n_node = z.shape[0]
+    edge_attr_list: list[list[float]] = []
+    source_indices: list[int] = []
+    target_indices: list[int] = []
+    stick_set = {tuple(sorted(stick)) for stick in sticks}
+    for i in range(n_node):
+        for j in range(n_node):
+            if i == j:
+                continue
+            current_stick_ind = 1.0 if tuple(sorted((i, j))) in stick_set else 0.0
+            if one_hop_adjacency[i][j]:
+                source_indices.append(i)
+                target_indices.append(j)
+                edge_attr_list.append([z[i].item(), z[j].item(), 1.0, current_stick_ind])
+            elif two_hop_adjacency[i][j]:
+                source_indices.append(i)
+                target_indices.append(j)
+                edge_attr_list.append([z[i].item(), z[j].item(), 2.0, 0.0])
+
+    edge_index = (torch.tensor(source_indices, dtype=torch.long), torch.tensor(target_indices, dtype=torch.long))
+    return torch.tensor(np.array(edge_attr_list), dtype=torch.float), edge_index
+
+
+def synthetic_molecule(num_atoms: int, seed: int = 0) -> tuple[npt.NDArray[np.float64], torch.Tensor]:
+    """Jittered cubic lattice with a C-C like spacing, so the 1.6 radius graph has a realistic degree."""
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(num_atoms ** (1 / 3)))
+    grid = np.stack(np.meshgrid(*[np.arange(side)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)[:num_atoms]
+    positions = grid * 1.45 + rng.normal(scale=0.05, size=grid.shape)
+    z = torch.tensor(rng.choice([6, 7, 8], size=num_atoms), dtype=torch.uint8)
+    return positions[np.newaxis], z
+
+
+if __name__ == "__main__":
+    # Bypass __init__: only the adjacency and edge builders are exercised, which need no dataset on disk
+    dataset = MD17Dataset.__new__(MD17Dataset)
+    dataset.molecule_type = "benchmark"
+
+    print(f"{'N':>6} {'edges':>8} {'loop (s)':>10} {'vectorised (s)':>15} {'speedup':>9}")
+    for num_atoms in [8, 16, 32, 64, 128, 256, 512]:
+        x, z = synthetic_molecule(num_atoms)
+        sticks = [(i, i + 1) for i in range(0, num_atoms - 1, 4)]
+        dataset.cfg = {"Stick": sticks}
+        one_hop, two_hop = dataset._compute_adjacency_matrix(x, num_atoms, 1.6)
+        x_0 = torch.tensor(x, dtype=torch.float32)
+
+        start_time = time.perf_counter()
+        loop_attr, loop_index = loop_edge_attributes_with_cfg(one_hop, two_hop, z, sticks)
+        loop_time = time.perf_counter() - start_time
+
+        times: list[float] = []
+        for _ in range(10):
+            start_time = time.perf_counter()
+            vec_attr, vec_index = dataset._build_edge_attributes_with_cfg(one_hop, two_hop, z, x_0)
+            times.append(time.perf_counter() - start_time)
+        vec_time = float(np.median(times))
+
+        assert torch.equal(loop_attr, vec_attr), f"Edge attributes differ for N={num_atoms}"
+        assert torch.equal(loop_index[0], vec_index[0]) and torch.equal(loop_index[1], vec_index[1]), f"Edge indices differ for N={num_atoms}"
+        print(f"{num_atoms:>6} {vec_attr.shape[0]:>8} {loop_time:>10.4f} {vec_time:>15.6f} {loop_time / vec_time:>8.1f}x")
+
+    # Radius graph construction: dense N x N matrices against the cell list used above DENSE_ADJACENCY_MAX_ATOMS
+    print(f"\n{'N':>6} {'dense (s)':>10} {'cell list (s)':>14} {'speedup':>9}")
+    for num_atoms in [128, 512, 1024, 2048]:
+        x, _ = synthetic_molecule(num_atoms)
+
+        dataset.DENSE_ADJACENCY_MAX_ATOMS = num_atoms
+        start_time = time.perf_counter()
+        dense_one_hop, dense_two_hop = dataset._compute_adjacency_matrix(x, num_atoms, 1.6)
+        dense_time = time.perf_counter() - start_time
+
+        dataset.DENSE_ADJACENCY_MAX_ATOMS = 0
+        start_time = time.perf_counter()
+        sparse_one_hop, sparse_two_hop = dataset._compute_adjacency_matrix(x, num_atoms, 1.6)
+        sparse_time = time.perf_counter() - start_time
+
+        assert torch.equal(dense_one_hop, sparse_one_hop.to_dense()) and torch.equal(dense_two_hop, sparse_two_hop.to_dense()), f"Adjacency differs for N={num_atoms}"
+        print(f"{num_atoms:>6} {dense_time:>10.4f} {sparse_time:>14.4f} {dense_time / sparse_time:>8.1f}x")
@@ -9,7 +9,8 @@ class NBodyDynamicsDataset(Dataset[dict[str, torch.Tensor]]):
     """
     NBody Dynamics Dataset with pre-replication along num_timesteps axis.
     Each sample's initial state (first frame of the trajectory) is replicated.
-    Output of __getitem__ will be [num_timesteps, nodes, features].
+    Output of __getitem__ will be [num_timesteps, nodes, features], or [nodes, features] for the
+    initial state when replicate_timesteps is False (the consumer then broadcasts over time on device).
     """
 
     def __init__(
@@ -20,6 +21,7 @@ class NBodyDynamicsDataset(Dataset[dict[str, torch.Tensor]]):
         dataset_name: str = "nbody_small",
         num_timesteps: int = 8,
         return_edge_data=False,
+        replicate_timesteps: bool = True,
     ) -> None:
         self.data_dir: str = data_dir
         self.partition: str = partition
@@ -27,6 +29,7 @@ class NBodyDynamicsDataset(Dataset[dict[str, torch.Tensor]]):
         self.dataset_name: str = dataset_name
         self.num_timesteps: int = num_timesteps
         self.return_edge_data: bool = return_edge_data
+        self.replicate_timesteps: bool = replicate_timesteps
 
         match self.partition:
             case DataPartition.train:
@@ -120,6 +123,8 @@ class NBodyDynamicsDataset(Dataset[dict[str, torch.Tensor]]):
     def _replicate_tensor(self, tensor: torch.Tensor) -> torch.Tensor:
         # Input tensor shape: [S, N, D] (e.g. loc_0) or [S, N, 1] (e.g. charges)
         # Output tensor shape: [S, num_timesteps, N, D] or [S, num_timesteps, N, 1]
+        if not self.replicate_timesteps:
+            return tensor
 
         # Add new time dimension for replication
         tensor_unsqueeze = tensor.unsqueeze(1)  # [S, 1, N, D]
@@ -172,9 +177,39 @@ class NBodyDynamicsDataset(Dataset[dict[str, torch.Tensor]]):
             sample["target_node_indices"] = torch.tensor(self.edges[1], dtype=torch.long).contiguous()
         return sample
 
+    def __getitems__(self, indices: list[int]) -> dict[str, torch.Tensor]:
+        """Batched counterpart of __getitem__: one gather per field for the whole batch, to be used with a pass-through collate_fn."""
+        index = torch.as_tensor(indices, dtype=torch.long)
+        delta_frame = self.frame_T - self.frame_0
+        frame_idxs = torch.tensor([self.frame_0 + delta_frame * i // self.num_timesteps for i in range(1, self.num_timesteps + 1)])
+
+        loc = self.replicated_loc.index_select(0, index)
+        vel = self.replicated_vel.index_select(0, index)
+        batch = {
+            "x_0": loc,
+            "v_0": vel,
+            "concatenated_features": torch.cat((loc, vel), dim=-1),
+            "nodes": torch.sqrt(torch.sum(vel**2, dim=-1, keepdim=True)),
+            "edge_attr": self.edge_attr.index_select(0, index),
+            "charges": self.replicated_charges.index_select(0, index),
+            "x_t": self.loc_full[index.unsqueeze(1), frame_idxs.unsqueeze(0)],  # [B, num_timesteps, N, D]
+        }
+        if self.return_edge_data:
+            edges = torch.tensor(self.edges, dtype=torch.long)
+            batch["source_node_indices"] = edges[0].expand(index.shape[0], -1).contiguous()
+            batch["target_node_indices"] = edges[1].expand(index.shape[0], -1).contiguous()
+        return batch
+
     def __len__(self) -> int:
         return self.n_samples
 
+    def time_invariant_bytes_per_sample(self) -> int:
+        """Bytes of a single sample's initial conditions without the time axis ([N, d] per field)."""
+        # concatenated_features and nodes are derived from loc and vel in __getitem__, so they are counted too
+        loc, vel, charges = self.loc_0[0], self.vel_0[0], self.charges[0]
+        num_elements = loc.numel() + vel.numel() + charges.numel() + (loc.numel() + vel.numel()) + vel.shape[0]
+        return num_elements * loc.element_size()
+
 
 if __name__ == "__main__":
     from torch.utils.data import DataLoader
@@ -0,0 +1,69 @@
+import math
+from collections.abc import Iterator
+from typing import final
+
+import torch
+from tensordict import TensorDict
+
+from atom.dataloaders.atom_dataloader import MD17ConcatDataset, MD17DynamicsDataset
+from atom.dataloaders.nbody_dataloader import NBodyDynamicsDataset
+
+BatchedDataset = MD17DynamicsDataset | NBodyDynamicsDataset | MD17ConcatDataset
+
+
+def estimate_dataset_bytes(dataset: BatchedDataset) -> int:
+    """Bytes the fully batched dataset occupies, extrapolated from its first sample."""
+    sample = dataset.__getitems__([0])
+    return len(dataset) * sum(value.numel() * value.element_size() for value in sample.values())
+
+
+@final
+class DeviceResidentLoader:
+    """
+    Drop-in replacement for a DataLoader over a small dataset that fits in device memory.
+
+    The whole dataset is fetched once with __getitems__ into a single TensorDict on the training device.
+    Each epoch then draws a (shuffled) permutation and yields batches by index slicing that TensorDict,
+    so there are no worker processes, no pickling and no per-step host-to-device copies.
+
+    Batches are identical to those of the streaming DataLoader for the same indices. For multitask
+    datasets, edge tensors are stored padded to the largest molecule and trimmed per batch to the
+    largest molecule in that batch, as the streaming path does.
+    """
+
+    EDGE_KEYS: tuple[str, ...] = MD17ConcatDataset.EDGE_KEYS
+
+    def __init__(self, dataset: BatchedDataset, batch_size: int, shuffle: bool, device: torch.device) -> None:
+        """
+        Args:
+            dataset (BatchedDataset): A dataset implementing __getitems__.
+            batch_size (int): Number of samples per batch.
+            shuffle (bool): Whether to draw a new random permutation every epoch.
+            device (torch.device): Device on which the dataset is stored and batches are returned.
+        """
+        self.dataset: BatchedDataset = dataset
+        self.batch_size: int = batch_size
+        self.shuffle: bool = shuffle
+
+        num_samples = len(dataset)
+        self.data: TensorDict = TensorDict(dataset.__getitems__(list(range(num_samples))), batch_size=[num_samples], device=device)
+
+        # Per-sample edge counts, only needed when molecules with different edge counts share the dataset
+        self.edge_counts: torch.Tensor | None = None
+        if isinstance(dataset, MD17ConcatDataset) and "edge_attr" in self.data.keys():
+            self.edge_counts = torch.cat([torch.full((len(molecule),), molecule.edge_attr.shape[0]) for molecule in dataset.molecule_datasets])
+
+    def __len__(self) -> int:
+        return math.ceil(len(self.dataset) / self.batch_size)
+
+    def __iter__(self) -> Iterator[TensorDict]:
+        num_samples = len(self.dataset)
+        # The permutation is drawn on the host from the default generator, like the DataLoader's RandomSampler
+        order = torch.randperm(num_samples) if self.shuffle else torch.arange(num_samples)
+        for batch_indices in order.split(self.batch_size):
+            batch = self.data[batch_indices.to(self.data.device, non_blocking=True)]
+            if self.edge_counts is not None:
+                num_edges = int(self.edge_counts[batch_indices].max())
+                for key in self.EDGE_KEYS:
+                    batch[key] = batch[key][:, :num_edges]
+            yield batch
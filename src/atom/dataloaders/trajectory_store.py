@@ -0,0 +1,84 @@
+import os
+from typing import final
+
+import numpy as np
+import numpy.typing as npt
+
+
+@final
+class TrajectoryStore:
+    """
+    Process-wide store of decoded MD trajectories.
+
+    The train, val and test partitions of a molecule are built from the same compressed ``.npz``. The store
+    decodes each file once and hands the same read-only arrays to every partition. Call ``release`` once the
+    datasets are built, so the full trajectories do not outlive processing.
+    """
+
+    _trajectories: dict[tuple[str, str, str], tuple[npt.NDArray[np.float64], npt.NDArray[np.uint8]]] = {}
+
+    @classmethod
+    def load(cls, path: str, positions_col: str, charges_col: str) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.uint8]]:
+        """Decode a trajectory file, or return the arrays decoded by an earlier call.
+
+        Args:
+            path (str): Path to the ``.npz`` trajectory file.
+            positions_col (str): Name of the positions array, of shape (frames, atoms, 3).
+            charges_col (str): Name of the atomic numbers array, of shape (atoms,).
+
+        Returns:
+            tuple[npt.NDArray[np.float64], npt.NDArray[np.uint8]]: (positions, atomic numbers). The arrays are shared and must not be modified.
+        """
+        key = (os.path.abspath(path), positions_col, charges_col)
+        if key not in cls._trajectories:
+            with np.load(path) as data_file:
+                positions, charges = data_file[positions_col], data_file[charges_col]
+            positions.flags.writeable = False
+            charges.flags.writeable = False
+            cls._trajectories[key] = (positions, charges)
+        return cls._trajectories[key]
+
+    @classmethod
+    def release(cls) -> None:
+        """Drop every decoded trajectory."""
+        cls._trajectories.clear()
+
+
+@final
+class SampledTrajectory:
+    """
+    Positions and finite-difference velocities of a trajectory at a subset of its frames.
+
+    Only the requested frames (and their successors, for the velocities) are copied out of the full trajectory,
+    and atoms outside ``atom_mask`` are dropped after gathering. Frames are looked up by their index in the full
+    trajectory, so callers can keep doing frame arithmetic such as ``split_times + delta_frame``.
+    """
+
+    def __init__(self, positions: npt.NDArray[np.float64], frames: npt.NDArray[np.int_], atom_mask: npt.NDArray[np.bool_] | None = None) -> None:
+        """
+        Args:
+            positions (npt.NDArray[np.float64]): Full trajectory of shape (frames, atoms, 3).
+            frames (npt.NDArray[np.int_]): Indices of the frames that will be looked up, in any order and with repeats.
+            atom_mask (npt.NDArray[np.bool_] | None): Atoms to keep, e.g. heavy atoms only. All atoms are kept if None.
+        """
+        self.frames: npt.NDArray[np.int_] = np.unique(frames)
+        assert self.frames[0] >= 0 and self.frames[-1] + 1 < positions.shape[0], f"Frames must lie in [0, {positions.shape[0] - 1}) to have a velocity"
+
+        x = positions[self.frames]
+        v = positions[self.frames + 1] - x  # Velocities from successive coords
+        if atom_mask is not None:
+            x = x[:, atom_mask, ...]
+            v = v[:, atom_mask, ...]
+        self.x: npt.NDArray[np.float64] = x
+        self.v: npt.NDArray[np.float64] = v
+
+    def _rows(self, frames: npt.NDArray[np.int_]) -> npt.NDArray[np.int_]:
+        rows = np.searchsorted(self.frames, frames).clip(max=len(self.frames) - 1)
+        assert np.array_equal(self.frames[rows], frames), "Requested frames that were not gathered"
+        return rows
+
+    def positions(self, frames: npt.NDArray[np.int_]) -> npt.NDArray[np.float64]:
+        return self.x[self._rows(frames)]
+
+    def velocities(self, frames: npt.NDArray[np.int_]) -> npt.NDArray[np.float64]:
+        return self.v[self._rows(frames)]
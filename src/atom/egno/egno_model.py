@@ -1,12 +1,15 @@
 import torch
 from torch import nn
 import math
-from atom.training.config_options import FFNActivation
+from functools import partial
+from torch.utils.checkpoint import checkpoint
+from atom.training.config_options import CheckpointPolicy, FFNActivation
 from atom.egno.layers import TimeConvMode
 from atom.egno.layers import EGNN
 from atom.egno.layers import TimeConv
 from typing import assert_type, override, final
 from atom.atom.activations import get_activation
+from atom.atom.atom_model import checkpointed_layers
 from tensordict import TensorDict
 
 
@@ -22,9 +25,14 @@ class EGNO(nn.Module):
         num_fourier_modes: int,
         time_embed_dim: int,
         num_timesteps: int,
+        checkpoint_policy: CheckpointPolicy = CheckpointPolicy.NONE,
+        checkpoint_every: int = 2,
     ):
         super().__init__()
+        assert checkpoint_policy != CheckpointPolicy.ATTENTION_ONLY, "EGNO has no attention to checkpoint"
         self.num_layers = num_layers
+        # EGNN layers whose edge messages are recomputed in the backward pass instead of stored
+        self.checkpointed_layers = checkpointed_layers(checkpoint_policy, num_layers, checkpoint_every)
         self.num_fourier_modes = num_fourier_modes
         self.time_embed_dim = time_embed_dim
         self.use_time_conv = use_time_conv
@@ -89,12 +97,12 @@ class EGNO(nn.Module):
 
         if "concatenated_features" in batch:
             h = batch["concatenated_features"][..., -2:]  # ||v||, Z
-            h = h.view(B * T * N, -1)
+            h = h.reshape(B * T * N, -1)  # reshape: inputs may be time-broadcast views
             h = torch.cat((h, time_emb), dim=-1)  # [B * T * N, H]
             h: torch.Tensor = self.egnn.embedding(h)
         else:
             h = batch["nodes"]
-            h = h.view(B * T * N, -1)
+            h = h.reshape(B * T * N, -1)
             h = torch.cat((h, time_emb), dim=-1)  # [B * T * N, H]
             h: torch.Tensor = self.egnn.embedding(h)
 
@@ -131,7 +139,9 @@ class EGNO(nn.Module):
                 x = temp[..., 0].view(B * T * N, 3) + loc_mean  # Shape [B*T*N, 3] matches
                 v = temp[..., 1].view(B * T * N, 3)  # Shape [B*T*N, 3] matches
 
-            loc_pred, vel_pred, h = self.egnn.layers[i](x.detach(), h, edge_index, edge_attr.detach(), v)
+            layer = self.egnn.layers[i]
+            run_layer = partial(checkpoint, layer, use_reentrant=False) if i in self.checkpointed_layers and torch.is_grad_enabled() else layer
+            loc_pred, vel_pred, h = run_layer(x.detach(), h, edge_index, edge_attr.detach(), v)
 
         if v is not None:
             return loc_pred.reshape(B, T, N, 3)
@@ -2,6 +2,7 @@ from atom.inference.inference_utils import parse_inference_args, clean_state_dic
 from atom.training import Config, eval_epoch, create_dataloaders_single, create_dataloaders_multitask
 import torch
 from atom.training import initialize_model
+from atom.atom.atom_model import ATOM
 from collections import OrderedDict
 
 
@@ -26,6 +27,8 @@ def main() -> None:
     clean_model_state_dict = clean_state_dict_prefixes(model_state_dict)
     _ = model.load_state_dict(clean_model_state_dict)
     _ = model.eval()
+    if args.freeze and isinstance(model, ATOM):
+        _ = model.freeze_for_inference()
 
     test_s2t_loss, test_s2s_loss = eval_epoch(config, model, test_loader)
 
@@ -15,6 +15,11 @@ def parse_inference_args() -> argparse.Namespace:
         type=str,
         help="Path to a config.toml file",
     )
+    _ = parser.add_argument(
+        "--freeze",
+        action="store_true",
+        help="Replace the e3nn linear layers of ATOM by equivalent dense layers",
+    )
     return parser.parse_args()
 
 
@@ -1,7 +1,21 @@
 from .create_model import initialize_model
 from .create_optimisers import initialize_optimizer, initialize_scheduler
 from .create_dataloaders import create_dataloaders_single, create_dataloaders_multitask
-from .training_utils import set_seeds, add_brownian_noise, log_weights, parse_train_args, set_environment_variables, get_config_files
+from .training_utils import (
+    set_seeds,
+    add_brownian_noise,
+    batch_num_samples,
+    broadcast_time_invariant_inputs,
+    compile_model,
+    compiled_graph_count,
+    log_weights,
+    mark_dynamic_dims,
+    parse_train_args,
+    peak_memory_mb,
+    reset_peak_memory,
+    set_environment_variables,
+    get_config_files,
+)
 from .load_config import Config
 from .save_results import SingleRunResults, MultiRunResults
 from .config_options import MD17MoleculeType, RMD17MoleculeType, TG80MoleculeType, Datasets
@@ -21,6 +35,13 @@ __all__ = [
     "create_dataloaders_multitask",
     "set_seeds",
     "add_brownian_noise",
+    "batch_num_samples",
+    "broadcast_time_invariant_inputs",
+    "compile_model",
+    "compiled_graph_count",
+    "mark_dynamic_dims",
+    "reset_peak_memory",
+    "peak_memory_mb",
     "log_weights",
     "SingleRunResults",
     "MultiRunResults",
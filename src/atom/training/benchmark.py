@@ -1,7 +1,6 @@
 from datetime import datetime
 from pathlib import Path
 
-import torch
 from tqdm.std import tqdm
 import wandb
 
@@ -10,6 +9,7 @@ from atom.training import (
     set_seeds,
     MultiRunResults,
     SingleRunResults,
+    compile_model,
     initialize_model,
     train_model,
 )
@@ -39,7 +39,7 @@ def singletask_benchmark(config: Config) -> None:
         runs_progress_bar.set_description(f"Run {run+1}/{config.benchmark.runs}")
         model = initialize_model(config).to(config.training.device)
         if config.benchmark.compile:
-            model = torch.compile(model)
+            model = compile_model(config, model)
 
         # Pass the weights directory to main function
         single_run_results = train_model(
@@ -98,7 +98,7 @@ def multitask_benchmark(config: Config) -> None:
         runs_progress_bar.set_description(f"Run {run+1}/{config.benchmark.runs}")
         model = initialize_model(config).to(config.training.device)
         if config.benchmark.compile:
-            model = torch.compile(model)
+            model = compile_model(config, model)
 
         # Pass the weights directory to main function
         single_run_results = train_model(
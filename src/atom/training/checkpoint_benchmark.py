@@ -0,0 +1,112 @@
+import multiprocessing
+import resource
+import time
+
+import torch
+import torch.nn as nn
+from tensordict import TensorDict
+
+from atom.training.config_options import AttentionType, CheckpointPolicy, EquivariantLiftingType, FFNActivation, ModelType, NormType, ValueResidualType
+from atom.atom.atom_model import ATOM
+from atom.egno.egno_model import EGNO
+
+
+def build_model(model_type: ModelType, policy: CheckpointPolicy, num_layers: int, lifting_dim: int, num_timesteps: int) -> nn.Module:
+    """An ATOM (GHCA) or EGNO model with the given checkpointing policy, checkpointing every second layer for EVERY_KTH_LAYER."""
+    if model_type == ModelType.ATOM:
+        return ATOM(
+            lifting_dim=lifting_dim,
+            norm=NormType.LAYER,
+            activation=FFNActivation.SILU,
+            num_layers=num_layers,
+            num_heads=8,
+            attention_type=AttentionType.GHCA,
+            output_heads=1,
+            delta_update=True,
+            num_timesteps=num_timesteps,
+            use_rope=True,
+            rope_base=1000.0,
+            use_spherical_harmonics=True,
+            use_equivariant_lifting=EquivariantLiftingType.NONE,
+            rrwp_length=0,
+            value_residual_type=ValueResidualType.NONE,
+            learnable_attention_denom=False,
+            checkpoint_policy=policy,
+            checkpoint_every=2,
+        )
+    return EGNO(
+        num_node_features=2,
+        num_edge_features=5,
+        num_layers=num_layers,
+        lifting_dim=lifting_dim,
+        activation=FFNActivation.SILU,
+        use_time_conv=True,
+        num_fourier_modes=2,
+        time_embed_dim=32,
+        num_timesteps=num_timesteps,
+        checkpoint_policy=policy,
+        checkpoint_every=2,
+    )
+
+
+def random_batch(batch_size: int, num_timesteps: int, num_nodes: int, device: torch.device) -> TensorDict:
+    """MD17-shaped inputs over fully connected molecules, with edge indices into the flattened batch of nodes."""
+    source, target = torch.triu_indices(num_nodes, num_nodes, offset=1)
+    offsets = (torch.arange(batch_size) * num_nodes).unsqueeze(1)
+    batch = {
+        "x_0": torch.randn(batch_size, num_timesteps, num_nodes, 4),
+        "v_0": torch.randn(batch_size, num_timesteps, num_nodes, 4),
+        "concatenated_features": torch.randn(batch_size, num_timesteps, num_nodes, 9),
+        "x_t": torch.randn(batch_size, num_timesteps, num_nodes, 3),
+        "source_node_indices": source + offsets,
+        "target_node_indices": target + offsets,
+        "edge_attr": torch.randn(batch_size, source.shape[0], 4),
+    }
+    return TensorDict(batch, batch_size=[batch_size], device=device)
+
+
+def measure(model_type: ModelType, policy: CheckpointPolicy, batch_size: int, device: torch.device, steps: int = 10) -> tuple[float, float]:
+    """Median training step time in seconds and peak memory in MiB: device allocations on CUDA, growth of the process RSS on CPU."""
+    num_layers, lifting_dim, num_timesteps, num_nodes = 6, 128, 8, 21
+    model = build_model(model_type, policy, num_layers, lifting_dim, num_timesteps).to(device).train()
+    optimizer = torch.optim.Adam(model.parameters())
+    batch = random_batch(batch_size, num_timesteps, num_nodes, device)
+    target = batch.pop("x_t")
+
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    times: list[float] = []
+    for _ in range(steps + 2):  # The first steps warm up the kernels and the allocator
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        start_time = time.perf_counter()
+        optimizer.zero_grad()
+        loss = (model(batch) - target).square().mean()
+        loss.backward()
+        optimizer.step()
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start_time)
+
+    if device.type == "cuda":
+        peak_memory_mb = torch.cuda.max_memory_allocated(device) / 2**20
+    else:
+        peak_memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10 - rss_before
+    return sorted(times[2:])[steps // 2], peak_memory_mb
+
+
+if __name__ == "__main__":
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    batch_size = 32
+
+    print(f"Device: {device}, B={batch_size}, 6 layers, d=128, T=8, N=21")
+    print(f"{'model':>6} {'policy':>16} {'step (ms)':>10} {'peak (MiB)':>11}")
+    # Every measurement runs in a fresh process, so the CPU high-water mark of one policy does not hide the next
+    with multiprocessing.get_context("spawn").Pool(processes=1, maxtasksperchild=1) as pool:
+        for model_type in (ModelType.ATOM, ModelType.EGNO):
+            for policy in CheckpointPolicy:
+                if model_type == ModelType.EGNO and policy == CheckpointPolicy.ATTENTION_ONLY:
+                    continue
+                step_time, peak_memory_mb = pool.apply(measure, (model_type, policy, batch_size, device))
+                print(f"{model_type:>6} {policy:>16} {step_time * 1e3:>10.2f} {peak_memory_mb:>11.1f}")
@@ -165,15 +165,33 @@ class ValueResidualType(StrEnum):
 class AttentionType(StrEnum):
     SELF = "self"
     GHCA = "ghca"
+    FACTORIZED = "factorized"
+    SPARSE = "sparse"
+    LINEAR = "linear"
+
+
+@final
+class AttentionBackend(StrEnum):
+    MATH = "math"
+    SDPA = "sdpa"
 
 
 @final
 class EquivariantLiftingType(StrEnum):
     NONE = "none"
     EQUIVARIANT = "equivariant"
+    CHANNELWISE = "channelwise_tensor_product"
     NO_TP = "no_tensor_product"
 
 
+@final
+class CheckpointPolicy(StrEnum):
+    NONE = "none"
+    EVERY_LAYER = "every_layer"
+    EVERY_KTH_LAYER = "every_kth_layer"
+    ATTENTION_ONLY = "attention_only"
+
+
 @final
 class FFNActivation(StrEnum):
     RELU = "relu"
@@ -1,12 +1,14 @@
 import torch
 from torch.utils.data import DataLoader
 from tqdm import tqdm
-from torch.utils.data._utils.collate import default_collate
-from typing import cast
 
-from atom.dataloaders.atom_dataloader import MD17DynamicsDataset
+from atom.dataloaders.atom_dataloader import MD17ConcatDataset, MD17DynamicsDataset
+from atom.dataloaders.bucket_sampler import SizeBucketBatchSampler
 from atom.dataloaders.nbody_dataloader import NBodyDynamicsDataset
+from atom.dataloaders.resident_loader import BatchedDataset, DeviceResidentLoader, estimate_dataset_bytes
+from atom.dataloaders.trajectory_store import TrajectoryStore
 from atom.training.config_options import (
+    AttentionType,
     DataPartition,
     MD17MoleculeType,
     TG80MoleculeType,
@@ -39,6 +41,10 @@ def create_datasets(
     if config.benchmark.model_type == ModelType.EGNO:
         return_edge_data = True
         egno_mode = True
+    elif config.atom_config.heterogenous_attention_type == AttentionType.SPARSE:
+        # Sparse attention only reads the edge list and the hop count of every edge
+        return_edge_data = True
+        egno_mode = False
     else:
         return_edge_data = False
         egno_mode = False
@@ -62,6 +68,10 @@ def create_datasets(
                 return_edge_data=return_edge_data,
                 egno_mode=egno_mode,
                 max_edges=max_edges,
+                cache_dir=config.dataloader.dataset_cache_dir,
+                cache_max_gb=config.dataloader.dataset_cache_max_gb,
+                replicate_timesteps=not config.dataloader.lazy_time_replication,
+                resample_windows=config.dataloader.resample_train_windows,
             )
 
             val_dataset = MD17DynamicsDataset(
@@ -81,6 +91,9 @@ def create_datasets(
                 return_edge_data=return_edge_data,
                 egno_mode=egno_mode,
                 max_edges=max_edges,
+                cache_dir=config.dataloader.dataset_cache_dir,
+                cache_max_gb=config.dataloader.dataset_cache_max_gb,
+                replicate_timesteps=not config.dataloader.lazy_time_replication,
             )
 
             test_dataset = MD17DynamicsDataset(
@@ -100,6 +113,9 @@ def create_datasets(
                 return_edge_data=return_edge_data,
                 egno_mode=egno_mode,
                 max_edges=max_edges,
+                cache_dir=config.dataloader.dataset_cache_dir,
+                cache_max_gb=config.dataloader.dataset_cache_max_gb,
+                replicate_timesteps=not config.dataloader.lazy_time_replication,
             )
         case Datasets.nbody_simple:
             train_dataset = NBodyDynamicsDataset(
@@ -108,6 +124,7 @@ def create_datasets(
                 num_timesteps=config.dataloader.num_timesteps,
                 data_dir="data/n_body_simple",
                 return_edge_data=return_edge_data,
+                replicate_timesteps=not config.dataloader.lazy_time_replication,
             )
 
             val_dataset = NBodyDynamicsDataset(
@@ -115,6 +132,7 @@ def create_datasets(
                 num_timesteps=config.dataloader.num_timesteps,
                 data_dir="data/n_body_simple",
                 return_edge_data=return_edge_data,
+                replicate_timesteps=not config.dataloader.lazy_time_replication,
             )
 
             test_dataset = NBodyDynamicsDataset(
@@ -122,6 +140,7 @@ def create_datasets(
                 num_timesteps=config.dataloader.num_timesteps,
                 data_dir="data/n_body_simple",
                 return_edge_data=return_edge_data,
+                replicate_timesteps=not config.dataloader.lazy_time_replication,
             )
 
     return train_dataset, val_dataset, test_dataset
@@ -129,7 +148,11 @@ def create_datasets(
 
 def create_dataloaders_single(
     config: Config,
-) -> tuple[DataLoader[dict[str, torch.Tensor]], DataLoader[dict[str, torch.Tensor]], DataLoader[dict[str, torch.Tensor]]]:
+) -> tuple[
+    DataLoader[dict[str, torch.Tensor]] | DeviceResidentLoader,
+    DataLoader[dict[str, torch.Tensor]] | DeviceResidentLoader,
+    DataLoader[dict[str, torch.Tensor]] | DeviceResidentLoader,
+]:
     """Create train, test and validation Torch dataloaders.
 
     Args:
@@ -140,6 +163,14 @@ def create_dataloaders_single(
         tuple[DataLoader[dict[str, torch.Tensor]], DataLoader[dict[str, torch.Tensor]], DataLoader[dict[str, torch.Tensor]]]: The train/val/test Torch dataloaders.
     """
     train_dataset, val_dataset, test_dataset = create_datasets(config, config.dataloader.molecule_type, max_nodes=None)
+    TrajectoryStore.release()
+    if config.dataloader.lazy_time_replication:
+        _report_time_replication_savings([train_dataset, val_dataset, test_dataset], config.dataloader.num_timesteps)
+
+    if config.dataloader.device_resident:
+        resident_loaders = _create_resident_loaders(config, train_dataset, val_dataset, test_dataset)
+        if resident_loaders is not None:
+            return resident_loaders
 
     train_loader = DataLoader(
         train_dataset,
@@ -149,7 +180,7 @@ def create_dataloaders_single(
         num_workers=config.dataloader.num_workers,
         pin_memory=config.dataloader.pin_memory,
         prefetch_factor=config.dataloader.prefetch_factor,
-        collate_fn=_pad_edges_to_uniform_length if config.benchmark.model_type == ModelType.EGNO else None,
+        collate_fn=_collate_prebatched,
     )
     val_loader = DataLoader(
         val_dataset,
@@ -159,7 +190,7 @@ def create_dataloaders_single(
         num_workers=config.dataloader.num_workers,
         pin_memory=config.dataloader.pin_memory,
         prefetch_factor=config.dataloader.prefetch_factor,
-        collate_fn=_pad_edges_to_uniform_length if config.benchmark.model_type == ModelType.EGNO else None,
+        collate_fn=_collate_prebatched,
     )
     test_loader = DataLoader(
         test_dataset,
@@ -169,7 +200,7 @@ def create_dataloaders_single(
         num_workers=config.dataloader.num_workers,
         pin_memory=config.dataloader.pin_memory,
         prefetch_factor=config.dataloader.prefetch_factor,
-        collate_fn=_pad_edges_to_uniform_length if config.benchmark.model_type == ModelType.EGNO else None,
+        collate_fn=_collate_prebatched,
     )
 
     return train_loader, val_loader, test_loader
@@ -177,7 +208,11 @@ def create_dataloaders_single(
 
 def create_dataloaders_multitask(
     config: Config,
-) -> tuple[DataLoader[MD17DynamicsDataset], DataLoader[MD17DynamicsDataset], DataLoader[MD17DynamicsDataset]]:
+) -> tuple[
+    DataLoader[MD17DynamicsDataset] | DeviceResidentLoader,
+    DataLoader[MD17DynamicsDataset] | DeviceResidentLoader,
+    DataLoader[MD17DynamicsDataset] | DeviceResidentLoader,
+]:
     """Create train, test and validation Torch dataloaders for multiple molecule types and concatenate them into a single dataloader.
 
     Args:
@@ -192,44 +227,65 @@ def create_dataloaders_multitask(
     assert config.dataloader.train_molecules is not None
     assert config.dataloader.validation_molecules is not None
     assert config.dataloader.test_molecules is not None
-    for molecule_type in config.dataloader.train_molecules + config.dataloader.validation_molecules + config.dataloader.test_molecules:
+    # Every molecule is decoded once, its partitions built in one pass, and its trajectory released before the next
+    molecule_types = list(dict.fromkeys(config.dataloader.train_molecules + config.dataloader.validation_molecules + config.dataloader.test_molecules))
+    for molecule_type in molecule_types:
         max_nodes_finder, _, _ = create_datasets(config, molecule_type, max_nodes=None)
         max_nodes = max(max_nodes, max_nodes_finder.num_nodes)
-        # Compute max edges for this molecule
-        one_hop_adjacency, _ = max_nodes_finder._compute_adjacency_matrix(max_nodes_finder.x, max_nodes_finder.num_nodes, max_nodes_finder.radius_graph_threshold)
-        num_edges = one_hop_adjacency.sum().item()
-        max_edges = max(max_edges, num_edges)
+        max_edges = max(max_edges, max_nodes_finder.num_one_hop_edges)
+        TrajectoryStore.release()
 
     tqdm.write(f"Inferred max_nodes across all molecules as: {max_nodes}")
     tqdm.write(f"Inferred max_edges across all molecules as: {max_edges}")
-    train_loaders: list[MD17DynamicsDataset] = []
-    val_loaders: list[MD17DynamicsDataset] = []
-    test_loaders: list[MD17DynamicsDataset] = []
-
-    for train_molecule_type in config.dataloader.train_molecules:
-        train_dataset, _, _ = create_datasets(config, train_molecule_type, max_nodes=max_nodes, max_edges=max_edges)
-        train_loaders.append(train_dataset)
-    for validation_molecule_type in config.dataloader.validation_molecules:
-        _, val_dataset, _ = create_datasets(config, validation_molecule_type, max_nodes=max_nodes, max_edges=max_edges)
-        val_loaders.append(val_dataset)
-    for test_molecule_type in config.dataloader.test_molecules:
-        _, _, test_dataset = create_datasets(config, test_molecule_type, max_nodes=max_nodes, max_edges=max_edges)
-        test_loaders.append(test_dataset)
-
-    multitask_train_dataset: torch.utils.data.ConcatDataset[MD17DynamicsDataset] = torch.utils.data.ConcatDataset(train_loaders)
-    multitask_val_dataset: torch.utils.data.ConcatDataset[MD17DynamicsDataset] = torch.utils.data.ConcatDataset(val_loaders)
-    multitask_test_dataset: torch.utils.data.ConcatDataset[MD17DynamicsDataset] = torch.utils.data.ConcatDataset(test_loaders)
 
-    train_loader = DataLoader(
-        multitask_train_dataset,
-        batch_size=config.training.batch_size,
-        shuffle=True,
-        persistent_workers=config.dataloader.persistent_workers,
-        num_workers=config.dataloader.num_workers,
-        pin_memory=config.dataloader.pin_memory,
-        prefetch_factor=config.dataloader.prefetch_factor,
-        collate_fn=_pad_edges_to_uniform_length if config.benchmark.model_type == ModelType.EGNO else None,
-    )
+    partitions: dict[MD17MoleculeType | RMD17MoleculeType | TG80MoleculeType, tuple[MD17DynamicsDataset, MD17DynamicsDataset, MD17DynamicsDataset]] = {}
+    for molecule_type in molecule_types:
+        partitions[molecule_type] = create_datasets(config, molecule_type, max_nodes=max_nodes, max_edges=max_edges)
+        TrajectoryStore.release()
+
+    train_loaders: list[MD17DynamicsDataset] = [partitions[molecule_type][0] for molecule_type in config.dataloader.train_molecules]
+    val_loaders: list[MD17DynamicsDataset] = [partitions[molecule_type][1] for molecule_type in config.dataloader.validation_molecules]
+    test_loaders: list[MD17DynamicsDataset] = [partitions[molecule_type][2] for molecule_type in config.dataloader.test_molecules]
+
+    if config.dataloader.lazy_time_replication:
+        _report_time_replication_savings(train_loaders + val_loaders + test_loaders, config.dataloader.num_timesteps)
+
+    # With size bucketing, every batch is padded only to its largest molecule instead of the global max_nodes
+    dynamic_padding = config.dataloader.bucket_by_size
+    # Packed batches drop the padding altogether, for training and evaluation alike
+    packed = config.dataloader.packed_batches
+    multitask_train_dataset = MD17ConcatDataset(train_loaders, dynamic_padding=dynamic_padding, packed=packed)
+    multitask_val_dataset = MD17ConcatDataset(val_loaders, dynamic_padding=dynamic_padding, packed=packed)
+    multitask_test_dataset = MD17ConcatDataset(test_loaders, dynamic_padding=dynamic_padding, packed=packed)
+
+    if config.dataloader.device_resident:
+        resident_loaders = _create_resident_loaders(config, multitask_train_dataset, multitask_val_dataset, multitask_test_dataset)
+        if resident_loaders is not None:
+            return resident_loaders
+
+    if config.dataloader.bucket_by_size:
+        # Only the training batches are regrouped by size. Evaluation keeps its sequential batches, whose per-batch
+        # masked losses are then weighted exactly as without bucketing, and only drops the padding
+        train_loader = DataLoader(
+            multitask_train_dataset,
+            batch_sampler=SizeBucketBatchSampler(multitask_train_dataset.sample_num_nodes(), batch_size=config.training.batch_size, shuffle=True),
+            persistent_workers=config.dataloader.persistent_workers,
+            num_workers=config.dataloader.num_workers,
+            pin_memory=config.dataloader.pin_memory,
+            prefetch_factor=config.dataloader.prefetch_factor,
+            collate_fn=_collate_prebatched,
+        )
+    else:
+        train_loader = DataLoader(
+            multitask_train_dataset,
+            batch_size=config.training.batch_size,
+            shuffle=True,
+            persistent_workers=config.dataloader.persistent_workers,
+            num_workers=config.dataloader.num_workers,
+            pin_memory=config.dataloader.pin_memory,
+            prefetch_factor=config.dataloader.prefetch_factor,
+            collate_fn=_collate_prebatched,
+        )
     val_loader = DataLoader(
         multitask_val_dataset,
         batch_size=config.training.batch_size,
@@ -238,7 +294,7 @@ def create_dataloaders_multitask(
         num_workers=config.dataloader.num_workers,
         pin_memory=config.dataloader.pin_memory,
         prefetch_factor=config.dataloader.prefetch_factor,
-        collate_fn=_pad_edges_to_uniform_length if config.benchmark.model_type == ModelType.EGNO else None,
+        collate_fn=_collate_prebatched,
     )
     test_loader = DataLoader(
         multitask_test_dataset,
@@ -248,58 +304,79 @@ def create_dataloaders_multitask(
         num_workers=config.dataloader.num_workers,
         pin_memory=config.dataloader.pin_memory,
         prefetch_factor=config.dataloader.prefetch_factor,
-        collate_fn=_pad_edges_to_uniform_length if config.benchmark.model_type == ModelType.EGNO else None,
+        collate_fn=_collate_prebatched,
     )
 
     return train_loader, val_loader, test_loader
 
 
+def _create_resident_loaders(
+    config: Config, train_dataset: BatchedDataset, val_dataset: BatchedDataset, test_dataset: BatchedDataset
+) -> tuple[DeviceResidentLoader, DeviceResidentLoader, DeviceResidentLoader] | None:
+    """Move the train/val/test datasets onto the training device, if together they fit within the resident memory budget.
+
+    Args:
+        config (Config): The configuration file.
+        train_dataset (BatchedDataset): The train dataset.
+        val_dataset (BatchedDataset): The validation dataset.
+        test_dataset (BatchedDataset): The test dataset.
+
+    Returns:
+        tuple[DeviceResidentLoader, DeviceResidentLoader, DeviceResidentLoader] | None: The train/val/test loaders, or None
+            if the datasets exceed config.dataloader.resident_max_gb and streaming DataLoaders should be used instead.
+    """
+    if config.dataloader.bucket_by_size:
+        tqdm.write("Size-bucketed batches are padded per batch, so they are not kept resident: using streaming DataLoaders")
+        return None
+    if config.dataloader.packed_batches:
+        tqdm.write("Packed batches are laid out per batch, so they are not kept resident: using streaming DataLoaders")
+        return None
+    if config.dataloader.resample_train_windows:
+        tqdm.write("Resampled training windows are drawn on every fetch, so they cannot be kept resident: using streaming DataLoaders")
+        return None
+
+    total_bytes = sum(estimate_dataset_bytes(dataset) for dataset in (train_dataset, val_dataset, test_dataset))
+    if total_bytes > config.dataloader.resident_max_gb * 1024**3:
+        tqdm.write(
+            f"Datasets take {total_bytes / 1024**3:.2f} GB, above resident_max_gb = {config.dataloader.resident_max_gb} GB: falling back to streaming DataLoaders"
+        )
+        return None
+
+    tqdm.write(f"Keeping {total_bytes / 1024**2:.1f} MB of datasets resident on {config.training.device}")
+    device = torch.device(config.training.device)
+    return (
+        DeviceResidentLoader(train_dataset, batch_size=config.training.batch_size, shuffle=True, device=device),
+        DeviceResidentLoader(val_dataset, batch_size=config.training.batch_size, shuffle=False, device=device),
+        DeviceResidentLoader(test_dataset, batch_size=config.training.batch_size, shuffle=False, device=device),
+    )
+
+
+def _report_time_replication_savings(datasets: list[MD17DynamicsDataset] | list[MD17DynamicsDataset | NBodyDynamicsDataset], num_timesteps: int) -> None:
+    """Report the host memory and per-epoch host-to-device traffic saved by not replicating initial conditions over time.
+
+    Args:
+        datasets (list[MD17DynamicsDataset | NBodyDynamicsDataset]): Datasets built with replicate_timesteps=False.
+        num_timesteps (int): The number of timesteps the initial conditions would otherwise be replicated to.
+    """
+    stored_bytes = sum(len(dataset) * dataset.time_invariant_bytes_per_sample() for dataset in datasets)
+    replicated_bytes = stored_bytes * num_timesteps
+    # Every sample is transferred to the device once per epoch, so the traffic saved equals the memory saved
+    tqdm.write(
+        f"Lazy time replication: initial conditions take {stored_bytes / 1024**2:.1f} MB instead of {replicated_bytes / 1024**2:.1f} MB "
+        f"({num_timesteps}x less host memory, worker pickling and host-to-device traffic; {(replicated_bytes - stored_bytes) / 1024**2:.1f} MB saved per epoch)"
+    )
+
+
 # -----------------------
 # Custom collate function
 # -----------------------
 
 
-def _pad_edges_to_uniform_length(batch: list[dict[str, torch.Tensor]]) -> dict[str, torch.Tensor]:
-    """Collate function that zero-pads *edge* tensors so that all samples in a batch have
-    the same number of edges.
-
-    The EGNO implementation expects tensors with shape ``[B, E, ...]`` where ``E`` is
-    identical for every sample in the batch.  When batching molecules with different
-    numbers of edges the default PyTorch ``default_collate`` fails.  This helper first
-    determines the maximum number of edges in the batch and then right-pads the
-    following keys to that size:
-        * ``edge_attr``               – float tensor of shape ``[E, d_e]``
-        * ``source_node_indices``     – integer tensor of shape ``[E]``
-        * ``target_node_indices``     – integer tensor of shape ``[E]``
+def _collate_prebatched(batch: dict[str, torch.Tensor]) -> dict[str, torch.Tensor]:
+    """Pass-through collate function.
 
-    All other keys are collated with the stock ``default_collate``.
+    The datasets implement ``__getitems__``, so the DataLoader hands the collate function a
+    batch that is already stacked (and, for multitask EGNO, already edge-padded) rather than a
+    list of per-sample dicts. Nothing is left to do besides returning it.
     """
-
-    # Keys that require special handling
-    edge_keys = {"edge_attr", "source_node_indices", "target_node_indices"}
-
-    # Determine the maximum edge count in the incoming mini-batch
-    max_edges = max(sample["edge_attr"].shape[0] for sample in batch)
-
-    padded_batch: list[dict[str, torch.Tensor]] = []
-    for sample in batch:
-        padded_sample: dict[str, torch.Tensor] = {}
-        for key, value in sample.items():
-            if key in edge_keys:
-                # Compute the amount of padding required for this sample
-                pad_len = max_edges - value.shape[0]
-                if pad_len > 0:
-                    if key == "edge_attr":
-                        # value shape: [E, d_e] – pad rows with zeros
-                        pad_tensor = torch.zeros(pad_len, value.shape[1], dtype=value.dtype)
-                    else:
-                        # index tensors are 1-D – pad with zeros (valid self-loop indices)
-                        pad_tensor = torch.zeros(pad_len, dtype=value.dtype)
-                    value = torch.cat([value, pad_tensor], dim=0)
-                padded_sample[key] = value
-            else:
-                padded_sample[key] = value
-        padded_batch.append(padded_sample)
-
-    # Delegate the heavy lifting of stacking to the default collate implementation
-    return cast(dict[str, torch.Tensor], default_collate(padded_batch))
+    return batch
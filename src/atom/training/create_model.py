@@ -34,6 +34,17 @@ def initialize_model(config: Config) -> nn.Module:
                 rrwp_length=config.dataloader.rrwp_length,
                 value_residual_type=config.atom_config.value_residual_type,
                 learnable_attention_denom=config.atom_config.learnable_attention_denom,
+                attention_backend=config.atom_config.attention_backend,
+                fuse_hetero_streams=config.atom_config.fuse_hetero_streams,
+                sparse_attention_hops=config.atom_config.sparse_attention_hops,
+                sparse_attention_temporal_self=config.atom_config.sparse_attention_temporal_self,
+                attention_query_chunk_size=config.atom_config.attention_query_chunk_size,
+                attention_chunk_memory_mb=config.atom_config.attention_chunk_memory_mb,
+                share_spherical_harmonics_bias=config.atom_config.share_spherical_harmonics_bias,
+                time_invariant_inputs=config.atom_config.time_invariant_inputs,
+                precompute_static_kv=config.atom_config.precompute_static_kv,
+                checkpoint_policy=config.training.checkpoint_policy,
+                checkpoint_every=config.training.checkpoint_every,
             )
         case ModelType.EGNO:
             return EGNO(
@@ -46,6 +57,8 @@ def initialize_model(config: Config) -> nn.Module:
                 num_fourier_modes=config.egno_config.num_fourier_modes,
                 time_embed_dim=config.egno_config.time_embed_dim,
                 num_timesteps=config.dataloader.num_timesteps,
+                checkpoint_policy=config.training.checkpoint_policy,
+                checkpoint_every=config.training.checkpoint_every,
             )
         case _:
             raise ValueError(f"Invalid model type: {config.atom_config.model_type}")
@@ -8,6 +8,8 @@ import torch
 from atom.training.config_options import (
     FFNActivation,
     AttentionType,
+    AttentionBackend,
+    CheckpointPolicy,
     EquivariantLiftingType,
     Datasets,
     MD17MoleculeType,
@@ -30,6 +32,12 @@ class BenchmarkConfig(BaseModel):
     model_type: ModelType
     compile: bool
     compile_trace: bool
+    # Compile every ATOM block (EGNN layer for EGNO) in place, so identical layers share one compiled graph
+    compile_regional: bool = False
+    # Mark the batch and node dims of the model inputs as dynamic, so batch size and padding changes do not recompile
+    compile_dynamic: bool = False
+    # Persistent inductor and FX graph cache, shared by the runs and configs of every process
+    compile_cache_dir: str | None = None
     runs: int
     log_weights: bool
 
@@ -49,6 +57,14 @@ class BenchmarkConfig(BaseModel):
             raise ValueError("CUDA 7.0 or higher is required to compile the model. We recommend CUDA 11.0 or higher.")
         return self
 
+    @model_validator(mode="after")
+    def validate_compile_options(self) -> "BenchmarkConfig":
+        if (self.compile_regional or self.compile_dynamic) and not self.compile:
+            raise ValueError("'compile_regional' and 'compile_dynamic' require 'compile'.")
+        if self.compile_regional and self.compile_dynamic:
+            raise ValueError("'compile_dynamic' marks the model inputs, which regional compilation does not trace. Compiled layers fall back to automatic dynamic shapes.")
+        return self
+
     @model_validator(mode="after")
     def validate_runs(self) -> "BenchmarkConfig":
         if self.runs < 1:
@@ -86,6 +102,21 @@ class DataloaderConfig(BaseModel):
     pin_memory: bool
     prefetch_factor: int
     force_regenerate: bool
+    # Processed dataset cache; disabled when dataset_cache_dir is None
+    dataset_cache_dir: str | None = None
+    dataset_cache_max_gb: float = 20.0
+    # Ship [N, d] initial conditions and broadcast them over time on the training device
+    lazy_time_replication: bool = False
+    # Keep the whole processed dataset on the training device and slice batches from it, without DataLoader workers.
+    # Falls back to streaming DataLoaders when train/val/test together exceed resident_max_gb
+    device_resident: bool = False
+    resident_max_gb: float = 2.0
+    # Draw fresh training windows from the whole train split on every fetch instead of replaying max_samples fixed ones
+    resample_train_windows: bool = False
+    # Multitask only: batch training samples by node count and pad every batch to its largest molecule only
+    bucket_by_size: bool = False
+    # Multitask ATOM only: concatenate the real nodes of a batch into one sequence with block-diagonal attention, so no padding is computed
+    packed_batches: bool = False
 
     @model_validator(mode="after")
     def validate_multitask(self) -> "DataloaderConfig":
@@ -145,6 +176,30 @@ class DataloaderConfig(BaseModel):
 
         return self
 
+    @model_validator(mode="after")
+    def validate_dataset_cache_max_gb(self) -> "DataloaderConfig":
+        if self.dataset_cache_max_gb <= 0.0:
+            raise ValueError("'dataset_cache_max_gb' must be greater than 0.0.")
+        return self
+
+    @model_validator(mode="after")
+    def validate_resample_train_windows(self) -> "DataloaderConfig":
+        if self.resample_train_windows and self.dataset == Datasets.nbody_simple:
+            raise ValueError("'resample_train_windows' is only supported for the MD17, RMD17 and TG80 datasets.")
+        return self
+
+    @model_validator(mode="after")
+    def validate_packed_batches(self) -> "DataloaderConfig":
+        if self.packed_batches and not self.multitask:
+            raise ValueError("'packed_batches' is only supported for multitask training, single-task batches have no padding.")
+        return self
+
+    @model_validator(mode="after")
+    def validate_resident_max_gb(self) -> "DataloaderConfig":
+        if self.resident_max_gb <= 0.0:
+            raise ValueError("'resident_max_gb' must be greater than 0.0.")
+        return self
+
     @model_validator(mode="after")
     def validate_explicit_hydrogen_gradients(self) -> "DataloaderConfig":
         if self.explicit_hydrogen_gradients and not self.explicit_hydrogen:
@@ -164,6 +219,9 @@ class TrainingConfig(BaseModel):
     max_grad_norm: float
     learned_label_noise: bool
     label_noise_std: float
+    # Activation checkpointing: recompute the intermediates of every layer, every k-th layer, or only ATOM's attention in the backward pass
+    checkpoint_policy: CheckpointPolicy = CheckpointPolicy.NONE
+    checkpoint_every: int = 2
 
     class Config:
         arbitrary_types_allowed = True
@@ -186,6 +244,12 @@ class TrainingConfig(BaseModel):
             raise ValueError("'brownian_noise_std' must be 0.0 or greater.")
         return self
 
+    @model_validator(mode="after")
+    def validate_checkpoint_every(self) -> "TrainingConfig":
+        if self.checkpoint_every < 1:
+            raise ValueError("'checkpoint_every' must be greater than 0.")
+        return self
+
     @model_validator(mode="after")
     def validate_amp_dtype(self) -> "TrainingConfig":
         if self.use_amp and self.amp_dtype not in [torch.float16, torch.bfloat16]:
@@ -232,8 +296,23 @@ class ATOMConfig(BaseModel):
     use_rope: bool
     rope_base: float
     learnable_attention_denom: bool
+    attention_backend: AttentionBackend = AttentionBackend.MATH
+    # GHCA only: project and attend to the three heterogeneous features in one batched pass
+    fuse_hetero_streams: bool = False
+    # Sparse attention only: neighbour hops (1 or 2) and whether tokens also attend to their own node at every timestep
+    sparse_attention_hops: int = 2
+    sparse_attention_temporal_self: bool = True
+    # Self and GHCA math path only: attend blocks of queries, of a fixed size or sized to a memory budget in MiB
+    attention_query_chunk_size: int | None = None
+    attention_chunk_memory_mb: float | None = None
     # Feature parameters
     use_spherical_harmonics: bool
+    # Compute the spherical harmonics bias once per forward from the initial coordinates and share it across timesteps and layers
+    share_spherical_harmonics_bias: bool = False
+    # Declare that x_0, v_0 and the concatenated features repeat over time, so they are lifted and projected once per node
+    time_invariant_inputs: bool = False
+    # GHCA only: compute every layer's keys and values of the v_0 and concatenated-feature streams in one matmul
+    precompute_static_kv: bool = False
     equivariant_lifting_type: EquivariantLiftingType
     # Layer parameters
     norm: NormType
@@ -252,6 +331,46 @@ class ATOMConfig(BaseModel):
             raise ValueError("'rope_base' must be greater than 0.0.")
         return self
 
+    @model_validator(mode="after")
+    def validate_linear_attention(self) -> "ATOMConfig":
+        if self.heterogenous_attention_type == AttentionType.LINEAR and self.use_spherical_harmonics:
+            raise ValueError("Linear attention never forms the pairwise scores, so 'use_spherical_harmonics' must be False.")
+        if self.heterogenous_attention_type == AttentionType.LINEAR and self.learnable_attention_denom:
+            raise ValueError("Linear attention has no softmax temperature, so 'learnable_attention_denom' must be False.")
+        return self
+
+    @model_validator(mode="after")
+    def validate_share_spherical_harmonics_bias(self) -> "ATOMConfig":
+        if self.share_spherical_harmonics_bias and not self.use_spherical_harmonics:
+            raise ValueError("'share_spherical_harmonics_bias' requires 'use_spherical_harmonics'.")
+        return self
+
+    @model_validator(mode="after")
+    def validate_sparse_attention_hops(self) -> "ATOMConfig":
+        if self.sparse_attention_hops not in (1, 2):
+            raise ValueError("'sparse_attention_hops' must be 1 or 2, the datasets build one-hop and two-hop edges only.")
+        return self
+
+    @model_validator(mode="after")
+    def validate_query_chunking(self) -> "ATOMConfig":
+        if self.attention_query_chunk_size is None and self.attention_chunk_memory_mb is None:
+            return self
+        if self.attention_query_chunk_size is not None and self.attention_query_chunk_size < 1:
+            raise ValueError("'attention_query_chunk_size' must be greater than 0.")
+        if self.attention_chunk_memory_mb is not None and self.attention_chunk_memory_mb <= 0.0:
+            raise ValueError("'attention_chunk_memory_mb' must be greater than 0.0.")
+        if self.heterogenous_attention_type not in (AttentionType.SELF, AttentionType.GHCA):
+            raise ValueError("Query chunking only applies to self and GHCA attention.")
+        if self.attention_backend != AttentionBackend.MATH or self.fuse_hetero_streams:
+            raise ValueError("Query chunking only applies to the math backend without 'fuse_hetero_streams'.")
+        return self
+
+    @model_validator(mode="after")
+    def validate_precompute_static_kv(self) -> "ATOMConfig":
+        if self.precompute_static_kv and (self.heterogenous_attention_type != AttentionType.GHCA or self.fuse_hetero_streams):
+            raise ValueError("'precompute_static_kv' only applies to GHCA without 'fuse_hetero_streams'.")
+        return self
+
     @model_validator(mode="after")
     def validate_lifting_dim_and_num_heads(self) -> "ATOMConfig":
         if self.lifting_dim % self.num_heads != 0:
@@ -297,6 +416,26 @@ class Config(BaseModel):
             warn("Are you sure you want to use multiple output heads for a single-task model? This is unusual, but maybe you're onto something.")
         return self
 
+    @model_validator(mode="after")
+    def validate_packed_batches(self) -> "Config":
+        if self.dataloader.packed_batches and self.benchmark.model_type != ModelType.ATOM:
+            raise ValueError("'packed_batches' is only supported for ATOM, EGNO needs a padded batch to lay out its edges.")
+        if self.dataloader.packed_batches and self.atom_config.heterogenous_attention_type == AttentionType.SPARSE:
+            raise ValueError("'packed_batches' is not supported with sparse attention, which needs a padded batch to lay out its edges.")
+        return self
+
+    @model_validator(mode="after")
+    def validate_time_invariant_inputs(self) -> "Config":
+        if self.atom_config.time_invariant_inputs and self.training.label_noise_std > 0.0:
+            raise ValueError("'time_invariant_inputs' cannot be used with label noise, which is drawn independently for every timestep.")
+        return self
+
+    @model_validator(mode="after")
+    def validate_checkpoint_policy(self) -> "Config":
+        if self.training.checkpoint_policy == CheckpointPolicy.ATTENTION_ONLY and self.benchmark.model_type != ModelType.ATOM:
+            raise ValueError("'checkpoint_policy' = 'attention_only' is only supported for ATOM, EGNO has no attention to checkpoint.")
+        return self
+
     @classmethod
     def from_toml(cls, path: Path, skip_model_naming: bool = False) -> "Config":
         """
@@ -15,6 +15,12 @@ class SingleRunResults(BaseModel):
     end_time: datetime
     run_time: float | None = None
     seconds_per_epoch: float | None = None
+    # Median wall time of the training steps that did not compile a graph, and peak memory of training: device allocations on CUDA,
+    # growth of the process RSS over its level before the first step on CPU (Linux only)
+    seconds_per_train_step: float | None = None
+    peak_memory_mb: float | None = None
+    # Compilation time of the run with torch.compile: the excess over a typical step of the training and validation steps that compiled a graph
+    compile_seconds: float | None = None
     model_path: Path
 
     @model_validator(mode="after")
@@ -50,6 +56,14 @@ class MultiRunResults(BaseModel):
 
     mean_best_val_loss_epoch: float | None = None
 
+    mean_secs_per_train_step: float | None = None
+    max_peak_memory_mb: float | None = None
+
+    # Compile time of the first run, and the mean over the later runs. The later runs share this process and hit Dynamo's
+    # in-memory caches, so they do not show what compile_cache_dir saves: compare the first runs of separate invocations for that
+    first_run_compile_seconds: float | None = None
+    mean_later_run_compile_seconds: float | None = None
+
     config: Config
 
     @model_validator(mode="after")
@@ -69,6 +83,16 @@ class MultiRunResults(BaseModel):
 
         self.mean_best_val_loss_epoch = sum(result.best_val_loss_epoch for result in self.single_run_results) / len(self.single_run_results)
 
+        step_times = [result.seconds_per_train_step for result in self.single_run_results if result.seconds_per_train_step is not None]
+        self.mean_secs_per_train_step = sum(step_times) / len(step_times) if step_times else None
+        peak_memories = [result.peak_memory_mb for result in self.single_run_results if result.peak_memory_mb is not None]
+        self.max_peak_memory_mb = max(peak_memories, default=None)
+
+        compile_times = [result.compile_seconds for result in self.single_run_results if result.compile_seconds is not None]
+        if compile_times:
+            self.first_run_compile_seconds = compile_times[0]
+            self.mean_later_run_compile_seconds = sum(compile_times[1:]) / len(compile_times[1:]) if len(compile_times) > 1 else None
+
         return self
 
     @model_validator(mode="after")
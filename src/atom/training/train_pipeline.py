@@ -1,5 +1,7 @@
 from datetime import datetime
 from pathlib import Path
+import statistics
+import time
 
 from tensordict import TensorDict
 import torch
@@ -13,15 +15,23 @@ from torch import autocast
 from torch.amp.grad_scaler import GradScaler
 
 from atom.dataloaders.atom_dataloader import MD17DynamicsDataset
+from atom.dataloaders.bucket_sampler import SizeBucketBatchSampler
+from atom.dataloaders.resident_loader import DeviceResidentLoader
 from atom.training import (
     Config,
     SingleRunResults,
     add_brownian_noise,
+    batch_num_samples,
+    broadcast_time_invariant_inputs,
+    compiled_graph_count,
     create_dataloaders_multitask,
     create_dataloaders_single,
     initialize_optimizer,
     initialize_scheduler,
     log_weights,
+    mark_dynamic_dims,
+    peak_memory_mb,
+    reset_peak_memory,
 )
 
 
@@ -46,17 +56,29 @@ def train_model(config: Config, model: nn.Module, benchmark_dir: Path, run_numbe
     best_val_loss_epoch = 0
     scaler = GradScaler(enabled=config.training.use_amp)
 
+    # Measured from here, so that neither the dataset processing nor earlier runs in this process count
+    memory_baseline = reset_peak_memory(config.training.device)
+    # Wall times of the training and validation steps, split by whether torch.compile compiled a graph during the step
+    step_times: list[float] = []
+    compile_step_times: list[float] = []
+    eval_step_times: list[float] = []
+    eval_compile_step_times: list[float] = []
+
     start_training_time = datetime.now()
     progress_bar = tqdm(range(config.training.epochs), desc="Training", leave=False, unit="epoch", position=2)
     for epoch in progress_bar:
-        train_s2t_loss = train_epoch(config, model, optimizer, train_loader, scheduler, scaler)
-        val_s2t_loss, val_s2s_loss = eval_epoch(config, model, val_loader)
+        train_s2t_loss = train_epoch(config, model, optimizer, train_loader, scheduler, scaler, step_times, compile_step_times)
+        val_s2t_loss, val_s2s_loss = eval_epoch(config, model, val_loader, eval_step_times, eval_compile_step_times)
 
         # Log gate parameters and save to weights_dir if provided
         if config.benchmark.log_weights:
             log_weights(list(model.named_parameters()), epoch, save_dir=run_dir)
 
-        wandb.log({"train_s2t_loss": train_s2t_loss, "val_s2t_loss": val_s2t_loss, "lr": optimizer.param_groups[0]["lr"]})
+        epoch_log = {"train_s2t_loss": train_s2t_loss, "val_s2t_loss": val_s2t_loss, "lr": optimizer.param_groups[0]["lr"]}
+        if isinstance(train_loader, DataLoader) and isinstance(train_loader.batch_sampler, SizeBucketBatchSampler) and not config.dataloader.packed_batches:
+            # Real over padded tokens of the epoch's training batches; packed batches have no padding to report
+            epoch_log["train_padding_efficiency"] = train_loader.batch_sampler.padding_efficiency
+        wandb.log(epoch_log)
 
         # if val_loss < best_val_loss and epoch > 0.5 * num_epochs:
         if val_s2t_loss < best_val_loss:
@@ -78,6 +100,15 @@ def train_model(config: Config, model: nn.Module, benchmark_dir: Path, run_numbe
         )
     end_training_time = datetime.now()
 
+    # Peak memory of training, the quantity activation checkpointing trades against step time
+    training_peak_memory_mb = peak_memory_mb(config.training.device, memory_baseline)
+
+    # With torch.compile: the excess over a typical step of every training and validation step that compiled a graph,
+    # which also counts the evaluation graphs and the recompilations for new shapes
+    compile_seconds: float | None = None
+    if config.benchmark.compile:
+        compile_seconds = _compile_overhead(compile_step_times, step_times) + _compile_overhead(eval_compile_step_times, eval_step_times)
+
     # Final evaluation
     _ = model.load_state_dict(torch.load(best_val_model, weights_only=True))
     s2t_test_loss, s2s_test_loss = eval_epoch(config, model, test_loader)
@@ -88,6 +119,9 @@ def train_model(config: Config, model: nn.Module, benchmark_dir: Path, run_numbe
         best_val_loss_epoch=best_val_loss_epoch,
         start_time=start_training_time,
         end_time=end_training_time,
+        seconds_per_train_step=statistics.median(step_times) if step_times else None,
+        peak_memory_mb=training_peak_memory_mb,
+        compile_seconds=compile_seconds,
         model_path=Path(best_val_model),
     )
 
@@ -98,9 +132,11 @@ def train_epoch(
     config: Config,
     model: nn.Module,
     optimizer: optim.Optimizer,
-    dataloader: DataLoader[dict[str, torch.Tensor]] | DataLoader[MD17DynamicsDataset],
+    dataloader: DataLoader[dict[str, torch.Tensor]] | DataLoader[MD17DynamicsDataset] | DeviceResidentLoader,
     scheduler: optim.lr_scheduler._LRScheduler | None,
     scaler: GradScaler,
+    step_times: list[float] | None = None,
+    compile_step_times: list[float] | None = None,
 ) -> float:
     """Single training epoch.
 
@@ -110,6 +146,9 @@ def train_epoch(
         optimizer (optim.Optimizer): The optimizer to use.
         dataloader (DataLoader[dict[str, torch.Tensor]]): The dataloader to use.
         scheduler (optim.lr_scheduler._LRScheduler | None): The scheduler to use.
+        step_times (list[float] | None): If given, the wall time of every training step is appended to it.
+        compile_step_times (list[float] | None): If given, the wall times of the steps during which torch.compile
+            compiled a graph are appended to it instead of to `step_times`.
 
     Returns:
         float: The loss of the epoch.
@@ -118,7 +157,12 @@ def train_epoch(
     total_s2t_loss = 0.0
 
     for batch in dataloader:
-        batch = TensorDict.from_dict(batch, device=torch.device(config.training.device), auto_batch_size=True)
+        step_start = time.perf_counter()
+        graphs_before = compiled_graph_count()
+        if not isinstance(batch, TensorDict):
+            batch = TensorDict.from_dict(batch, device=torch.device(config.training.device), auto_batch_size=True)
+        if config.dataloader.lazy_time_replication:
+            batch = broadcast_time_invariant_inputs(batch, config.dataloader.num_timesteps)
         if config.dataloader.multitask is False:
             assert "padded_nodes_mask" not in batch, "padded_nodes_mask should not exist in batch when multitask is False"
 
@@ -137,6 +181,9 @@ def train_epoch(
                 config.training.label_noise_std,
             )
 
+        if config.benchmark.compile_dynamic:
+            batch = mark_dynamic_dims(batch)
+
         with autocast(device_type=str(config.training.device), dtype=config.training.amp_dtype, enabled=config.training.use_amp):
             pred_coords: torch.Tensor = model(batch)
 
@@ -164,7 +211,7 @@ def train_epoch(
                 else:
                     loss = loss_raw.mean()
 
-        total_s2t_loss += loss.item() * batch.batch_size[0]
+        total_s2t_loss += loss.item() * batch_num_samples(batch)
 
         _ = scaler.scale(loss).backward()
 
@@ -177,13 +224,17 @@ def train_epoch(
         if scheduler and not isinstance(scheduler, optim.lr_scheduler.ReduceLROnPlateau):
             scheduler.step()
 
+        _record_step_time(step_start, graphs_before, step_times, compile_step_times)
+
     return total_s2t_loss / float(len(dataloader.dataset))
 
 
 def eval_epoch(
     config: Config,
     model: nn.Module,
-    loader: DataLoader[dict[str, torch.Tensor]] | DataLoader[MD17DynamicsDataset],
+    loader: DataLoader[dict[str, torch.Tensor]] | DataLoader[MD17DynamicsDataset] | DeviceResidentLoader,
+    step_times: list[float] | None = None,
+    compile_step_times: list[float] | None = None,
 ) -> tuple[float, float]:
     """Evaluation loop.
 
@@ -191,6 +242,9 @@ def eval_epoch(
         config (Config): The configuration file.
         model (nn.Module): The model to evaluate.
         loader (DataLoader[dict[str, torch.Tensor]]): The dataloader to use.
+        step_times (list[float] | None): If given, the wall time of every evaluation step is appended to it.
+        compile_step_times (list[float] | None): If given, the wall times of the steps during which torch.compile
+            compiled a graph are appended to it instead of to `step_times`.
 
     Returns:
         tuple[float, float]: The S2T and S2S loss of the epoch.
@@ -201,10 +255,18 @@ def eval_epoch(
 
     with torch.no_grad():
         for batch in loader:
-            batch: TensorDict = TensorDict.from_dict(batch, device=torch.device(config.training.device), auto_batch_size=True)
+            step_start = time.perf_counter()
+            graphs_before = compiled_graph_count()
+            if not isinstance(batch, TensorDict):
+                # Device-resident loaders already yield TensorDicts on the training device
+                batch = TensorDict.from_dict(batch, device=torch.device(config.training.device), auto_batch_size=True)
+            if config.dataloader.lazy_time_replication:
+                batch = broadcast_time_invariant_inputs(batch, config.dataloader.num_timesteps)
             target_coords: torch.Tensor = batch.pop(key="x_t")
             _ = batch.pop("v_t") if "v_t" in batch else None
             mask: torch.Tensor | None = batch.get("padded_nodes_mask", None)
+            if config.benchmark.compile_dynamic:
+                batch = mark_dynamic_dims(batch)
 
             pred_coords: torch.Tensor = model(batch)
 
@@ -214,7 +276,7 @@ def eval_epoch(
                 pred_heavy_s2t: torch.Tensor = pred_coords[heavy_atom_mask_s2t]  # shape: [Total_selected_nodes, 3]
                 target_heavy_s2t: torch.Tensor = target_coords[heavy_atom_mask_s2t]  # shape: [Total_selected_nodes, 3]
                 s2t_loss = F.mse_loss(pred_heavy_s2t, target_heavy_s2t)
-                total_s2t_loss += s2t_loss.item() * batch.batch_size[0]
+                total_s2t_loss += s2t_loss.item() * batch_num_samples(batch)
 
                 pred_last_t = pred_coords[:, -1, :, :]  # [B, N, 3]
                 target_last_t = target_coords[:, -1, :, :]  # [B, N, 3]
@@ -222,7 +284,7 @@ def eval_epoch(
                 pred_heavy_s2s: torch.Tensor = pred_last_t[heavy_atom_mask_s2s]  # [Total_selected_nodes, 3]
                 target_heavy_s2s: torch.Tensor = target_last_t[heavy_atom_mask_s2s]  # [Total_selected_nodes, 3]
                 s2s_loss = F.mse_loss(pred_heavy_s2s, target_heavy_s2s)
-                total_s2s_loss += s2s_loss.item() * batch.batch_size[0]
+                total_s2s_loss += s2s_loss.item() * batch_num_samples(batch)
             else:
                 # For the full coordinates loss (shape: [batch, 8, 20, 4])
                 loss_raw_s2t = F.mse_loss(pred_coords, target_coords, reduction="none")
@@ -241,7 +303,24 @@ def eval_epoch(
                 else:
                     s2s_loss = loss_raw_s2s.mean()
 
-                total_s2t_loss += s2t_loss.item() * batch.batch_size[0]
-                total_s2s_loss += s2s_loss.item() * batch.batch_size[0]
+                total_s2t_loss += s2t_loss.item() * batch_num_samples(batch)
+                total_s2s_loss += s2s_loss.item() * batch_num_samples(batch)
+
+            _record_step_time(step_start, graphs_before, step_times, compile_step_times)
 
     return total_s2t_loss / len(loader.dataset), total_s2s_loss / len(loader.dataset)
+
+
+def _record_step_time(step_start: float, graphs_before: int, step_times: list[float] | None, compile_step_times: list[float] | None) -> None:
+    """Append the wall time of a step to `compile_step_times` if torch.compile compiled a graph during it, else to `step_times`."""
+    step_time = time.perf_counter() - step_start
+    if compile_step_times is not None and compiled_graph_count() > graphs_before:
+        compile_step_times.append(step_time)
+    elif step_times is not None:
+        step_times.append(step_time)
+
+
+def _compile_overhead(compile_step_times: list[float], step_times: list[float]) -> float:
+    """Time the steps that compiled a graph took beyond the median step that did not."""
+    typical_step = statistics.median(step_times) if step_times else 0.0
+    return sum(step_time - typical_step for step_time in compile_step_times)
@@ -8,6 +8,8 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import wandb
+from tensordict import TensorDict
+from atom.training.config_options import ModelType
 from atom.training.load_config import Config
 
 
@@ -69,12 +71,52 @@ def set_environment_variables(config: Config) -> None:
     Returns:
         None
     """
-    # os.environ["TORCHINDUCTOR_CACHE_DIR"] = "torch_compiler/inductor_cache"
+    if config.benchmark.compile_cache_dir is not None:
+        # Compiled FX graphs, autograd graphs and kernels persist on disk, so only the first compile of a graph is cold
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = str(Path(config.benchmark.compile_cache_dir) / "inductor")
+        os.environ["TRITON_CACHE_DIR"] = str(Path(config.benchmark.compile_cache_dir) / "triton")
+        os.environ["TORCHINDUCTOR_FX_GRAPH_CACHE"] = "1"
+        os.environ["TORCHINDUCTOR_AUTOGRAD_CACHE"] = "1"
+        # The inductor config may already have read the environment when torch was imported
+        import torch._inductor.config as inductor_config
+
+        inductor_config.fx_graph_cache = True
+        inductor_config.autograd_cache = True
     if config.benchmark.compile_trace:
         assert os.access(Path("torch_compiler/trace"), os.W_OK), "Directory trace_dir is not writable."
         os.environ["TORCH_TRACE"] = "torch_compiler/trace"
 
 
+def compile_model(config: Config, model: nn.Module) -> nn.Module:
+    """Compile a model as set by the benchmark config.
+
+    Regional compilation compiles the ATOM blocks (EGNN layers for EGNO) in place. The layers share their code
+    and input shapes, so Dynamo compiles one of them and reuses it for the others instead of tracing every layer
+    of the whole model. The lifting and output layers run eagerly, and state dict keys are unchanged.
+
+    Args:
+        config (Config): The configuration to use.
+        model (nn.Module): The model to compile.
+
+    Returns:
+        nn.Module: The compiled model, or the model itself with compiled layers.
+    """
+    match config.benchmark.model_type:
+        case ModelType.ATOM:
+            layers: nn.Module = model.transformer_blocks
+        case ModelType.EGNO:
+            layers = model.egnn.layers
+        case _:
+            raise ValueError(f"Invalid model type: {config.benchmark.model_type}")
+
+    if not config.benchmark.compile_regional:
+        return torch.compile(model)
+
+    for layer in layers:
+        layer.compile()
+    return model
+
+
 def log_weights(named_parameters: list[tuple[str, torch.Tensor]], epoch: int, save_dir: Path):
     """Log feature weights to wandb and/or save as numpy arrays.
 
@@ -173,6 +215,121 @@ def log_weights(named_parameters: list[tuple[str, torch.Tensor]], epoch: int, sa
         wandb.log({"lambda_v_residual/averaged": wandb.Histogram(averaged_param.tolist())}, step=epoch)
 
 
+# Initial-condition keys that are identical across timesteps and may be shipped without a time axis
+TIME_INVARIANT_KEYS: tuple[str, ...] = ("x_0", "v_0", "concatenated_features", "Z", "nodes", "charges", "padded_nodes_mask")
+
+
+def broadcast_time_invariant_inputs(batch: TensorDict, num_timesteps: int) -> TensorDict:
+    """Broadcast [B, N, d] initial conditions to [B, T, N, d] on the batch's device.
+
+    Used when the datasets are built with replicate_timesteps=False: the time axis is added as an
+    expanded view, so no copies are made on the host, in the workers or in the host-to-device transfer.
+
+    Args:
+        batch (TensorDict): A batch whose time-invariant keys have shape [B, N, d].
+        num_timesteps (int): The number of timesteps T to broadcast to.
+
+    Returns:
+        TensorDict: The batch with time-invariant keys of shape [B, T, N, d].
+    """
+    for key in TIME_INVARIANT_KEYS:
+        if key in batch.keys():
+            value: torch.Tensor = batch[key]
+            batch[key] = value.unsqueeze(1).expand(-1, num_timesteps, *value.shape[1:])
+    return batch
+
+
+def mark_dynamic_dims(batch: TensorDict) -> TensorDict:
+    """Mark the batch and node dims of the [B, T, N, d] model inputs as dynamic for torch.compile.
+
+    Multitask batches change their size and padded node count from batch to batch. Marking these dims up front
+    compiles one graph for all of them, instead of specialising on the first shapes and recompiling.
+
+    Args:
+        batch (TensorDict): A batch whose node-level keys have shape [B, T, N, d].
+
+    Returns:
+        TensorDict: The same batch.
+    """
+    for key in TIME_INVARIANT_KEYS:
+        if key in batch.keys():
+            value: torch.Tensor = batch[key]
+            torch._dynamo.maybe_mark_dynamic(value, 0)
+            torch._dynamo.maybe_mark_dynamic(value, 2)
+    return batch
+
+
+def compiled_graph_count() -> int:
+    """Number of graphs torch.compile has compiled in this process, to tell the steps that compiled apart from the others.
+
+    Returns:
+        int: Dynamo's count of unique compiled graphs.
+    """
+    return torch._dynamo.utils.counters["stats"]["unique_graphs"]
+
+
+def reset_peak_memory(device: torch.device) -> float | None:
+    """Start measuring the peak memory of a training run on a device.
+
+    On CUDA, resets the peak of the device allocations. On CPU, resets the high-water mark of the process RSS
+    (VmHWM, Linux only), which otherwise holds the peak of the dataset processing and of every earlier run.
+
+    Args:
+        device (torch.device): The training device.
+
+    Returns:
+        float | None: The baseline for `peak_memory_mb`: 0 on CUDA, the current RSS in MiB on CPU,
+            or None if the peak cannot be reset.
+    """
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+        return 0.0
+    try:
+        _ = Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        return None
+    return _process_memory_mb("VmRSS")
+
+
+def peak_memory_mb(device: torch.device, baseline: float | None) -> float | None:
+    """Peak memory since `reset_peak_memory`: device allocations on CUDA, growth of the process RSS over the baseline on CPU.
+
+    Args:
+        device (torch.device): The training device.
+        baseline (float | None): The value returned by `reset_peak_memory`.
+
+    Returns:
+        float | None: The peak memory in MiB, or None if it was not measured.
+    """
+    if baseline is None:
+        return None
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    return _process_memory_mb("VmHWM") - baseline
+
+
+def _process_memory_mb(field: str) -> float:
+    """A memory field of /proc/self/status ("VmRSS", "VmHWM", ...) in MiB."""
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith(f"{field}:"):
+            return int(line.split()[1]) / 2**10  # kB
+    raise ValueError(f"{field} not found in /proc/self/status")
+
+
+def batch_num_samples(batch: TensorDict) -> int:
+    """Number of samples in a batch, which for a packed batch is the number of segments in its single row.
+
+    Args:
+        batch (TensorDict): A padded batch, or a packed batch with "cu_seqlens" of shape [1, num_samples + 1].
+
+    Returns:
+        int: The number of samples in the batch.
+    """
+    if "cu_seqlens" in batch.keys():
+        return batch["cu_seqlens"].shape[-1] - 1
+    return batch.batch_size[0]
+
+
 def add_brownian_noise(
     positions: torch.Tensor,
     velocities: torch.Tensor,
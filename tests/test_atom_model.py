@@ -0,0 +1,248 @@
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+import torch
+from tensordict import TensorDict
+from e3nn import o3
+from atom.training import compile_model, mark_dynamic_dims
+from atom.training.config_options import AttentionType, CheckpointPolicy, EquivariantLiftingType, FFNActivation, ModelType, NormType, ValueResidualType
+from atom.atom.atom_model import ATOM, ATOMBlock, get_lifting_dim_irreps
+
+device = "cuda"
+
+
+def _make_atom(**overrides: Any) -> ATOM:
+    """A small GHCA ATOM on the test device, with any constructor argument overridden."""
+    kwargs: dict[str, Any] = dict(
+        lifting_dim=12,
+        norm=NormType.LAYER,
+        activation=FFNActivation.SILU,
+        num_layers=2,
+        num_heads=2,
+        attention_type=AttentionType.GHCA,
+        output_heads=1,
+        delta_update=True,
+        num_timesteps=3,
+        use_rope=True,
+        rope_base=1000.0,
+        use_spherical_harmonics=False,
+        use_equivariant_lifting=EquivariantLiftingType.NONE,
+        rrwp_length=0,
+        value_residual_type=ValueResidualType.NONE,
+        learnable_attention_denom=False,
+    )
+    return ATOM(**(kwargs | overrides)).to(device)
+
+
+def _random_batch(batch_size: int = 2, num_timesteps: int = 3, num_nodes: int = 5, time_invariant: bool = False) -> TensorDict:
+    """Random x_0, v_0 and concatenated features, drawn once per node and expanded along T if `time_invariant`."""
+    shape = (batch_size, 1 if time_invariant else num_timesteps, num_nodes)
+    batch = {
+        "x_0": torch.randn(*shape, 4, device=device),
+        "v_0": torch.randn(*shape, 4, device=device),
+        "concatenated_features": torch.randn(*shape, 9, device=device),
+    }
+    if time_invariant:
+        batch = {key: value.expand(-1, num_timesteps, -1, -1) for key, value in batch.items()}
+    return TensorDict(batch, batch_size=[batch_size])
+
+
+class TestTimeInvariantInputs:
+    @pytest.mark.parametrize("lifting", [EquivariantLiftingType.EQUIVARIANT, EquivariantLiftingType.CHANNELWISE])
+    @pytest.mark.parametrize("time_invariant_inputs", [False, True])
+    def test_expanded_matches_materialised(self, lifting: EquivariantLiftingType, time_invariant_inputs: bool):
+        # Without the flag, the model detects the expanded inputs from their strides
+        model = _make_atom(lifting_dim=14, use_equivariant_lifting=lifting, time_invariant_inputs=time_invariant_inputs).eval()
+        batch = _random_batch(time_invariant=True)
+        mask = torch.arange(5, device=device) < torch.tensor([3, 5], device=device).unsqueeze(-1)
+        batch["padded_nodes_mask"] = mask.view(2, 1, 5, 1).expand(-1, 3, -1, -1)
+
+        with torch.no_grad():
+            expanded = model(batch)
+            materialised = model(batch.contiguous())
+
+        assert torch.allclose(expanded, materialised, atol=1e-5), f"max diff {(expanded - materialised).abs().max()}"
+
+
+class TestPrecomputedStaticKeysValues:
+    @pytest.mark.parametrize("norm", [NormType.LAYER, NormType.RMS])
+    def test_precomputed_matches_per_layer(self, norm: NormType):
+        models = [_make_atom(norm=norm, num_layers=3, precompute_static_kv=precompute).eval() for precompute in (False, True)]
+        with torch.no_grad():
+            for block in models[0].transformer_blocks:  # A non-trivial affine to fold into the projections
+                _ = block.pre_norm.weight.uniform_(0.5, 1.5)
+                if getattr(block.pre_norm, "bias", None) is not None:
+                    _ = block.pre_norm.bias.normal_()
+        _ = models[1].load_state_dict(models[0].state_dict())
+
+        batch = _random_batch(time_invariant=True)
+        for materialise in (False, True):
+            if materialise:
+                batch = batch.contiguous()
+            with torch.no_grad():
+                expected, precomputed = [model(batch) for model in models]
+            assert torch.allclose(expected, precomputed, atol=1e-5), f"max diff {(expected - precomputed).abs().max()}"
+
+
+class TestFusedOutputHeads:
+    def test_loads_per_head_checkpoints(self):
+        lifting_dim, output_heads = 12, 3
+        model = _make_atom(lifting_dim=lifting_dim, num_layers=1, output_heads=output_heads, use_rope=False)
+        # One o3.Linear per head, as checkpoints from before the heads were fused store them
+        per_head = [o3.Linear(get_lifting_dim_irreps(lifting_dim), "1x1o").to(device) for _ in range(output_heads)]
+        state_dict = {key: value for key, value in model.state_dict().items() if not key.startswith("projection_heads.")}
+        for i, head in enumerate(per_head):
+            state_dict.update({f"projection_layers.{i}.{key}": value for key, value in head.state_dict().items()})
+        _ = model.load_state_dict(state_dict)
+
+        features = torch.randn(2, 3, 5, lifting_dim, device=device)
+        with torch.no_grad():
+            fused = model.projection_heads(features).unflatten(-1, (output_heads, 3))
+            expected = torch.stack([head(features) for head in per_head], dim=-2)
+        assert torch.allclose(fused, expected, atol=1e-6), f"max diff {(fused - expected).abs().max()}"
+
+
+class TestPaddedBatches:
+    @pytest.mark.parametrize("lifting", [EquivariantLiftingType.NONE, EquivariantLiftingType.EQUIVARIANT])
+    def test_padding_does_not_change_prediction(self, lifting: EquivariantLiftingType):
+        num_nodes = 4
+        model = _make_atom(lifting_dim=14, output_heads=3, use_equivariant_lifting=lifting).eval()
+        molecule = _random_batch(batch_size=1, num_nodes=num_nodes)
+
+        outputs = []
+        for max_nodes in (5, 8):  # As padded next to two different batchmates
+            padding = _random_batch(batch_size=1, num_nodes=max_nodes - num_nodes)
+            batch = TensorDict({key: torch.cat([molecule[key], padding[key]], dim=2) for key in molecule.keys()}, batch_size=[1])
+            batch["padded_nodes_mask"] = (torch.arange(max_nodes, device=device) < num_nodes).view(1, 1, max_nodes, 1).expand(-1, 3, -1, -1)
+            with torch.no_grad():
+                outputs.append(model(batch)[:, :, :num_nodes])
+
+        assert torch.allclose(outputs[0], outputs[1], atol=1e-5), f"max diff {(outputs[0] - outputs[1]).abs().max()}"
+
+
+class TestFreezeForInference:
+    @pytest.mark.parametrize("lifting", [EquivariantLiftingType.EQUIVARIANT, EquivariantLiftingType.NO_TP])
+    @pytest.mark.parametrize("output_heads", [1, 2])
+    def test_frozen_matches_e3nn(self, lifting: EquivariantLiftingType, output_heads: int):
+        model = _make_atom(lifting_dim=14, output_heads=output_heads, use_equivariant_lifting=lifting).eval()
+        batch = _random_batch()
+
+        with torch.no_grad():
+            expected = model(batch)
+            frozen = model.freeze_for_inference()(batch)
+
+        assert not any(isinstance(module, o3.Linear) for module in model.modules())
+        assert torch.allclose(expected, frozen, atol=1e-5), f"max diff {(expected - frozen).abs().max()}"
+
+
+class TestActivationCheckpointing:
+    @pytest.mark.parametrize("policy", [CheckpointPolicy.EVERY_LAYER, CheckpointPolicy.EVERY_KTH_LAYER, CheckpointPolicy.ATTENTION_ONLY])
+    def test_checkpointed_matches_stored(self, policy: CheckpointPolicy):
+        models = [
+            _make_atom(num_layers=3, use_spherical_harmonics=True, value_residual_type=ValueResidualType.LEARNABLE, checkpoint_policy=checkpoint_policy)
+            for checkpoint_policy in (CheckpointPolicy.NONE, policy)
+        ]
+        _ = models[1].load_state_dict(models[0].state_dict())
+        batch = _random_batch()
+
+        # Dropout draws are replayed in the recomputation, so the forward and the gradients match
+        torch.manual_seed(0)
+        expected = models[0](batch)
+        expected.square().sum().backward()
+        torch.manual_seed(0)
+        checkpointed = models[1](batch)
+        checkpointed.square().sum().backward()
+
+        assert torch.allclose(expected, checkpointed, atol=1e-6)
+        for (name, parameter), checkpointed_parameter in zip(models[0].named_parameters(), models[1].parameters()):
+            if parameter.grad is not None:
+                assert torch.allclose(parameter.grad, checkpointed_parameter.grad, atol=1e-5), f"{name}: max diff {(parameter.grad - checkpointed_parameter.grad).abs().max()}"
+
+
+class TestSharedSphericalHarmonicsBias:
+    @pytest.mark.parametrize("attention_type", [AttentionType.SELF, AttentionType.GHCA, AttentionType.FACTORIZED])
+    def test_shared_bias_trains(self, attention_type: AttentionType):
+        model = _make_atom(attention_type=attention_type, use_spherical_harmonics=True, share_spherical_harmonics_bias=True)
+        assert not any(hasattr(block.attention, "spherical_harmonics") for block in model.transformer_blocks)
+
+        out = model(_random_batch())
+        out.square().sum().backward()
+
+        assert out.shape == (2, 3, 5, 3) and torch.isfinite(out).all()
+        for name, parameter in model.spherical_harmonics.named_parameters():
+            assert parameter.grad is not None and torch.isfinite(parameter.grad).all(), name
+        assert any(parameter.grad.abs().sum() > 0 for parameter in model.spherical_harmonics.parameters())
+
+    @pytest.mark.parametrize("attention_type", [AttentionType.SELF, AttentionType.GHCA, AttentionType.FACTORIZED])
+    @pytest.mark.parametrize("output_heads", [1, 3])
+    @pytest.mark.parametrize("share_bias", [False, True])
+    def test_packed_matches_padded(self, attention_type: AttentionType, output_heads: int, share_bias: bool):
+        # Several output heads also compare the gate, pooled per packed sample and per padded sample
+        num_nodes = [3, 5]
+        model = _make_atom(
+            attention_type=attention_type, output_heads=output_heads, use_spherical_harmonics=share_bias, share_spherical_harmonics_bias=share_bias
+        ).eval()
+        padded = _random_batch(batch_size=2, num_nodes=max(num_nodes))
+        mask = torch.arange(max(num_nodes), device=device) < torch.tensor(num_nodes, device=device).unsqueeze(-1)
+        padded["padded_nodes_mask"] = mask.view(2, 1, -1, 1).expand(-1, 3, -1, -1)
+        # Real nodes of both samples concatenated along the node axis: [1, T, 8, d]
+        packed = TensorDict(
+            {key: torch.cat([padded[key][0, :, : num_nodes[0]], padded[key][1]], dim=1).unsqueeze(0) for key in ("x_0", "v_0", "concatenated_features")},
+            batch_size=[1],
+        )
+        packed["cu_seqlens"] = torch.tensor([[0, num_nodes[0], sum(num_nodes)]], device=device)
+
+        with torch.no_grad():
+            padded_out = model(padded)
+            packed_out = model(packed)
+
+        assert torch.allclose(packed_out[0, :, : num_nodes[0]], padded_out[0, :, : num_nodes[0]], atol=1e-5)
+        assert torch.allclose(packed_out[0, :, num_nodes[0] :], padded_out[1], atol=1e-5)
+
+
+class TestRopeBase:
+    @pytest.mark.parametrize("attention_type", [AttentionType.GHCA, AttentionType.FACTORIZED, AttentionType.SPARSE, AttentionType.LINEAR])
+    def test_block_passes_rope_base(self, attention_type: AttentionType):
+        block = ATOMBlock(
+            lifting_dim=8,
+            norm=NormType.LAYER,
+            activation=FFNActivation.SILU,
+            num_heads=2,
+            attention_type=attention_type,
+            num_timesteps=3,
+            use_rope=True,
+            rope_base=10_000.0,
+            use_spherical_harmonics=False,
+            value_residual_type=ValueResidualType.NONE,
+            learnable_attention_denom=False,
+        )
+        assert block.attention.rope.base == 10_000.0
+
+
+class TestCompileModel:
+    def test_regional_compile_keeps_module_and_state_dict(self):
+        model = _make_atom().cpu()
+        keys = list(model.state_dict().keys())
+        config = SimpleNamespace(benchmark=SimpleNamespace(model_type=ModelType.ATOM, compile_regional=True))
+
+        compiled = compile_model(config, model)
+
+        assert compiled is model
+        assert list(compiled.state_dict().keys()) == keys
+
+    def test_rejects_unknown_model_type(self):
+        config = SimpleNamespace(benchmark=SimpleNamespace(model_type="unknown", compile_regional=True))
+        with pytest.raises(ValueError):
+            _ = compile_model(config, _make_atom().cpu())
+
+    def test_mark_dynamic_dims_keeps_batch(self):
+        batch = _random_batch().cpu()
+        expected = batch.clone()
+
+        marked = mark_dynamic_dims(batch)
+
+        assert marked is batch
+        assert set(marked.keys()) == set(expected.keys())
+        for key in expected.keys():
+            assert torch.equal(marked[key], expected[key]), key
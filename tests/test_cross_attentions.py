@@ -1,5 +1,16 @@
+import pytest
 import torch
-from atom.atom.attentions import TemporalRoPEWithOffset
+from atom.atom.attentions import (
+    FactorizedSpatioTemporalAttention,
+    LinearKernelAttention,
+    QuadraticHeterogenousCrossAttention,
+    QuadraticSelfAttention,
+    SparseNeighbourAttention,
+    TemporalRoPEWithOffset,
+    is_time_invariant,
+    project_tokens,
+    token_neighbour_pairs,
+)
 
 device = "cuda"
 
@@ -107,6 +118,34 @@ class TestTemporalRoPEWithOffsetGroup:
         assert rope_output.shape == expected_rope_output.shape
         assert torch.allclose(rope_output, expected_rope_output, atol=1e-2), f"rope_output: \n{rope_output}, \nexpected_rope_output: \n{expected_rope_output}"
 
+    def test_rope_tables_are_cached_and_follow_the_module(self):
+        num_timesteps, num_nodes = 3, 5
+        rope = TemporalRoPEWithOffset(num_timesteps=num_timesteps, d_head=4, n_heads=2)
+        tensor = torch.randn(2, 2, num_timesteps * num_nodes, 4)  # On the CPU
+
+        rotated = rope(tensor)
+        assert len(rope._tables) == 1
+        assert torch.equal(rope(tensor), rotated)
+        assert torch.equal(rotated[:, :, :num_nodes], tensor[:, :, :num_nodes]), "Timestep 0 must not be rotated"
+        assert torch.allclose(rotated.norm(dim=-1), tensor.norm(dim=-1), atol=1e-5)
+
+        rope = rope.to(torch.float64)
+        assert len(rope._tables) == 0
+        rotated_double = rope(tensor.double())
+        assert rotated_double.dtype == torch.float64
+        assert torch.allclose(rotated_double.float(), rotated, atol=1e-6)
+
+        # Reduced-precision inputs share the float32 tables and are rotated in float32
+        rope = rope.to(torch.float32)
+        rotated_bfloat16 = rope(tensor.bfloat16())
+        assert rotated_bfloat16.dtype == torch.bfloat16
+        assert [cos.dtype for cos, _ in rope._tables.values()] == [torch.float32]
+        assert torch.equal(rotated_bfloat16, rope(tensor.bfloat16().float()).bfloat16())
+
+        learnable_rope = TemporalRoPEWithOffset(num_timesteps=num_timesteps, d_head=4, n_heads=2, learnable_offset=True)
+        learnable_rope(tensor).sum().backward()
+        assert len(learnable_rope._tables) == 0 and learnable_rope.offset.grad is not None
+
     def test_rope_timestep_interleave(self):
         num_timesteps = 3
         num_nodes = 4
@@ -204,3 +243,309 @@ class TestTemporalRoPEWithOffsetGroup:
 
         assert torch.allclose(cos_t, expected_cos_t, atol=1e-3), f"cos_t: \n{cos_t}, \nexpected_cos_t: \n{expected_cos_t}"
         assert torch.allclose(sin_t, expected_sin_t, atol=1e-3), f"sin_t: \n{sin_t}, \nexpected_sin_t: \n{expected_sin_t}"
+
+
+class TestPackedAttention:
+    def test_packed_matches_padded(self):
+        num_timesteps, max_nodes, lifting_dim = 3, 4, 8
+        num_nodes = [2, 4]
+
+        padded = torch.randn(2, num_timesteps, max_nodes, lifting_dim, device=device)
+        mask = (torch.arange(max_nodes, device=device) < torch.tensor(num_nodes, device=device).unsqueeze(-1)).view(2, 1, max_nodes, 1).expand(-1, num_timesteps, -1, -1)
+        # Real nodes of both samples concatenated along the node axis: [1, T, 6, d]
+        packed = torch.cat([padded[0, :, :2], padded[1]], dim=1).unsqueeze(0)
+        segment_ids = torch.tensor([[0, 0, 1, 1, 1, 1]], device=device)
+
+        self_attention = QuadraticSelfAttention(num_heads=2, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True, use_spherical_harmonics=False).to(device).eval()
+        cross_attention = QuadraticHeterogenousCrossAttention(
+            num_hetero_feats=3, lifting_dim=lifting_dim, num_heads=2, num_timesteps=num_timesteps, use_rope=True, rope_base=1000.0, use_spherical_harmonics=False
+        ).to(device).eval()
+
+        with torch.no_grad():
+            padded_outputs = [self_attention(padded, mask), cross_attention(padded, padded, padded, q_data=padded, mask=mask)]
+            packed_outputs = [self_attention(packed, None, segment_ids), cross_attention(packed, packed, packed, q_data=packed, mask=None, segment_ids=segment_ids)]
+
+        for padded_out, packed_out in zip(padded_outputs, packed_outputs):
+            assert torch.allclose(packed_out[0, :, :2], padded_out[0, :, :2], atol=1e-5)
+            assert torch.allclose(packed_out[0, :, 2:], padded_out[1], atol=1e-5)
+
+
+class TestSDPABackend:
+    @pytest.mark.parametrize("use_mask", [False, True])
+    @pytest.mark.parametrize("use_rope", [False, True])
+    @pytest.mark.parametrize("use_spherical_harmonics", [False, True])
+    def test_sdpa_matches_math(self, use_mask: bool, use_rope: bool, use_spherical_harmonics: bool):
+        batch_size, num_timesteps, num_nodes, lifting_dim, num_heads = 2, 3, 5, 12, 2
+        tensor = torch.randn(batch_size, num_timesteps, num_nodes, lifting_dim, device=device)
+        mask = None
+        if use_mask:
+            mask = (torch.arange(num_nodes, device=device) < torch.tensor([3, 5], device=device).unsqueeze(-1)).view(batch_size, 1, num_nodes, 1)
+            mask = mask.expand(-1, num_timesteps, -1, -1)
+
+        for attention_class in (QuadraticSelfAttention, QuadraticHeterogenousCrossAttention):
+            attentions = []
+            for use_sdpa in (False, True):
+                kwargs = dict(num_heads=num_heads, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=use_rope, use_spherical_harmonics=use_spherical_harmonics)
+                if attention_class is QuadraticHeterogenousCrossAttention:
+                    kwargs.update(num_hetero_feats=3, rope_base=1000.0)
+                attentions.append(attention_class(**kwargs, learnable_attention_denom=True, use_sdpa=use_sdpa).to(device).eval())
+            math_attention, sdpa_attention = attentions
+            with torch.no_grad():
+                math_attention.attention_denom.uniform_(1.0, 8.0)  # Distinct per-head denominators
+            _ = sdpa_attention.load_state_dict(math_attention.state_dict())
+
+            with torch.no_grad():
+                if attention_class is QuadraticSelfAttention:
+                    outputs = [attention(tensor, mask) for attention in attentions]
+                else:
+                    outputs = [attention(tensor, tensor, tensor, q_data=tensor, mask=mask) for attention in attentions]
+
+            assert torch.allclose(outputs[0], outputs[1], atol=1e-5), f"{attention_class.__name__}: max diff {(outputs[0] - outputs[1]).abs().max()}"
+
+
+class TestFusedHeteroStreams:
+    @pytest.mark.parametrize("use_sdpa", [False, True])
+    @pytest.mark.parametrize("use_mask", [False, True])
+    def test_fused_matches_loop(self, use_sdpa: bool, use_mask: bool):
+        batch_size, num_timesteps, num_nodes, lifting_dim = 2, 3, 5, 12
+        features = [torch.randn(batch_size, num_timesteps, num_nodes, lifting_dim, device=device) for _ in range(3)]
+        mask = None
+        if use_mask:
+            mask = (torch.arange(num_nodes, device=device) < torch.tensor([3, 5], device=device).unsqueeze(-1)).view(batch_size, 1, num_nodes, 1)
+            mask = mask.expand(-1, num_timesteps, -1, -1)
+
+        attentions = [
+            QuadraticHeterogenousCrossAttention(
+                num_hetero_feats=3,
+                lifting_dim=lifting_dim,
+                num_heads=2,
+                num_timesteps=num_timesteps,
+                use_rope=True,
+                rope_base=1000.0,
+                use_spherical_harmonics=True,
+                use_sdpa=use_sdpa,
+                fuse_hetero_streams=fuse,
+            )
+            .to(device)
+            .eval()
+            for fuse in (False, True)
+        ]
+        _ = attentions[1].load_state_dict(attentions[0].state_dict())
+
+        with torch.no_grad():
+            for v_0 in (features[1], None):  # All streams, and with a missing stream
+                loop_out, fused_out = [attention(features[0], v_0, features[2], q_data=features[2], mask=mask) for attention in attentions]
+                assert torch.allclose(loop_out, fused_out, atol=1e-5), f"max diff {(loop_out - fused_out).abs().max()}"
+
+
+class TestQueryChunkedAttention:
+    @pytest.mark.parametrize("packed", [False, True])
+    def test_chunked_matches_unchunked(self, packed: bool):
+        num_timesteps, num_nodes, lifting_dim = 3, 5, 12
+        if packed:
+            tensor = torch.randn(1, num_timesteps, num_nodes, lifting_dim, device=device)
+            mask, segment_ids = None, torch.tensor([[0, 0, 1, 1, 1]], device=device)
+        else:
+            tensor = torch.randn(2, num_timesteps, num_nodes, lifting_dim, device=device)
+            mask = (torch.arange(num_nodes, device=device) < torch.tensor([3, 5], device=device).unsqueeze(-1)).view(2, 1, num_nodes, 1)
+            mask, segment_ids = mask.expand(-1, num_timesteps, -1, -1), None
+
+        # 4 does not divide T*N = 15, so the last block is smaller; the budget picks a block size of its own
+        for chunking in (dict(query_chunk_size=4), dict(chunk_memory_budget_mb=1e-3)):
+            for attention_class in (QuadraticSelfAttention, QuadraticHeterogenousCrossAttention):
+                kwargs = dict(num_heads=2, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True, use_spherical_harmonics=True)
+                if attention_class is QuadraticHeterogenousCrossAttention:
+                    kwargs.update(num_hetero_feats=3, rope_base=1000.0)
+                attentions = [attention_class(**kwargs).to(device).eval(), attention_class(**kwargs, **chunking).to(device).eval()]
+                _ = attentions[1].load_state_dict(attentions[0].state_dict())
+
+                outputs, grads = [], []
+                for attention in attentions:
+                    inputs = tensor.clone().requires_grad_()
+                    if attention_class is QuadraticSelfAttention:
+                        out = attention(inputs, mask, segment_ids)
+                    else:
+                        out = attention(inputs, inputs, inputs, q_data=inputs, mask=mask, segment_ids=segment_ids)
+                    out.square().sum().backward()
+                    outputs.append(out.detach())
+                    grads.append(inputs.grad)
+
+                assert torch.allclose(outputs[0], outputs[1], atol=1e-5), f"{attention_class.__name__}: max diff {(outputs[0] - outputs[1]).abs().max()}"
+                assert torch.allclose(grads[0], grads[1], atol=1e-4), f"{attention_class.__name__}: max grad diff {(grads[0] - grads[1]).abs().max()}"
+
+
+class TestSharedSphericalHarmonicsBias:
+    @pytest.mark.parametrize("use_sdpa", [False, True])
+    @pytest.mark.parametrize("fuse_hetero_streams", [False, True])
+    def test_node_bias_matches_full_bias(self, use_sdpa: bool, fuse_hetero_streams: bool):
+        batch_size, num_timesteps, num_nodes, lifting_dim = 2, 3, 5, 12
+        tensor = torch.randn(batch_size, num_timesteps, num_nodes, lifting_dim, device=device)
+        # Like the lifted inputs of the first layer, the coordinates are repeated over time
+        tensor[..., :3] = torch.randn(batch_size, 1, num_nodes, 3, device=device)
+        mask = (torch.arange(num_nodes, device=device) < torch.tensor([3, 5], device=device).unsqueeze(-1)).view(batch_size, 1, num_nodes, 1)
+        mask = mask.expand(-1, num_timesteps, -1, -1)
+
+        self_attention = QuadraticSelfAttention(
+            num_heads=2, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True, use_spherical_harmonics=True, use_sdpa=use_sdpa
+        ).to(device).eval()
+        cross_attention = QuadraticHeterogenousCrossAttention(
+            num_hetero_feats=3,
+            lifting_dim=lifting_dim,
+            num_heads=2,
+            num_timesteps=num_timesteps,
+            use_rope=True,
+            rope_base=1000.0,
+            use_spherical_harmonics=True,
+            use_sdpa=use_sdpa,
+            fuse_hetero_streams=fuse_hetero_streams,
+        ).to(device).eval()
+
+        with torch.no_grad():
+            full_bias = self_attention.spherical_harmonics(tensor[..., :3])
+            node_bias = self_attention.spherical_harmonics(tensor[:, :1, :, :3])
+            assert torch.allclose(full_bias, node_bias.repeat(1, 1, num_timesteps, num_timesteps), atol=1e-6)
+
+            # Query chunking only applies to the unfused math path
+            for query_chunk_size in (None,) if use_sdpa or fuse_hetero_streams else (None, 4):
+                self_attention.query_chunk_size = cross_attention.query_chunk_size = query_chunk_size
+                expected = self_attention(tensor, mask)
+                shared = self_attention(tensor, mask, node_bias=self_attention.spherical_harmonics(tensor[:, :1, :, :3]))
+                assert torch.allclose(expected, shared, atol=1e-5), f"max diff {(expected - shared).abs().max()}"
+
+                expected = cross_attention(tensor, tensor, tensor, q_data=tensor, mask=mask)
+                shared = cross_attention(tensor, tensor, tensor, q_data=tensor, mask=mask, node_bias=cross_attention.spherical_harmonics(tensor[:, :1, :, :3]))
+                assert torch.allclose(expected, shared, atol=1e-5), f"max diff {(expected - shared).abs().max()}"
+
+
+class TestTimeInvariantInputs:
+    def test_expanded_matches_materialised(self):
+        batch_size, num_timesteps, num_nodes, lifting_dim = 2, 4, 5, 12
+        per_node = [torch.randn(batch_size, 1, num_nodes, lifting_dim, device=device) for _ in range(3)]
+        expanded = [features.expand(-1, num_timesteps, -1, -1) for features in per_node]
+        materialised = [features.contiguous() for features in expanded]
+        assert is_time_invariant(expanded[0]) and not is_time_invariant(materialised[0])
+
+        self_attention = QuadraticSelfAttention(num_heads=2, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True, use_spherical_harmonics=True).to(device).eval()
+        cross_attention = QuadraticHeterogenousCrossAttention(
+            num_hetero_feats=3, lifting_dim=lifting_dim, num_heads=2, num_timesteps=num_timesteps, use_rope=True, rope_base=1000.0, use_spherical_harmonics=True
+        ).to(device).eval()
+
+        with torch.no_grad():
+            assert torch.allclose(project_tokens(cross_attention.key, expanded[1]), project_tokens(cross_attention.key, materialised[1]), atol=1e-6)
+            outputs = [
+                (self_attention(features[0], None), cross_attention(features[0], features[1], features[2], q_data=features[2], mask=None))
+                for features in (expanded, materialised)
+            ]
+
+        for from_expanded, from_materialised in zip(*outputs):
+            assert torch.allclose(from_expanded, from_materialised, atol=1e-6), f"max diff {(from_expanded - from_materialised).abs().max()}"
+
+
+class TestFactorizedSpatioTemporalAttention:
+    @pytest.mark.parametrize("use_sdpa", [False, True])
+    def test_padding_does_not_change_real_nodes(self, use_sdpa: bool):
+        num_timesteps, num_nodes, max_nodes, lifting_dim = 4, 3, 5, 8
+        attention = FactorizedSpatioTemporalAttention(
+            num_heads=2, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True, use_spherical_harmonics=True, use_sdpa=use_sdpa
+        ).to(device).eval()
+
+        tensor = torch.randn(1, num_timesteps, num_nodes, lifting_dim, device=device)
+        padded = torch.cat([tensor, torch.randn(1, num_timesteps, max_nodes - num_nodes, lifting_dim, device=device)], dim=2)
+        mask = (torch.arange(max_nodes, device=device) < num_nodes).view(1, 1, max_nodes, 1).expand(-1, num_timesteps, -1, -1)
+
+        with torch.no_grad():
+            out = attention(tensor, None)
+            padded_out = attention(padded, mask)
+
+        assert out.shape == tensor.shape
+        assert torch.allclose(padded_out[:, :, :num_nodes], out, atol=1e-5)
+
+    @pytest.mark.parametrize("use_sdpa", [False, True])
+    def test_node_bias_matches_own_bias(self, use_sdpa: bool):
+        batch_size, num_timesteps, num_nodes, lifting_dim = 2, 3, 5, 8
+        tensor = torch.randn(batch_size, num_timesteps, num_nodes, lifting_dim, device=device)
+        tensor[..., :3] = torch.randn(batch_size, 1, num_nodes, 3, device=device)  # Coordinates repeated over time
+        mask = (torch.arange(num_nodes, device=device) < torch.tensor([3, 5], device=device).unsqueeze(-1)).view(batch_size, 1, num_nodes, 1)
+        mask = mask.expand(-1, num_timesteps, -1, -1)
+        attention = FactorizedSpatioTemporalAttention(
+            num_heads=2, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True, use_spherical_harmonics=True, use_sdpa=use_sdpa
+        ).to(device).eval()
+
+        with torch.no_grad():
+            expected = attention(tensor, mask)
+            shared = attention(tensor, mask, node_bias=attention.spherical_harmonics(tensor[:, :1, :, :3]))
+
+        assert torch.allclose(expected, shared, atol=1e-5), f"max diff {(expected - shared).abs().max()}"
+
+
+class TestSparseNeighbourAttention:
+    def test_all_pairs_matches_dense(self):
+        batch_size, num_timesteps, num_nodes, lifting_dim = 2, 3, 4, 8
+        num_tokens = batch_size * num_timesteps * num_nodes
+        tensor = torch.randn(batch_size, num_timesteps, num_nodes, lifting_dim, device=device)
+
+        kwargs = dict(num_heads=2, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True, use_spherical_harmonics=True)
+        dense = QuadraticSelfAttention(**kwargs).to(device).eval()
+        sparse = SparseNeighbourAttention(**kwargs).to(device).eval()
+        _ = sparse.load_state_dict(dense.state_dict())
+
+        # Every token of a sample paired with every token of the same sample
+        sample_tokens = torch.arange(num_tokens, device=device).view(batch_size, -1)
+        query_index = sample_tokens.unsqueeze(-1).expand(-1, -1, sample_tokens.shape[1]).flatten()
+        key_index = sample_tokens.unsqueeze(1).expand(-1, sample_tokens.shape[1], -1).flatten()
+
+        with torch.no_grad():
+            assert torch.allclose(sparse(tensor, (query_index, key_index)), dense(tensor, None), atol=1e-5)
+
+    def test_node_bias_matches_own_bias(self):
+        batch_size, num_timesteps, num_nodes, lifting_dim = 2, 3, 4, 8
+        num_tokens = batch_size * num_timesteps * num_nodes
+        tensor = torch.randn(batch_size, num_timesteps, num_nodes, lifting_dim, device=device)
+        tensor[..., :3] = torch.randn(batch_size, 1, num_nodes, 3, device=device)  # Coordinates repeated over time
+        attention = SparseNeighbourAttention(num_heads=2, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True, use_spherical_harmonics=True).to(device).eval()
+
+        # Every token of a sample paired with every token of the same sample, across timesteps
+        sample_tokens = torch.arange(num_tokens, device=device).view(batch_size, -1)
+        query_index = sample_tokens.unsqueeze(-1).expand(-1, -1, sample_tokens.shape[1]).flatten()
+        key_index = sample_tokens.unsqueeze(1).expand(-1, sample_tokens.shape[1], -1).flatten()
+
+        with torch.no_grad():
+            expected = attention(tensor, (query_index, key_index))
+            shared = attention(tensor, (query_index, key_index), node_bias=attention.spherical_harmonics(tensor[:, :1, :, :3]))
+
+        assert torch.allclose(expected, shared, atol=1e-5), f"max diff {(expected - shared).abs().max()}"
+
+    def test_token_neighbour_pairs(self):
+        # Edges 0 <-> 1 (one hop), 1 <-> 2 (two hops), and one padded edge
+        source = torch.tensor([[0, 1, 1, 2, 0]])
+        target = torch.tensor([[1, 0, 2, 1, 0]])
+        edge_type = torch.tensor([[1.0, 1.0, 2.0, 2.0, 0.0]])
+
+        query_index, key_index = token_neighbour_pairs(source, target, edge_type, num_timesteps=2, num_nodes=3, hops=1, temporal_self=False)
+        pairs = set(zip(query_index.tolist(), key_index.tolist()))
+        assert pairs == {(1, 0), (0, 1), (4, 3), (3, 4)} | {(token, token) for token in range(6)}
+
+        query_index, key_index = token_neighbour_pairs(source, target, edge_type, num_timesteps=2, num_nodes=3, hops=2, temporal_self=True)
+        pairs = set(zip(query_index.tolist(), key_index.tolist()))
+        assert {(2, 1), (5, 4), (0, 3), (3, 0)} <= pairs  # Two-hop neighbours, and the same node at the other timestep
+        assert len(pairs) == 2 * 4 + 6 * 2
+
+
+class TestLinearKernelAttention:
+    def test_packed_matches_padded(self):
+        num_timesteps, max_nodes, lifting_dim = 3, 4, 8
+        attention = LinearKernelAttention(num_heads=2, num_timesteps=num_timesteps, lifting_dim=lifting_dim, use_rope=True).to(device).eval()
+
+        padded = torch.randn(2, num_timesteps, max_nodes, lifting_dim, device=device)
+        mask = (torch.arange(max_nodes, device=device) < torch.tensor([2, 4], device=device).unsqueeze(-1)).view(2, 1, max_nodes, 1).expand(-1, num_timesteps, -1, -1)
+        packed = torch.cat([padded[0, :, :2], padded[1]], dim=1).unsqueeze(0)
+        segment_ids = torch.tensor([[0, 0, 1, 1, 1, 1]], device=device)
+
+        with torch.no_grad():
+            padded_out = attention(padded, mask)
+            packed_out = attention(packed, None, segment_ids)
+            single_out = attention(padded[1:], None)
+
+        assert torch.allclose(packed_out[0, :, :2], padded_out[0, :, :2], atol=1e-5)
+        assert torch.allclose(packed_out[0, :, 2:], padded_out[1], atol=1e-5)
+        assert torch.allclose(single_out[0], padded_out[1], atol=1e-5)
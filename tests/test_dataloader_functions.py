@@ -1,4 +1,5 @@
 import torch
+import numpy as np
 from atom.dataloaders.atom_dataloader import MD17DynamicsDataset, DataPartition, MD17MoleculeType
 from atom.training.config_options import Datasets
 from torch.utils.data import DataLoader
@@ -265,3 +266,221 @@ class TestMD17DynamicsDataset:
             assert torch.all(sample["padded_nodes_mask"][t, actual_nodes:, 0] == False), f"Padded nodes not correctly masked as False at timestep {t}"
 
         print("test_node_masking passed!")
+
+    def test_getitems_matches_per_sample_collate(self):
+        """
+        Test that the batched __getitems__ fetch returns exactly what default_collate builds from per-sample __getitem__ calls.
+        """
+        from torch.utils.data import default_collate
+
+        dataset = MD17DynamicsDataset(
+            partition=DataPartition.train,
+            max_samples=10,
+            delta_frame=3000,
+            num_timesteps=4,
+            data_dir="data/",
+            split_dir="data/",
+            md17_version=Datasets.md17,
+            molecule_type=MD17MoleculeType.benzene,
+            max_nodes=14,
+            return_edge_data=True,
+            egno_mode=True,
+        )
+        indices = [7, 2, 2, 5]
+
+        batched = dataset.__getitems__(indices)
+        per_sample = default_collate([dataset[i] for i in indices])
+
+        assert batched.keys() == per_sample.keys()
+        for key in per_sample:
+            assert batched[key].dtype == per_sample[key].dtype, f"dtype mismatch for key '{key}'"
+            assert torch.equal(batched[key], per_sample[key]), f"Batched fetch differs for key '{key}'"
+
+    def test_resampled_window_matches_fixed_window(self):
+        """
+        Test that a resampled window starting at a fixed window's start frame reproduces that fixed window exactly.
+        """
+        dataset = MD17DynamicsDataset(
+            partition=DataPartition.train,
+            max_samples=10,
+            delta_frame=3000,
+            num_timesteps=4,
+            data_dir="data/",
+            split_dir="data/",
+            md17_version=Datasets.md17,
+            molecule_type=MD17MoleculeType.benzene,
+            max_nodes=14,
+            return_edge_data=False,
+            resample_windows=True,
+        )
+        assert dataset.window_start_frames.shape[0] > dataset.max_samples, "Windows should be drawn from the whole train split"
+        assert np.isin(dataset.split_times, dataset.window_start_frames.numpy()).all()
+
+        # Restrict the draw to the first fixed start frame
+        dataset.window_start_frames = torch.as_tensor(dataset.split_times[:1])
+        batch = dataset.__getitems__([0, 1])
+
+        expected = {
+            "x_0": dataset.replicated_x_0[0],
+            "v_0": dataset.replicated_v_0[0],
+            "concatenated_features": dataset.replicated_concatenated_features[0],
+            "Z": dataset.replicated_z_0[0],
+            "x_t": dataset.x_t[0],
+            "v_t": dataset.v_t[0],
+        }
+        for key, value in expected.items():
+            assert torch.equal(batch[key][1], value), f"Resampled window differs for key '{key}'"
+
+
+class TestEdgeConstruction:
+    def _chain_dataset(self) -> tuple[MD17DynamicsDataset, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        # Four atoms on a line, 1.4 apart: 0-1-2-3 are one-hop neighbours, 0-2 and 1-3 are two-hop
+        x = np.array([[[0.0, 0.0, 0.0], [1.4, 0.0, 0.0], [2.8, 0.0, 0.0], [4.2, 0.0, 0.0]]])
+        z = np.array([6, 7, 8, 6], dtype=np.uint8)
+
+        dataset = MD17DynamicsDataset.__new__(MD17DynamicsDataset)
+        dataset.molecule_type = MD17MoleculeType.benzene
+        dataset.cfg = {"Stick": [(0, 1)]}
+        one_hop, two_hop = dataset._compute_adjacency_matrix(x, 4, 1.6)
+        return dataset, one_hop, two_hop, torch.tensor(z), torch.tensor(x, dtype=torch.float32)
+
+    def test_build_edge_attributes_with_cfg(self):
+        dataset, one_hop, two_hop, z, x_0 = self._chain_dataset()
+
+        edge_attr, (source, target) = dataset._build_edge_attributes_with_cfg(one_hop, two_hop, z, x_0)
+
+        assert source.tolist() == [0, 0, 1, 1, 1, 2, 2, 2, 3, 3]
+        assert target.tolist() == [1, 2, 0, 2, 3, 0, 1, 3, 1, 2]
+        assert source.dtype == target.dtype == torch.long
+        expected_edge_attr = torch.tensor(
+            [
+                [6, 7, 1, 1],
+                [6, 8, 2, 0],
+                [7, 6, 1, 1],
+                [7, 8, 1, 0],
+                [7, 6, 2, 0],
+                [8, 6, 2, 0],
+                [8, 7, 1, 0],
+                [8, 6, 1, 0],
+                [6, 7, 2, 0],
+                [6, 8, 1, 0],
+            ],
+            dtype=torch.float,
+        )
+        assert torch.equal(edge_attr, expected_edge_attr), f"edge_attr: \n{edge_attr}"
+
+    def test_build_edge_attributes_distances(self):
+        dataset, one_hop, two_hop, z, x_0 = self._chain_dataset()
+
+        edge_attr, (source, target) = dataset._build_edge_attributes(one_hop, two_hop, z, x_0)
+
+        expected_distances = (source - target).abs() * 1.4
+        assert torch.allclose(edge_attr[:, 3], expected_distances), f"distances: {edge_attr[:, 3]}"
+        assert torch.equal(edge_attr[:, 2], torch.where((source - target).abs() == 1, 1.0, 2.0))
+
+    def test_sparse_adjacency_matches_dense(self):
+        # Jittered cubic lattice with a C-C like spacing
+        rng = np.random.default_rng(0)
+        grid = np.stack(np.meshgrid(*[np.arange(5)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+        x = (grid * 1.45 + rng.normal(scale=0.05, size=grid.shape))[np.newaxis]
+        num_atoms = grid.shape[0]
+
+        dataset = MD17DynamicsDataset.__new__(MD17DynamicsDataset)
+        dataset.molecule_type = MD17MoleculeType.benzene
+        dataset.num_nodes = num_atoms
+        one_hop, two_hop = dataset._compute_adjacency_matrix(x, num_atoms, 1.6)
+        sparse_one_hop, sparse_two_hop = dataset._compute_sparse_adjacency_matrix(torch.tensor(x[0], dtype=torch.float32), num_atoms, 1.6)
+
+        assert sparse_one_hop.is_sparse and sparse_two_hop.is_sparse
+        assert torch.equal(sparse_one_hop.to_dense(), one_hop)
+        assert torch.equal(sparse_two_hop.to_dense(), two_hop)
+        for dense_pairs, sparse_pairs in zip(dataset._edge_pairs_from_adjacency(one_hop, two_hop), dataset._edge_pairs_from_adjacency(sparse_one_hop, sparse_two_hop)):
+            assert torch.equal(dense_pairs, sparse_pairs)
+        assert torch.allclose(dataset.calculate_rrwp(one_hop), dataset.calculate_rrwp(sparse_one_hop), atol=1e-6)
+
+
+class TestLazyTimeReplication:
+    def test_broadcast_matches_replicated_inputs(self):
+        from tensordict import TensorDict
+        from atom.training.training_utils import broadcast_time_invariant_inputs
+
+        B, T, N = 2, 4, 5
+        x_0 = torch.randn(B, N, 4)
+        mask = torch.ones(B, N, 1, dtype=torch.bool)
+        x_t = torch.randn(B, T, N, 3)
+        batch = TensorDict({"x_0": x_0, "padded_nodes_mask": mask, "x_t": x_t}, batch_size=[B])
+
+        batch = broadcast_time_invariant_inputs(batch, T)
+
+        assert batch["x_0"].shape == (B, T, N, 4)
+        assert batch["padded_nodes_mask"].shape == (B, T, N, 1)
+        assert torch.equal(batch["x_0"], x_0.unsqueeze(1).expand(-1, T, -1, -1).contiguous())
+        assert batch["x_0"].stride(1) == 0, "The time axis should be a broadcast view, not a copy"
+        assert torch.equal(batch["x_t"], x_t), "Time-dependent keys must be left untouched"
+
+
+class TestDeviceResidentLoader:
+    def test_batches_cover_dataset_once(self):
+        from atom.dataloaders.resident_loader import DeviceResidentLoader
+
+        class RangeDataset:
+            def __init__(self, num_samples: int) -> None:
+                self.values = torch.arange(num_samples, dtype=torch.float32).reshape(-1, 1, 1, 1).expand(-1, 2, 3, 1).contiguous()
+
+            def __getitems__(self, indices: list[int]) -> dict[str, torch.Tensor]:
+                index = torch.as_tensor(indices)
+                return {"x_0": self.values[index], "x_t": self.values[index] + 1}
+
+            def __len__(self) -> int:
+                return self.values.shape[0]
+
+        torch.manual_seed(0)
+        loader = DeviceResidentLoader(RangeDataset(10), batch_size=4, shuffle=True, device=torch.device("cpu"))
+        batches = list(loader)
+
+        assert len(loader) == len(batches) == 3
+        assert [batch.batch_size[0] for batch in batches] == [4, 4, 2]
+        seen = torch.cat([batch["x_0"][:, 0, 0, 0] for batch in batches])
+        assert sorted(seen.tolist()) == list(range(10)), "Every sample should appear exactly once per epoch"
+        assert all(torch.equal(batch["x_t"], batch["x_0"] + 1) for batch in batches), "Fields of a sample must stay aligned"
+
+
+class TestSampledTrajectory:
+    def test_matches_full_trajectory(self):
+        from atom.dataloaders.trajectory_store import SampledTrajectory
+
+        rng = np.random.default_rng(0)
+        positions = rng.normal(size=(50, 5, 3))
+        heavy_atom_mask = np.array([True, False, True, True, False])
+        split_times = np.array([30, 3, 17])
+        delta_frame = 8
+
+        # Reference: velocities and hydrogen removal on the full trajectory
+        full_v = (positions[1:] - positions[:-1])[:, heavy_atom_mask]
+        full_x = positions[:-1][:, heavy_atom_mask]
+
+        trajectory = SampledTrajectory(positions, np.concatenate([[0], split_times, split_times + delta_frame]), heavy_atom_mask)
+
+        assert trajectory.x.shape[0] == 7, "Only the referenced frames should be gathered"
+        assert np.array_equal(trajectory.positions(split_times), full_x[split_times])
+        assert np.array_equal(trajectory.velocities(split_times + delta_frame), full_v[split_times + delta_frame])
+        assert np.array_equal(trajectory.positions(np.array([0])), full_x[[0]])
+
+
+class TestSizeBucketBatchSampler:
+    def test_batches_group_sizes_and_report_padding(self):
+        from atom.dataloaders.bucket_sampler import SizeBucketBatchSampler
+
+        sizes = torch.tensor([3, 9, 3, 9, 3, 9, 3, 9])
+        sampler = SizeBucketBatchSampler(sizes, batch_size=4, shuffle=True)
+
+        batches = list(sampler)
+
+        assert len(sampler) == len(batches) == 2
+        assert sorted(index for batch in batches for index in batch) == list(range(8))
+        assert all(len(set(sizes[batch].tolist())) == 1 for batch in batches), "Each batch should hold a single size"
+        assert sampler.padding_efficiency == 1.0
+
+        uneven_sampler = SizeBucketBatchSampler(torch.tensor([2, 4, 4]), batch_size=3, shuffle=False)
+        _ = list(uneven_sampler)
+        assert uneven_sampler.padding_efficiency == 10 / 12
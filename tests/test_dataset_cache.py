@@ -0,0 +1,48 @@
+import os
+import torch
+from pathlib import Path
+from atom.dataloaders.dataset_cache import DatasetCache
+
+
+class TestDatasetCache:
+    def test_make_key_depends_on_every_parameter(self):
+        params = {"dataset": "md17", "molecule": "aspirin", "delta_frame": 3000, "seed": 100}
+
+        assert DatasetCache.make_key(**params) == DatasetCache.make_key(**dict(reversed(params.items())))
+        for name, value in [("molecule", "benzene"), ("delta_frame", 300), ("seed", 101)]:
+            assert DatasetCache.make_key(**params) != DatasetCache.make_key(**{**params, name: value}), f"Key does not depend on '{name}'"
+
+    def test_save_load_roundtrip(self, tmp_path: Path):
+        cache = DatasetCache(tmp_path)
+        payload = {"x_0": torch.randn(5, 3, 4), "split_times": torch.arange(5), "num_nodes": 3}
+
+        assert cache.load("missing") is None
+        cache.save("entry", payload)
+        loaded = cache.load("entry")
+
+        assert loaded is not None
+        assert torch.equal(loaded["x_0"], payload["x_0"])
+        assert torch.equal(loaded["split_times"], payload["split_times"])
+        assert loaded["num_nodes"] == 3
+
+        cache.invalidate("entry")
+        assert cache.load("entry") is None
+
+    def test_corrupted_entry_is_a_miss(self, tmp_path: Path):
+        cache = DatasetCache(tmp_path)
+        (tmp_path / "broken.pt").write_bytes(b"not a torch file")
+
+        assert cache.load("broken") is None
+        assert not (tmp_path / "broken.pt").exists()
+
+    def test_evicts_least_recently_used(self, tmp_path: Path):
+        entry_bytes = 4 * 256 * 1024  # 1 MiB of float32
+        cache = DatasetCache(tmp_path, max_size_gb=2.5 * entry_bytes / 1024**3)
+
+        for i, key in enumerate(["oldest", "middle"]):
+            cache.save(key, {"x": torch.zeros(256 * 1024)})
+            os.utime(tmp_path / f"{key}.pt", (i, i))  # Deterministic recency ordering
+        _ = cache.load("oldest")  # Touching an entry makes it the most recently used
+        cache.save("newest", {"x": torch.zeros(256 * 1024)})
+
+        assert sorted(path.stem for path in tmp_path.glob("*.pt")) == ["newest", "oldest"]
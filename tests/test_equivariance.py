@@ -11,6 +11,7 @@ from e3nn import o3
 
 from atom.training import Config, initialize_model, create_dataloaders_single, create_dataloaders_multitask
 from atom.inference.inference_utils import clean_state_dict_prefixes
+from atom.atom.atom_model import channelwise_tensor_product, get_lifting_dim_irreps
 
 
 def parse_args() -> argparse.Namespace:
@@ -239,6 +240,25 @@ def test_e3nn_linear_equivariance() -> None:
     print("E3NN linear layer test passed. The layer is equivariant to 3D rotations.")
 
 
+@pytest.mark.parametrize("lifting_dim", [64, 128])
+def test_channelwise_tensor_product_equivariance(lifting_dim: int) -> None:
+    """Tests that the channel-wise lifting tensor product is equivariant to rotations and inversion."""
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    irreps = o3.Irreps(get_lifting_dim_irreps(lifting_dim))
+    product = channelwise_tensor_product(str(irreps)).to(device)
+
+    x, y = torch.randn(2, 2, 1, 5, irreps.dim, device=device)
+    # Improper rotation, so that the parity of the vectors is checked as well
+    rotation = -torch.tensor(R.random().as_matrix(), dtype=x.dtype, device=device)
+    D = irreps.D_from_matrix(rotation.cpu()).to(device)
+
+    with torch.no_grad():
+        rotated_output = product(x @ D.T, y @ D.T)
+        expected_rotated_output = product(x, y) @ D.T
+
+    assert torch.allclose(rotated_output, expected_rotated_output, atol=1e-5), "Channel-wise tensor product output did not transform as its inputs."
+
+
 if __name__ == "__main__":
     # When running this file directly, use pytest to run the test
     args = parse_args()